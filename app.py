@@ -1,35 +1,63 @@
 import os,json,datetime
+import base64
+import functools
 from typing import Any, Dict, List
 import uuid
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, Request,HTTPException
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
-from src.utils.logger_factory import LoggerFactory
-from src.statics import MODEL_NAME, STATICS, HTML_TEMPLATE
-from src.models import ResponseBody, APIResponse,QueryRequest
-from src.utils.api_helpers import initialize_chat_model,verify_api_key, is_trading_related_query, clean_external_references
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from src.utils.logger_factory import LoggerFactory, close_log_sinks
+from src.statics import MODEL_NAME, STATICS, PORTFOLIO_REQUEST_TOPIC, PORTFOLIO_RESPONSE_TOPIC
+from src.models import ResponseBody, APIResponse,QueryRequest, PortfolioBatchRequest
+from src.utils.api_helpers import initialize_chat_model,verify_api_key, classify_query, clean_external_references, current_date_message, open_llm_clients, close_llm_clients
 from src.utils import api_helpers
 from src.tools import financial_api
-import plotly,asyncio
-from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
-import time
+from src.utils import kafka_rpc
+from src.utils.session_store import CACHEABLE_TOOLS, load_session, save_session, close_session_store
+from src.utils.response_cache import response_cache
+from src.utils.metrics import metrics
+from src.utils.tool_compaction import TokenBudget, fit_tool_result
+from src.utils.tokens import usage_tokens
+from src.utils import llm_admission
+from src.utils.loop_monitor import loop_monitor, start_loop_monitor, stop_loop_monitor
+from src.utils import profiler
+from src.utils.profiler import ProfilerBusyError, RequestProfilerMiddleware, profiled
+from src.utils.concurrency_limit import ConcurrencyLimitMiddleware
+from src.utils import json_codec
+from src.utils.json_codec import FastJSONResponse
+from src.utils.compression import CompressionMiddleware
+from src.utils.etag import conditional_response
+from src.utils import plot_renderer
+from src.utils import image_renderer
+from src.utils.image_renderer import ImageRenderError
+from src.utils.price_store import PRICE_HISTORY_DEFAULT_DAYS, PRICE_PLOT_MAX_POINTS, PriceStoreError, price_store, summarize_history, to_epoch_seconds
+from src.utils.plot_patch import PlotPatchError, summarize_figure, update_figure
+from src.utils.call_policy import RequestDeadline, STAGE_MAIN, invoke_with_policy
+from src.utils.llm_admission import LLMOverloadedError, PRIORITY_IN_PROGRESS, PRIORITY_INTERACTIVE
+from src.utils.model_router import TIER_SMALL, VERDICT_NO, escalation_reason, route_query
+import asyncio
+from contextlib import asynccontextmanager
 
 plot_cache = {}
 
 async def dynamic_kafka_call(request_topic: str, response_topic: str, request_data: dict, 
-                           bootstrap_servers: str = 'localhost:9092', timeout: int = 10):
+                           bootstrap_servers: str = None, timeout: int = 10):
     """
-    Perform a dynamic async Kafka call with separate request and response topics.
+    Perform an async Kafka request/reply call with separate request and response topics.
     
-    This function creates fresh producer and consumer instances for each call, making it
-    completely stateless and allowing for different topics per request.
+    The call goes through this worker's shared Kafka RPC client, which keeps one
+    producer and one reply-topic consumer open for the lifetime of the worker, so
+    a call costs one produce plus the reply instead of a full connection setup.
     
     Args:
         request_topic (str): The Kafka topic to send the request to
         response_topic (str): The Kafka topic to listen for responses on
         request_data (dict): The data to send in the request
-        bootstrap_servers (str): Kafka bootstrap servers (default: 'localhost:9092')
+        bootstrap_servers (str): Kafka bootstrap servers, only used when the shared client
+            has not been created yet (default: KAFKA_BOOTSTRAP_SERVERS or 'localhost:9092')
         timeout (int): Maximum time to wait for a response in seconds
     
     Returns:
@@ -38,105 +66,39 @@ async def dynamic_kafka_call(request_topic: str, response_topic: str, request_da
     Raises:
         TimeoutError: If no response is received within the timeout period
         Exception: If a Kafka error occurs
-        
-    Why Consumer Groups Matter:
-    - Consumer groups ensure message delivery guarantees and load balancing
-    - Each consumer group gets a copy of every message (broadcast behavior)
-    - Within a group, only one consumer processes each message (load balancing)
-    - Using unique group IDs ensures we get our own copy of responses
-    - Without groups, multiple consumers might compete for the same messages
     """
-    
-    # Generate a unique correlation ID for this specific request
-    correlation_id = str(uuid.uuid4())
-    
-    # Create unique consumer group ID to avoid conflicts with other instances
-    consumer_group_id = f'response-consumer-{correlation_id}'
-    
-    # Initialize producer for sending requests
-    producer = AIOKafkaProducer(
-        bootstrap_servers=bootstrap_servers,
-        value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-        key_serializer=lambda k: k.encode('utf-8') if isinstance(k, str) else k
+    client = kafka_rpc.get_kafka_client(bootstrap_servers)
+    return await client.call(
+        request_topic=request_topic,
+        response_topic=response_topic,
+        request_data=request_data,
+        timeout=timeout
     )
-    
-    # Initialize consumer for receiving responses
-    # Using 'earliest' to catch responses that might arrive before we start polling
-    consumer = AIOKafkaConsumer(
-        response_topic,
-        bootstrap_servers=bootstrap_servers,
-        group_id=consumer_group_id,  # Unique group ensures we get our messages
-        auto_offset_reset='latest',  # Start from latest to avoid old messages
-        value_deserializer=lambda v: json.loads(v.decode('utf-8')),
-        key_deserializer=lambda k: k.decode('utf-8') if k else None,
-        consumer_timeout_ms=1000  # Poll timeout
-    )
-    
-    try:
-        # Start both producer and consumer
-        await producer.start()
-        await consumer.start()
-        
-        print(f"Kafka connections established for correlation_id: {correlation_id}")
-        
-        # Prepare request data with correlation info
-        request_payload = {
-            **request_data,
-            'correlation_id': correlation_id,
-            'response_topic': response_topic,
-            'timestamp': datetime.datetime.now().isoformat()
-        }
-        
-        # Send the request message
-        await producer.send_and_wait(
-            topic=request_topic,
-            key=correlation_id,
-            value=request_payload
-        )
-        
-        print(f"Request sent to topic '{request_topic}' with correlation_id: {correlation_id}")
-        
-        # Poll for response with timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Get messages from the response topic
-                message_batch = await consumer.getmany(timeout_ms=1000)
-                
-                for topic_partition, messages in message_batch.items():
-                    for message in messages:
-                        message_correlation_id = message.key
-                        response_data = message.value
-                        
-                        print(f"Received message with correlation_id: {message_correlation_id}")
-                        
-                        # Check if this response matches our request
-                        if message_correlation_id == correlation_id:
-                            print(f"Found matching response for correlation_id: {correlation_id}")
-                            return response_data
-                        else:
-                            print(f"Ignoring message with different correlation_id: {message_correlation_id}")
-                            
-            except Exception as poll_error:
-                print(f"Error during polling: {poll_error}")
-                continue
-        
-        # If we reach here, we've timed out
-        raise TimeoutError(f"No response received within {timeout} seconds for correlation_id: {correlation_id}")
-        
-    except Exception as e:
-        print(f"Error in Kafka communication: {e}")
-        raise e
-        
-    finally:
-        # Always cleanup resources
-        try:
-            await producer.stop()
-            await consumer.stop()
-            print(f"Kafka connections closed for correlation_id: {correlation_id}")
-        except Exception as cleanup_error:
-            print(f"Error during cleanup: {cleanup_error}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create per-worker shared clients on startup and close them on shutdown.
+
+    Every client a request uses lives here: the OpenAI model clients and their
+    connection pool, the gateway HTTP session, Kafka and the session store, and
+    the log sink, so none is built inside a request and all are closed once the
+    worker has drained.
+    """
+    open_llm_clients()
+    financial_api.gateway_session()
+    await kafka_rpc.start_kafka_client()
+    start_loop_monitor()
+    await run_in_threadpool(image_renderer.start_image_renderers)
+    yield
+    await stop_loop_monitor()
+    await kafka_rpc.stop_kafka_client()
+    await close_session_store()
+    await close_llm_clients()
+    financial_api.close_gateway_session()
+    image_renderer.close_image_renderers()
+    close_log_sinks()
 
 load_dotenv()
 security = HTTPBearer(
@@ -148,8 +110,15 @@ app = FastAPI(
     description="Secure API for InvestmentMarket.ae's AI-powered trading and investment assistant",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
+# Innermost, so request profiles include compression and shed 503s skip it
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestProfilerMiddleware)
+# Added before CORS so CORS stays outermost and shed requests still carry its headers
+app.add_middleware(ConcurrencyLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
@@ -198,11 +167,8 @@ def create_plot(data, plot_type="pie", title="Data Visualization", x_column=None
             height=height, 
             **kwargs
         )
-        plot_html = plotly.io.to_html(plot, include_plotlyjs='cdn',config={'responsive': True, 'scrollZoom': False})
         plot_id = str(uuid.uuid4())
-        plot_html = HTML_TEMPLATE.replace('{plotly_html}', plot_html)
-        plot_cache[plot_id] = plot_html
-        financial_api.plot = plot_html
+        plot_cache[plot_id] = plot_renderer.figure_json(plot)
         return {
             "message": "Plot created successfully",
             "plot_id": plot_id
@@ -215,11 +181,11 @@ def create_plot(data, plot_type="pie", title="Data Visualization", x_column=None
                 "is_console_command": True
             },
             exception=e,
-            extra=json.dumps({
+            extra={
                 "error": str(e), 
                 "plot_type": plot_type, 
                 "title": title
-            })
+            }
         )
         return {
             "message": f"Error creating plot: {str(e)}",
@@ -268,10 +234,8 @@ def create_subplots(data, plot_types, rows=1, cols=2, subplot_titles=None, colum
             annotations=annotations,
             layout_custom=layout_custom
         )
-        plot_html = fig.to_html(include_plotlyjs='cdn',config={'responsive': True, 'scrollZoom': False})
         plot_id = str(uuid.uuid4())
-        plot_html = HTML_TEMPLATE.replace('{plotly_html}', plot_html)
-        plot_cache[plot_id] = plot_html
+        plot_cache[plot_id] = plot_renderer.figure_json(fig)
         
         return {
             "message": "Subplots created successfully",
@@ -285,20 +249,106 @@ def create_subplots(data, plot_types, rows=1, cols=2, subplot_titles=None, colum
                 "is_console_command": True
             },
             exception=e,
-            extra=json.dumps({
+            extra={
                 "error": str(e), 
                 "plot_types": plot_types, 
                 "title": title
-            })
+            }
         )
         return {
             "message": f"Error creating subplots: {str(e)}",
             "error": str(e)
         }
 
+def update_plot(session, plot_id=None, restyle=None, trace_indices=None, relayout=None,
+                add_traces=None, delete_traces=None):
+    """
+    Change a chart created earlier in this request or kept in the session.
+
+    Returns:
+        dict: The plot_id and a plot_patch with the operations the front end applies, or an error
+    """
+    figure = plot_cache.get(plot_id) if plot_id else None
+    if figure is None:
+        stored = session.get_plot(plot_id)
+        if stored is None:
+            return {"error": f"No chart {plot_id} in this conversation, create it with create_plot" if plot_id
+                             else "No chart in this conversation yet, create one with create_plot"}
+        plot_id = plot_id or next(reversed(session.plots))
+        figure = stored["figure"]
+    try:
+        figure, operations = update_figure(
+            figure, restyle=restyle, trace_indices=trace_indices, relayout=relayout,
+            add_traces=add_traces, delete_traces=delete_traces
+        )
+    except (PlotPatchError, KeyError, IndexError, TypeError) as e:
+        return {"error": f"Could not update the chart: {str(e)}"}
+    plot_cache[plot_id] = figure
+    return {
+        "plot_id": plot_id,
+        "plot_patch": {"plot_id": plot_id, "operations": operations}
+    }
+
+def get_price_history(symbols, start=None, end=None, field="close", plot=False, title=None):
+    """
+    Historical prices from the local price store, optionally charted.
+
+    The model gets a summary and a few sampled points per symbol; with plot
+    the full series go from the store's arrays straight into a line chart.
+
+    Returns:
+        dict: The summaries as prices, and a plot_id when plotted, or an error
+    """
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    histories, errors = [], {}
+    for symbol in symbols or []:
+        try:
+            end_s = to_epoch_seconds(end)
+            start_s = to_epoch_seconds(start)
+            if start_s is None:
+                info = price_store.info(symbol)
+                last = end_s if end_s is not None else (info or {}).get("last")
+                start_s = last - PRICE_HISTORY_DEFAULT_DAYS * 86400 if last is not None else None
+            histories.append(price_store.history(symbol, start_s, end_s))
+        except PriceStoreError as e:
+            errors[symbol] = str(e)
+    if not histories:
+        return {
+            "error": "; ".join(errors.values()) or "No symbols given",
+            "available_symbols": price_store.symbols()[:50]
+        }
+    try:
+        response = {"prices": [summarize_history(history, field) for history in histories]}
+    except PriceStoreError as e:
+        return {"error": str(e)}
+    if errors:
+        response["errors"] = errors
+    if plot:
+        series = {}
+        for history in histories:
+            if len(history):
+                thinned = history.downsample(PRICE_PLOT_MAX_POINTS)
+                series[history.symbol] = (thinned.dates(), thinned.column(field))
+        if series:
+            fig = financial_api.create_series_plot(
+                series,
+                title=title or f"{', '.join(series)} {field}",
+                y_title=field.capitalize()
+            )
+            plot_id = str(uuid.uuid4())
+            plot_cache[plot_id] = plot_renderer.figure_json(fig)
+            response["plot_id"] = plot_id
+    return response
+
 def synchronous_kafka_call(request_topic, response_topic, request_data, timeout=10):
     """
-    Perform a synchronous Kafka call by sending a request and waiting for a response.
+    Perform a blocking Kafka call by sending a request and waiting for a response.
+    
+    Meant for synchronous tool functions, which run in the threadpool: the request
+    goes through this worker's shared Kafka RPC client on the event loop and only
+    the calling thread waits. Do not call it from async code, await
+    dynamic_kafka_call instead.
     
     Args:
         request_topic (str): The Kafka topic to send the request to.
@@ -311,52 +361,15 @@ def synchronous_kafka_call(request_topic, response_topic, request_data, timeout=
     
     Raises:
         TimeoutError: If no response is received within the timeout period.
-        Exception: If a Kafka consumer error occurs.
+        KafkaRPCOverloadedError: If the worker's in-flight Kafka request cap is reached.
+        RuntimeError: If called from the event loop thread.
     """
-    # Generate a unique correlation ID for this request
-    correlation_id = str(uuid.uuid4())
-    
-    # Configure and create the producer
-    producer = Producer({'bootstrap.servers': 'localhost:9092'})
-    
-    # Configure and create the consumer
-    consumer = Consumer({
-        'bootstrap.servers': 'localhost:9092',
-        'group.id': f'response-group',  # Unique group per request
-        'auto.offset.reset': 'latest'  # Start from messages produced after subscription
-    })
-    
-    # Subscribe to the response topic before sending the request
-    consumer.subscribe([response_topic])
-    
-    # Send the request with the correlation ID as the key
-    producer.produce(
-        topic=request_topic,
-        key=correlation_id.encode('utf-8'),
-        value=json.dumps(request_data).encode('utf-8')
+    return kafka_rpc.kafka_call(
+        request_topic=request_topic,
+        response_topic=response_topic,
+        request_data=request_data,
+        timeout=timeout
     )
-    producer.flush()  # Ensure the message is sent
-    
-    # Poll for the response
-    start_time = time.time()
-    while True:
-        if time.time() - start_time > timeout:
-            consumer.close()
-            raise TimeoutError("Response timeout exceeded")
-        
-        msg = consumer.poll(timeout=1.0)
-        if msg is None:
-            continue
-        if msg.error():
-            consumer.close()
-            raise Exception(f"Kafka consumer error: {msg.error()}")
-        
-        # Check if the message key matches the correlation ID
-        print("msg.key().decode('utf-8')",msg.key().decode('utf-8'))
-        if msg.key().decode('utf-8') == correlation_id:
-            response = json.loads(msg.value().decode('utf-8'))
-            consumer.close()
-            return response
 
 @app.post("/portfolio")
 async def get_portfolio(user_id: str):
@@ -366,8 +379,8 @@ async def get_portfolio(user_id: str):
         
         # Use the async dynamic_kafka_call with correct topics
         response = await dynamic_kafka_call(
-            request_topic="request-topic",
-            response_topic="request-topic.replay",
+            request_topic=PORTFOLIO_REQUEST_TOPIC,
+            response_topic=PORTFOLIO_RESPONSE_TOPIC,
             request_data={"accountId": user_id, "message": "Hello from FastAPI!"},
             timeout=15
         )
@@ -399,10 +412,72 @@ async def get_portfolio(user_id: str):
         }
 
 
+@app.post("/portfolio/batch")
+async def get_portfolio_batch(request_data: PortfolioBatchRequest):
+    """
+    Fetch many accounts' portfolios over Kafka in one pipelined burst.
+    
+    Up to KAFKA_RPC_MAX_CONCURRENCY requests are outstanding at once and each reply
+    lets the next account's request go out, each account with its own timeout. With
+    stream=true the results are returned as newline-delimited JSON, one line per
+    account in the order replies arrive.
+    """
+    account_ids = request_data.account_ids
+    client = kafka_rpc.get_kafka_client()
+    replies = client.call_many(
+        request_topic=PORTFOLIO_REQUEST_TOPIC,
+        response_topic=PORTFOLIO_RESPONSE_TOPIC,
+        requests=[{"accountId": account_id, "message": "Hello from FastAPI!"} for account_id in account_ids],
+        timeout=request_data.timeout
+    )
+    
+    def account_result(index, response, error):
+        if error is None:
+            return {"status": "success", "user_id": account_ids[index], "kafka_response": response}
+        return {
+            "status": "error",
+            "error_type": "timeout" if isinstance(error, TimeoutError) else "general",
+            "message": str(error),
+            "user_id": account_ids[index]
+        }
+    
+    if request_data.stream:
+        async def stream_results():
+            try:
+                async for index, response, error in replies:
+                    yield json_codec.dumps(account_result(index, response, error)) + b"\n"
+            except Exception as e:
+                yield json_codec.dumps({"status": "error", "error_type": "general", "message": f"Kafka communication failed: {str(e)}"}) + b"\n"
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    results = {}
+    errors = {}
+    try:
+        async for index, response, error in replies:
+            result = account_result(index, response, error)
+            if error is None:
+                results[account_ids[index]] = result["kafka_response"]
+            else:
+                errors[account_ids[index]] = {"error_type": result["error_type"], "message": result["message"]}
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_type": "general",
+            "message": f"Kafka communication failed: {str(e)}"
+        }
+    
+    return {
+        "status": "success" if not errors else ("partial" if results else "error"),
+        "results": results,
+        "errors": errors
+    }
+
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Public endpoint with basic API information"""
-    return {
+    return conditional_response(request, json_codec.dumps({
         "service": "InvestmentMarket.ae Trading Assistant API",
         "version": "1.0.0",
         "description": "Secure API for AI-powered trading and investment assistance",
@@ -410,9 +485,22 @@ async def root():
         "endpoints": {
             "health": "GET /health - Service health check (authenticated)",
             "query": "POST /query - Process trading queries (authenticated)",
+            "metrics": "GET /metrics - Per-worker metrics (authenticated)",
+            "event_loop": "GET /debug/event-loop - Event loop lag and blocking call stacks (authenticated)",
+            "profile": "GET /debug/profile?seconds=N - Sample this worker for N seconds, as collapsed stacks (authenticated)",
+            "portfolio_batch": "POST /portfolio/batch - Fetch many accounts' portfolios over Kafka",
             "docs": "GET /docs - API documentation"
         }
-    }
+    }), "application/json", max_age=300)
+
+@app.get("/plot/{asset}")
+async def get_plot_shell(asset: str, request: Request):
+    """Stylesheet and script shared by every plot page, see PLOT_SHELL_URL"""
+    assets = plot_renderer.shell_assets()
+    if asset not in assets:
+        raise HTTPException(status_code=404, detail="Not found")
+    body, media_type = assets[asset]
+    return conditional_response(request, body, media_type, max_age=plot_renderer.PLOT_SHELL_MAX_AGE)
 
 @app.get("/auth/test",response_model=APIResponse)
 async def test_auth(request: Request, authenticated: bool = Depends(verify_api_key)) -> APIResponse:
@@ -426,12 +514,57 @@ async def test_auth(request: Request, authenticated: bool = Depends(verify_api_k
     )
     request_logger.info("API key authentication test", context={"authenticated": authenticated})
     
-    return APIResponse (
+    return FastJSONResponse(APIResponse(
         statusCode=200,
         headers={"Content-Type": "text/html"},
         body=response_format("API key is valid"),
         html=None
-    )
+    ))
+
+@app.get("/metrics")
+async def get_metrics(authenticated: bool = Depends(verify_api_key)):
+    """Per-worker counters, gauges and latency histograms"""
+    return {
+        "metrics": metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "image_cache": image_renderer.image_cache.stats(),
+        "kafka": kafka_rpc.get_kafka_client().stats(),
+        "llm_admission": llm_admission.admission_stats(),
+        "gateway": financial_api.gateway_breaker.stats(),
+        "event_loop": loop_monitor.stats(include_stacks=False)
+    }
+
+@app.get("/debug/event-loop")
+async def get_event_loop_diagnostics(authenticated: bool = Depends(verify_api_key)):
+    """This worker's event loop lag and the stacks of recent blocking calls"""
+    return loop_monitor.stats()
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def get_worker_profile(seconds: float = 10, authenticated: bool = Depends(verify_api_key)):
+    """
+    Sample every thread of the worker serving this request for the given number of
+    seconds and return collapsed stacks, ready for flamegraph.pl or speedscope.
+    """
+    try:
+        profile = await profiler.profile_worker(seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profile.collapsed(), headers={"X-Profile-Samples": str(profile.samples)})
+
+@app.get("/debug/profile/requests")
+async def get_request_profiles(authenticated: bool = Depends(verify_api_key)):
+    """Recent per-request profiles on this worker, newest first"""
+    return {"profiles": profiler.request_profiles()}
+
+@app.get("/debug/profile/requests/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str, authenticated: bool = Depends(verify_api_key)):
+    """Collapsed stacks of a request profiled through the X-Profile header"""
+    profile = profiler.get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found on this worker")
+    return PlainTextResponse(profile.collapsed(), headers={"X-Profile-Samples": str(profile.samples)})
 
 @app.get("/health")
 async def health(request: Request):
@@ -464,34 +597,74 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "request_id": request_id,
                 "query": request_data.query
-            })
+            }
         )
         
-        if not await is_trading_related_query(request_data.query):
+        deadline = RequestDeadline()
+        session = await load_session(request_data.session_id or str(uuid.uuid4()))
+        
+        # Follow-ups depend on the conversation so only first questions use the shared cache
+        is_first_turn = not session.messages
+        cached_response = response_cache.get(request_data.query) if is_first_turn else None
+        if cached_response:
+            session.add_turn(request_data.query, cached_response.body[0]['text'])
+            await save_session(session)
+            request_logger.info(
+                "Served query from response cache",
+                context={
+                    "trace_id": str(uuid.uuid4())
+                },
+                extra={
+                    "request_trace_id": request_trace_id,
+                    "request_id": request_id,
+                    "saved_llm_calls": cached_response.llm_calls
+                }
+            )
+            return FastJSONResponse(APIResponse(
+                statusCode=200,
+                headers={"Content-Type": "text/html"},
+                body=cached_response.body,
+                html=None,
+                session_id=session.session_id
+            ))
+        
+        llm_calls = 1  # The classifier below
+        verdict = await classify_query(request_data.query, previous_query=session.last_user_query, deadline=deadline)
+        if verdict == VERDICT_NO:
             apology_message = "I apologize, but I'm InvestmentMarket.ae's specialized trading assistant. I can only help with questions related to investments, trading, portfolio management, cryptocurrency, stock markets, and financial analysis. Please ask me something related to these topics, and I'll be happy to show you how InvestmentMarket.ae can help you achieve your investment goals." 
             
-            return APIResponse(
+            return FastJSONResponse(APIResponse(
                 statusCode=200,
                 headers={"Content-Type": "text/html"},
                 body=response_format(apology_message),
-                html=None
-            )
+                html=None,
+                session_id=session.session_id
+            ))
         
         available_functions = {
             "portfolio_get_data": financial_api.get_portfolio_data,
             "create_plot": create_plot,
-            "create_subplots": create_subplots
+            "create_subplots": create_subplots,
+            "update_plot": functools.partial(update_plot, session)
         }
+        # get_price_history is only offered once the ingestion job has filled the store
+        has_price_history = price_store.has_symbols()
+        if has_price_history:
+            available_functions["get_price_history"] = get_price_history
         
-        llm_with_tools = await initialize_chat_model()
+        route = route_query(request_data.query, verdict, has_history=not is_first_turn)
+        llm_with_tools = await initialize_chat_model(route.model, price_history=has_price_history)
         
         messages = [
             {"role": "system", "content": STATICS['SYSTEM_PROMPT']},
-            {"role": "user", "content": request_data.query}
+            *([{"role": "system", "content": STATICS['PRICE_HISTORY_PROMPT']}] if has_price_history else []),
+            *session.context_messages(),
+            {"role": "user", "content": request_data.query},
+            current_date_message()
         ]
         
         request_logger.info(
@@ -499,10 +672,10 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "query": request_data.query
-            })
+            }
         )
         
         # Initialize variables for the tool calling loop
@@ -514,26 +687,56 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "messages": messages
-            })
+            }
         )
         
-        response = llm_with_tools.invoke(messages)
+        token_budget = TokenBudget()
+        response = await invoke_with_policy(llm_with_tools, messages, route.model, STAGE_MAIN, deadline=deadline, priority=PRIORITY_INTERACTIVE)
+        usage = usage_tokens(response)
+        token_budget.charge(messages, usage)
+        route.record_usage(route.model, usage)
+        llm_calls += 1
+        
+        if route.tier == TIER_SMALL:
+            reason = escalation_reason(response)
+            if reason:
+                request_logger.info(
+                    "Escalating query to the large model",
+                    context={
+                        "trace_id": str(uuid.uuid4())
+                    },
+                    extra={
+                        "request_trace_id": request_trace_id,
+                        "reason": reason
+                    }
+                )
+                route.escalate(reason)
+                llm_with_tools = await initialize_chat_model(route.model, price_history=has_price_history)
+                response = await invoke_with_policy(llm_with_tools, messages, route.model, STAGE_MAIN, deadline=deadline, priority=PRIORITY_IN_PROGRESS)
+                usage = usage_tokens(response)
+                token_budget.charge(messages, usage)
+                route.record_usage(route.model, usage)
+                llm_calls += 1
         
         request_logger.info(
             "LLM Response", 
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "response": response.content
-            })
+            }
         )
         
         plot_id=None
+        # Operations that turn the chart the client already shows into plot_id, when it was not created in this request
+        plot_patch=None
+        created_plot_ids=[]
+        used_personal_tools=False
         final_response=""
         while iteration < max_iterations:
             iteration += 1
@@ -543,10 +746,10 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                 context={
                     "trace_id": str(uuid.uuid4())
                 },
-                extra=json.dumps({
+                extra={
                     "request_trace_id": request_trace_id,
                     "iteration": iteration
-                })
+                }
             )
             
             if not hasattr(response, 'tool_calls') or not response.tool_calls:
@@ -556,14 +759,15 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                     context={
                         "trace_id": str(uuid.uuid4())
                     },
-                    extra=json.dumps({
+                    extra={
                         "request_trace_id": request_trace_id
-                    })
+                    }
                 )
                 break
             
             messages.append(response)
             
+            tool_result_budget = token_budget.tool_result_budget(messages, len(response.tool_calls))
             tool_outputs = []
             for tool_call in response.tool_calls:
                 try:
@@ -575,14 +779,14 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                             context={
                                 "trace_id": str(uuid.uuid4())
                             },
-                            extra=json.dumps({
+                            extra={
                                 "request_trace_id": request_trace_id
-                            })
+                            }
                         )
                         continue
 
                     try:
-                        function_args = json.loads(tool_call['args']) if isinstance(tool_call['args'], str) else tool_call['args']
+                        function_args = json_codec.loads(tool_call['args']) if isinstance(tool_call['args'], str) else tool_call['args']
                     except json.JSONDecodeError as e:
                         request_logger.error(
                             f"Invalid JSON in function args: {str(e)}", 
@@ -590,23 +794,44 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                                 "trace_id": str(uuid.uuid4())
                             },
                             exception=e,
-                            extra=json.dumps({
+                            extra={
                                 "request_trace_id": request_trace_id
-                            })
+                            }
                         )
                         continue
            
                     function_to_call = available_functions[function_name]
-                    function_response = function_to_call(**function_args)
-                    if function_response.get('plot_id'):
+                    used_personal_tools = used_personal_tools or function_name in CACHEABLE_TOOLS
+                    function_response = session.get_tool_result(function_name, function_args) if function_name in CACHEABLE_TOOLS else None
+                    if function_response is None:
+                        # Tools are synchronous and may block on HTTP or Kafka, keep them off the event loop
+                        function_response = await run_in_threadpool(profiled(function_to_call), **function_args)
+                        # Degraded results are not kept, so the next question retries the live data
+                        if function_name in CACHEABLE_TOOLS and not any(function_response.get(k) for k in ('error', 'stale', 'unavailable')):
+                            session.set_tool_result(function_name, function_args, function_response)
+                    if function_response.get('plot_patch'):
+                        patch = function_response['plot_patch']
+                        if patch['plot_id'] in created_plot_ids:
+                            # The client has not seen this chart yet, it gets the whole page
+                            plot_id, plot_patch = patch['plot_id'], None
+                        elif patch['plot_id'] != plot_id:
+                            plot_id, plot_patch = patch['plot_id'], patch
+                        elif plot_patch is not None:
+                            plot_patch['operations'].extend(patch['operations'])
+                        function_response="plot has been updated and will be returned with the final response, you should now just answer the user query."
+                    elif function_response.get('plot_id'):
                         plot_id=function_response['plot_id']
-                        function_response="plot has been created and saved in cache, and will be returned with the final response, you should now just answer the user query."
+                        plot_patch=None
+                        created_plot_ids.append(plot_id)
+                        plot_message="plot has been created and saved in cache, and will be returned with the final response, you should now just answer the user query."
+                        # Price charts come with the summary the answer is written from
+                        function_response={"message": plot_message, "prices": function_response['prices']} if function_response.get('prices') else plot_message
                         print("\n\nHas plot id**\n\n")
                     tool_outputs.append({
                         "tool_call_id": tool_call['id'],
                         "role": "tool",
                         "name": function_name,
-                        "content": json.dumps(function_response)
+                        "content": fit_tool_result(function_name, function_response, tool_result_budget)
                     })
                     
                 except Exception as e:
@@ -616,14 +841,20 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                             "trace_id": str(uuid.uuid4())
                         },
                         exception=e,
-                        extra=json.dumps({
+                        extra={
                             "request_trace_id": request_trace_id
-                        })
+                        }
                     )
 
             messages.extend(tool_outputs)
             try:
-                response = llm_with_tools.invoke(messages)
+                llm_calls += 1
+                response = await invoke_with_policy(llm_with_tools, messages, route.model, STAGE_MAIN, deadline=deadline, priority=PRIORITY_IN_PROGRESS)
+                usage = usage_tokens(response)
+                token_budget.charge(messages, usage)
+                route.record_usage(route.model, usage)
+            except LLMOverloadedError:
+                raise
             except Exception as e:
                 request_logger.error(
                     f"Error getting LLM response: {str(e)}", 
@@ -631,9 +862,9 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                         "trace_id": str(uuid.uuid4())
                     },
                     exception=e,
-                    extra=json.dumps({
+                    extra={
                         "request_trace_id": request_trace_id
-                    })
+                    }
                 )
                 print("Error in LLM response:",str(e))
                 response = response_format(f"Error processing your request after {iteration} iterations: {str(e)}")
@@ -646,30 +877,81 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                 context={
                     "trace_id": str(uuid.uuid4())
                 },
-                extra=json.dumps({
+                extra={
                     "request_trace_id": request_trace_id
-                })
+                }
             )
             final_response = response_format(f"I've reached the maximum number of tool calls ({max_iterations}). Here's what I've found so far:\n\n{response.content[0]['text']}")
        
         if hasattr(response, 'content'):
             response_text = response.content[0]['text']  
-            cleaned_text = await clean_external_references(response_text)
-            final_response = response_format(cleaned_text[1:-1])
+            cleaned_text = await clean_external_references(response_text, deadline=deadline)
+            llm_calls += 1
+            # The cleaner echoes the quotes its prompt puts around the text, but its
+            # fallback on a timeout or error returns the text unquoted
+            if len(cleaned_text) >= 2 and cleaned_text[0] == cleaned_text[-1] == '"':
+                cleaned_text = cleaned_text[1:-1]
+            final_response = response_format(cleaned_text)
             
         request_logger.info(
             "FINAL OUTPUT", 
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "output": final_response
-            })
+            }
         )
         
-        plot_html=  plot_cache[plot_id] if plot_id else None
-        plot_cache.pop(plot_id, None)
+        plot_html=None
+        plot_image=None
+        figure = plot_cache.pop(plot_id, None) if plot_id else None
+        # Charts created or updated along the way but not returned
+        for other_plot_id in (*created_plot_ids, *session.plots):
+            plot_cache.pop(other_plot_id, None)
+        if figure is not None:
+            session.save_plot(plot_id, figure, summarize_figure(json_codec.loads(figure)))
+            if request_data.image_format:
+                try:
+                    image, image_key = await run_in_threadpool(
+                        profiled(image_renderer.render_image), figure, request_data.image_format
+                    )
+                    plot_image = {
+                        "format": request_data.image_format,
+                        "media_type": image_renderer.IMAGE_MEDIA_TYPES[request_data.image_format],
+                        "data": base64.b64encode(image).decode("ascii"),
+                        "key": image_key
+                    }
+                    plot_patch = None
+                except ImageRenderError as e:
+                    # The chart still goes out, as the HTML page
+                    request_logger.warning(
+                        "Chart image rendering failed, returning HTML",
+                        context={
+                            "trace_id": str(uuid.uuid4())
+                        },
+                        extra={
+                            "request_trace_id": request_trace_id,
+                            "image_format": request_data.image_format,
+                            "error": str(e)
+                        }
+                    )
+            if plot_image is None and (plot_patch is None or not request_data.plot_patches):
+                plot_html = plot_renderer.render_page(figure)
+                plot_patch = None
+        else:
+            plot_id, plot_patch = None, None
+        
+        answer_text = final_response[0]['text'] if isinstance(final_response, list) and final_response else str(final_response)
+        session.add_turn(request_data.query, answer_text)
+        await save_session(session)
+        
+        if is_first_turn and not plot_id and not used_personal_tools and isinstance(final_response, list):
+            response_cache.put(request_data.query, final_response, llm_calls)
+        metrics.incr("query_llm_calls", llm_calls)
+        token_usage = token_budget.report()
+        model_route = route.report()
         
         # Calculate and log the total processing time
         end_time = datetime.datetime.now()
@@ -680,19 +962,50 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
             context={
                 "trace_id": str(uuid.uuid4())
             },
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "request_id": request_id,
                 "processing_duration_seconds": processing_duration,
-                "response_type": "trading_response"
-            })
+                "response_type": "trading_response",
+                "token_usage": token_usage,
+                "model_route": model_route
+            }
         )
         
-        return APIResponse(
+        return FastJSONResponse(APIResponse(
             statusCode=200,
             headers={"Content-Type": "text/html"},
             body=final_response,
-            html=plot_html
+            html=plot_html,
+            plot_id=plot_id,
+            plot_patch=plot_patch,
+            image=plot_image,
+            session_id=session.session_id
+        ))
+    
+    except LLMOverloadedError as e:
+        # Shed load with a real 429 so clients and load balancers back off
+        request_logger.warning(
+            "Query shed, LLM capacity exhausted",
+            context={
+                "trace_id": str(uuid.uuid4())
+            },
+            extra={
+                "request_trace_id": request_trace_id,
+                "request_id": request_id,
+                "retry_after": e.retry_after
+            }
+        )
+        return FastJSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(max(int(e.retry_after + 0.999), 1))},
+            content=APIResponse(
+                statusCode=429,
+                headers={'Content-Type': 'text/html'},
+                body=response_format("The assistant is handling too many requests right now, please try again in a moment."),
+                html=None,
+                session_id=request_data.session_id
+            )
         )
     
     except Exception as e:
@@ -704,21 +1017,22 @@ async def process_query(request_data: QueryRequest, request: Request, authentica
                 "trace_id": str(uuid.uuid4())
             },
             exception=e,
-            extra=json.dumps({
+            extra={
                 "request_trace_id": request_trace_id,
                 "request_id": request_id,
                 "traceback": traceback_str
-            })
+            }
         )
         
         error_message = response_format(str(e))
         
-        return APIResponse(
+        return FastJSONResponse(APIResponse(
             statusCode=500,
             headers={'Content-Type': 'text/html'},
             body=error_message,
-            html=None
-        )
+            html=None,
+            session_id=request_data.session_id
+        ))
 
 def response_format(simple_text: str) -> List[Dict[str, Any]]:
     """Create a standardized response body using Pydantic model"""
@@ -0,0 +1,82 @@
+"""
+Event-loop blocking check for the request path.
+
+Runs the service against the local fakes with the loop monitor capturing
+stacks, drives /query (general, portfolio and chart questions) and /portfolio
+for a few seconds, and fails if any callback blocked the loop for longer than
+LOOP_BLOCK_THRESHOLD_SECONDS, printing the culprit and stack of each block.
+Garbage collection pauses are reported but do not fail the check.
+This is what catches a sync invoke, http.client call or plot render creeping
+back into process_query. Throughput, latency and loop lag are saved with the
+other benchmark results.
+
+    python -m pytest benchmarks -k event_loop
+"""
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+from benchmarks.load_test import ServiceProcesses, build_parser, parse_mix, percentile, run_load
+
+BLOCK_THRESHOLD = os.getenv("BENCH_LOOP_BLOCK_THRESHOLD_SECONDS", "0.1")
+MIX = "query=2,portfolio=2,plot=1,kafka=1"
+
+
+@pytest.fixture(scope="module")
+def service():
+    args = build_parser().parse_args([
+        "--workers", "1", "--port", "9110", "--openai-port", "9111", "--gateway-port", "9112",
+        "--llm-latency", "0.05", "--gateway-latency", "0.02",
+    ])
+    overrides = {"LOOP_MONITOR_CAPTURE_STACKS": "true", "LOOP_BLOCK_THRESHOLD_SECONDS": BLOCK_THRESHOLD}
+    previous = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    processes = ServiceProcesses(args)
+    processes.start()
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        # Warm up first, so one-off work on the first requests (lazy imports, client setup) is not counted
+        asyncio.run(run_load(url, args.api_key, parse_mix(MIX), concurrency=4, duration=2, warmup=0))
+        yield url, args
+    finally:
+        processes.stop()
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_process_query_does_not_block_event_loop(benchmark, service):
+    url, args = service
+    measured_from = time.time()
+    results, workers, elapsed = benchmark.pedantic(
+        lambda: asyncio.run(run_load(url, args.api_key, parse_mix(MIX), concurrency=16, duration=5, warmup=0)),
+        rounds=1
+    )
+
+    diagnostics = httpx.get(
+        f"{url}/debug/event-loop", headers={"Authorization": f"Bearer {args.api_key}"}
+    ).json()
+    blocks = [block for block in diagnostics["recent_blocks"] if block["at"] >= measured_from]
+    gc_pauses = [block for block in blocks if block["gc_generation"] is not None]
+    blocking_calls = [block for block in blocks if block["gc_generation"] is None]
+    samples = [sample for scenario in results.values() for sample in scenario]
+    latencies = sorted(latency for latency, _ in samples)
+    benchmark.extra_info.update(
+        requests=len(samples),
+        rps=round(len(samples) / elapsed, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+        loop_lag=diagnostics["lag"],
+        blocking_calls=len(blocking_calls),
+        gc_pauses=len(gc_pauses),
+    )
+
+    assert samples and all(ok for _, ok in samples), "requests failed during the run"
+    assert not blocking_calls, "the event loop was blocked:\n" + "\n\n".join(
+        f"{block['blocked_seconds'] * 1000:.0f}ms in {block['culprit']}\n  " + "\n  ".join(block["stack"] or [])
+        for block in blocking_calls
+    )
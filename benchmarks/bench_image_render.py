@@ -0,0 +1,100 @@
+"""
+Chart image rendering for the image_format response mode.
+
+    spawn    a fresh kaleido renderer per image, what calling plotly's
+             to_image from a new process costs: Chromium starts every time
+    pooled   image_renderer's long-lived renderer, cache bypassed
+    cached   a repeated chart, served from the content-addressed cache
+
+test_render_throughput renders distinct charts from as many threads as the
+pool has renderers and records images per second in extra_info.
+
+Needs kaleido (pip install kaleido==0.2.1); skipped without it.
+
+    python -m pytest benchmarks -k image_render
+"""
+import concurrent.futures
+
+import pytest
+
+pytest.importorskip("kaleido")
+
+from kaleido.scopes.plotly import PlotlyScope
+
+from benchmarks.bench_plots import make_records, plot_args
+from src.tools import financial_api
+from src.utils import image_renderer, plot_renderer
+
+PLOT_TYPES = ("pie", "bar", "line")
+SIZES = (10, 1_000)
+FORMATS = ("png", "svg")
+POOL_SIZES = (1, 2, 4)
+THROUGHPUT_IMAGES = 24
+
+
+def figure_for(plot_type: str, points: int, seed: int = 7) -> str:
+    fig = financial_api.create_plot(make_records(points, seed), plot_type=plot_type, **plot_args(plot_type))
+    return plot_renderer.figure_json(fig)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = image_renderer.RendererPool(size=max(POOL_SIZES))
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def render_spawned(figure: str, image_format: str) -> bytes:
+    scope = PlotlyScope(plotlyjs=image_renderer._PLOTLY_JS, mathjax=False)
+    try:
+        return scope.transform(plot_renderer.full_figure(figure), format=image_format)
+    finally:
+        image_renderer._shutdown(scope)
+
+
+@pytest.mark.parametrize("image_format", FORMATS)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_render_image_spawn(benchmark, plot_type, image_format):
+    figure = figure_for(plot_type, 10)
+    benchmark.group = f"image {plot_type} 10 {image_format}"
+    image = benchmark.pedantic(render_spawned, args=(figure, image_format), rounds=3)
+    benchmark.extra_info["image_bytes"] = len(image)
+
+
+@pytest.mark.parametrize("image_format", FORMATS)
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_render_image_pooled(benchmark, pool, plot_type, points, image_format):
+    figure = plot_renderer.full_figure(figure_for(plot_type, points))
+    benchmark.group = f"image {plot_type} {points} {image_format}"
+    image = benchmark.pedantic(pool.render, args=(figure, image_format), rounds=10, warmup_rounds=1)
+    benchmark.extra_info["image_bytes"] = len(image)
+
+
+@pytest.mark.parametrize("image_format", FORMATS)
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_render_image_cached(benchmark, monkeypatch, pool, plot_type, points, image_format):
+    monkeypatch.setattr(image_renderer, "renderer_pool", pool)
+    figure = figure_for(plot_type, points)
+    image_renderer.render_image(figure, image_format)
+    benchmark.group = f"image {plot_type} {points} {image_format}"
+    image, _ = benchmark(image_renderer.render_image, figure, image_format)
+    benchmark.extra_info["image_bytes"] = len(image)
+
+
+@pytest.mark.parametrize("pool_size", POOL_SIZES)
+def test_render_throughput(benchmark, pool, pool_size):
+    """Distinct bar charts, so every image is rendered, from pool_size threads sharing the pool"""
+    figures = [plot_renderer.full_figure(figure_for("bar", 100, seed)) for seed in range(THROUGHPUT_IMAGES)]
+
+    def render_all():
+        with concurrent.futures.ThreadPoolExecutor(pool_size) as executor:
+            return list(executor.map(lambda figure: pool.render(figure, "png"), figures))
+
+    benchmark.group = "image throughput png"
+    benchmark.pedantic(render_all, rounds=3, warmup_rounds=1)
+    # No timings are kept under --benchmark-disable
+    if benchmark.stats:
+        benchmark.extra_info["images_per_second"] = round(THROUGHPUT_IMAGES / benchmark.stats.stats.mean, 1)
@@ -0,0 +1,76 @@
+"""
+Plot page rendering, before and after the templated renderer.
+
+For each chart the create_plot tool attaches to a response, three renderers:
+
+    legacy   to_html(include_plotlyjs='cdn') pasted into the old page template,
+             a full document inside the page's chart div
+    inline   plot_renderer.render_plot_page with the shell inlined (default)
+    shared   the same with PLOT_SHELL_URL set, so the stylesheet, script and
+             template are fetched once from /plot/shell.* and cached
+
+Each case records the page size raw and gzipped (what the compression
+middleware sends) in extra_info.
+
+    python -m pytest benchmarks -k plot_pages
+"""
+import gzip
+
+import plotly.io
+import pytest
+
+from benchmarks.bench_plots import make_records, plot_args, rounds_for
+from src.statics import PLOT_SHELL_CSS
+from src.tools import financial_api
+from src.utils import plot_renderer
+
+PLOT_TYPES = ("pie", "bar", "line")
+SIZES = (10, 1_000, 10_000)
+RENDERERS = ("legacy", "inline", "shared")
+
+# The page every chart was pasted into before the renderer
+LEGACY_TEMPLATE = (
+    '\n<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n'
+    '    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+    f'    <style>\n{PLOT_SHELL_CSS}\n    </style>\n</head>\n<body>\n'
+    '    <div id="chart-container">\n        {plotly_html}\n    </div>\n'
+    "    <script>\n        window.addEventListener('resize', function() {\n"
+    "            Plotly.Plots.resize(document.querySelector('.js-plotly-plot'));\n"
+    "        });\n    </script>\n</body>\n</html>\n"
+)
+
+
+def render_legacy(fig) -> str:
+    plot_html = plotly.io.to_html(fig, include_plotlyjs='cdn', config={'responsive': True, 'scrollZoom': False})
+    return LEGACY_TEMPLATE.replace('{plotly_html}', plot_html)
+
+
+@pytest.fixture
+def renderer(request, monkeypatch):
+    if request.param == "legacy":
+        yield render_legacy
+        return
+    monkeypatch.setattr(plot_renderer, "PLOT_SHELL_URL", "https://api.example.com/plot" if request.param == "shared" else "")
+    plot_renderer._page_parts.cache_clear()
+    yield plot_renderer.render_plot_page
+    plot_renderer._page_parts.cache_clear()
+
+
+@pytest.mark.parametrize("renderer", RENDERERS, indirect=True)
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_render_plot_page(benchmark, plot_type, points, renderer):
+    fig = financial_api.create_plot(make_records(points), plot_type=plot_type, **plot_args(plot_type))
+    benchmark.group = f"plot page {plot_type} {points}"
+    page = benchmark.pedantic(renderer, args=(fig,), rounds=rounds_for(points))
+    body = page.encode("utf-8")
+    benchmark.extra_info["page_bytes"] = len(body)
+    benchmark.extra_info["gzip_bytes"] = len(gzip.compress(body, compresslevel=6))
+
+
+def test_shell_assets_size(benchmark):
+    """What a client downloads once for the shared shell, instead of with every chart"""
+    assets = benchmark(plot_renderer.shell_assets)
+    for name, (body, _) in assets.items():
+        benchmark.extra_info[f"{name}_bytes"] = len(body)
+        benchmark.extra_info[f"{name}_gzip_bytes"] = len(gzip.compress(body, compresslevel=6))
@@ -0,0 +1,148 @@
+"""
+Microbenchmarks for the plot builders in src/tools/financial_api.py.
+
+Covers every plot type create_plot dispatches to, _add_traces_to_subplot for
+every subplot type, and create_subplots on grids from 1x1 to 4x4, from 10 to
+100k points. Each case is timed twice, building the figure and rendering it
+with to_html the way the create_plot and create_subplots tools do, and records
+the HTML size and the peak memory of one build and render in extra_info.
+
+Runs with pytest-benchmark, which saves every run under .benchmarks/ so a later
+run can be compared against it:
+
+    python -m pytest benchmarks -k plot
+    python -m pytest benchmarks -k plot --benchmark-compare --benchmark-compare-fail=median:15%
+"""
+import random
+import tracemalloc
+
+import plotly.io
+import pytest
+from plotly.subplots import make_subplots
+
+from src.tools import financial_api
+
+PLOT_TYPES = ("pie", "bar", "scatter", "line", "histogram")
+SIZES = (10, 1_000, 10_000, 100_000)
+GRIDS = ((1, 1), (2, 2), (3, 3), (4, 4))
+# Points per subplot; a 4x4 grid of 100k-point traces is 1.6M points and only slows the suite down
+GRID_SIZES = (10, 1_000, 10_000)
+HTML_CONFIG = {'responsive': True, 'scrollZoom': False}
+
+
+def rounds_for(points: int) -> int:
+    """Enough rounds for stable small cases without spending minutes on the large ones"""
+    return max(3, min(50, 100_000 // points))
+
+
+def make_records(points: int, seed: int = 7):
+    """Records shaped like what the model passes to create_plot"""
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"Asset {i}",
+            "value": round(rng.uniform(1, 10_000), 2),
+            "category": ("Stocks", "Crypto", "Bonds", "Cash")[i % 4],
+            "x": i,
+            "y": round(rng.gauss(100, 15), 4),
+        }
+        for i in range(points)
+    ]
+
+
+def plot_args(plot_type: str):
+    if plot_type == "pie":
+        return {}
+    if plot_type == "bar":
+        return {"x_column": "name", "y_column": "value"}
+    return {"x_column": "x", "y_column": "y"}
+
+
+def make_traces(points: int, seed: int = 7):
+    """One subplot's traces, shaped like the create_subplots tool input"""
+    rng = random.Random(seed)
+    return {
+        series: {
+            "x": list(range(points)),
+            "y": [round(rng.uniform(-50, 500), 2) for _ in range(points)],
+            "text": [f"{series} {i}" for i in range(points)],
+        }
+        for series in ("Stocks", "Crypto")
+    } | {"xaxis_title": "Day", "yaxis_title": "Value"}
+
+
+def render(fig) -> str:
+    return plotly.io.to_html(fig, include_plotlyjs='cdn', config=HTML_CONFIG)
+
+
+def record_footprint(benchmark, build):
+    """Record the HTML size and the peak memory of one build and render"""
+    tracemalloc.start()
+    try:
+        html = render(build())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["html_bytes"] = len(html)
+    benchmark.extra_info["peak_memory_bytes"] = peak
+
+
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_create_plot_build(benchmark, plot_type, points):
+    records = make_records(points)
+    args = plot_args(plot_type)
+    benchmark.group = f"create_plot build {plot_type}"
+    benchmark.pedantic(
+        lambda: financial_api.create_plot(records, plot_type=plot_type, **args),
+        rounds=rounds_for(points)
+    )
+    record_footprint(benchmark, lambda: financial_api.create_plot(records, plot_type=plot_type, **args))
+
+
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_create_plot_to_html(benchmark, plot_type, points):
+    fig = financial_api.create_plot(make_records(points), plot_type=plot_type, **plot_args(plot_type))
+    benchmark.group = f"create_plot to_html {plot_type}"
+    html = benchmark.pedantic(render, args=(fig,), rounds=rounds_for(points))
+    benchmark.extra_info["html_bytes"] = len(html)
+
+
+@pytest.mark.parametrize("points", SIZES)
+@pytest.mark.parametrize("plot_type", PLOT_TYPES)
+def test_add_traces_to_subplot(benchmark, plot_type, points):
+    traces = make_traces(points)
+    spec = {"type": "domain" if plot_type == "pie" else "xy"}
+    colors = financial_api.PlotHelper.get_default_colors()
+
+    def setup():
+        return (make_subplots(rows=1, cols=1, specs=[[spec]]), traces, plot_type, 1, 1, colors), {}
+
+    benchmark.group = f"_add_traces_to_subplot {plot_type}"
+    benchmark.pedantic(financial_api._add_traces_to_subplot, setup=setup, rounds=rounds_for(points))
+
+
+def grid_case(rows: int, cols: int, points: int):
+    cells = rows * cols
+    data = {str(i + 1): make_traces(points, seed=i) for i in range(cells)}
+    plot_types = [PLOT_TYPES[i % len(PLOT_TYPES)] for i in range(cells)]
+    return dict(data=data, plot_types=plot_types, rows=rows, cols=cols, title="Portfolio overview")
+
+
+@pytest.mark.parametrize("points", GRID_SIZES)
+@pytest.mark.parametrize("grid", GRIDS, ids=lambda grid: f"{grid[0]}x{grid[1]}")
+def test_create_subplots_build(benchmark, grid, points):
+    case = grid_case(*grid, points)
+    benchmark.group = f"create_subplots build {grid[0]}x{grid[1]}"
+    benchmark.pedantic(lambda: financial_api.create_subplots(**case), rounds=rounds_for(points * grid[0] * grid[1]))
+    record_footprint(benchmark, lambda: financial_api.create_subplots(**case))
+
+
+@pytest.mark.parametrize("points", GRID_SIZES)
+@pytest.mark.parametrize("grid", GRIDS, ids=lambda grid: f"{grid[0]}x{grid[1]}")
+def test_create_subplots_to_html(benchmark, grid, points):
+    fig = financial_api.create_subplots(**grid_case(*grid, points))
+    benchmark.group = f"create_subplots to_html {grid[0]}x{grid[1]}"
+    html = benchmark.pedantic(render, args=(fig,), rounds=rounds_for(points * grid[0] * grid[1]))
+    benchmark.extra_info["html_bytes"] = len(html)
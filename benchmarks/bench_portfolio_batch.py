@@ -0,0 +1,89 @@
+"""
+Throughput benchmark for batched portfolio requests over the Kafka RPC client.
+
+Compares one awaited call per account (what N calls to /portfolio cost) with a
+single pipelined burst through KafkaRPCClient.call_many, against the in-process
+Kafka stand-in so no broker is needed.
+
+Usage:
+    python -m benchmarks.bench_portfolio_batch --accounts 200 --latency 0.005
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakes.kafka import LocalBroker, PortfolioResponder
+from src.statics import PORTFOLIO_REQUEST_TOPIC, PORTFOLIO_RESPONSE_TOPIC
+from src.utils.kafka_rpc import KafkaRPCClient
+
+
+async def run(accounts: int, latency: float, network_delay: float, holdings: int, rounds: int, codec: str):
+    broker = LocalBroker(network_delay=network_delay)
+    broker.create_topic(PORTFOLIO_RESPONSE_TOPIC)
+    responder = PortfolioResponder(
+        broker, PORTFOLIO_REQUEST_TOPIC, latency=latency, holdings=holdings, negotiate=codec != "json"
+    )
+    responder.start()
+
+    client = KafkaRPCClient(
+        reply_topics=[PORTFOLIO_RESPONSE_TOPIC],
+        producer_factory=broker.producer_factory,
+        consumer_factory=broker.consumer_factory,
+        codec=codec,
+        max_in_flight=max(accounts, 256)
+    )
+    await client.start()
+    account_ids = [f"acct-{i}" for i in range(accounts)]
+
+    try:
+        sequential = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for account_id in account_ids:
+                await client.call(PORTFOLIO_REQUEST_TOPIC, PORTFOLIO_RESPONSE_TOPIC, {"accountId": account_id}, timeout=5)
+            sequential.append(time.perf_counter() - started)
+
+        batched = []
+        first_reply = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            received = 0
+            async for index, response, error in client.call_many(
+                PORTFOLIO_REQUEST_TOPIC, PORTFOLIO_RESPONSE_TOPIC,
+                [{"accountId": account_id} for account_id in account_ids], timeout=5
+            ):
+                if received == 0:
+                    first_reply.append(time.perf_counter() - started)
+                if error is not None:
+                    raise error
+                received += 1
+            batched.append(time.perf_counter() - started)
+        stats = client.stats()
+    finally:
+        await client.stop()
+        await responder.stop()
+
+    seq, bat = min(sequential), min(batched)
+    print(f"accounts={accounts} service_latency={latency * 1000:.1f}ms network_delay={network_delay * 1000:.2f}ms holdings={holdings}")
+    print(f"  sequential calls : {seq * 1000:9.1f} ms  {accounts / seq:9.1f} accounts/s")
+    print(f"  pipelined burst  : {bat * 1000:9.1f} ms  {accounts / bat:9.1f} accounts/s  (first reply after {min(first_reply) * 1000:.1f} ms)")
+    print(f"  speedup          : {seq / bat:9.1f}x")
+    replies = stats["delivered"]
+    print(f"  reply payload    : {broker.bytes_appended.get(PORTFOLIO_RESPONSE_TOPIC, 0) / max(replies, 1):9.0f} bytes/reply ({stats['codec']})")
+    print(f"  dispatcher stats : {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="Backend service time per request in seconds")
+    parser.add_argument("--network-delay", type=float, default=0.0005, help="Simulated one-way broker delay in seconds")
+    parser.add_argument("--holdings", type=int, default=20, help="Holdings per portfolio reply")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--codec", default="json", help="Request codec; the stand-in replies in the negotiated codec")
+    args = parser.parse_args()
+    asyncio.run(run(args.accounts, args.latency, args.network_delay, args.holdings, args.rounds, args.codec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Price history from the columnar store, against the paths it replaces.
+
+    range query     store.history() (binary search on the mapped timestamp
+                    column) vs. a boolean mask over the whole column, by
+                    rows in the store
+    price chart     a line chart from the store's arrays
+                    (financial_api.create_series_plot) vs. the same prices as
+                    list-of-dict records through create_plot(plot_type='line'),
+                    what the model passed after a web search
+    tool result     bytes and tokens the model reads: get_price_history's
+                    summary vs. the records (in extra_info)
+
+    python -m pytest benchmarks -k price_history
+"""
+import numpy as np
+import pytest
+
+from src.tools import financial_api
+from src.utils import json_codec, plot_renderer
+from src.utils.price_store import PRICE_PLOT_MAX_POINTS, PriceStore, summarize_history
+from src.utils.tokens import count_tokens
+
+STORE_ROWS = (1_000, 100_000, 2_000_000)
+# One year of daily closes, ten years of daily closes, a year of minute bars on one exchange
+CHART_BARS = (252, 2_520, 98_280)
+START = 1_500_000_000
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    store = PriceStore(str(tmp_path_factory.mktemp("prices")))
+    rng = np.random.default_rng(7)
+    for rows in STORE_ROWS:
+        timestamps = START + np.arange(rows, dtype=np.int64) * 60
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+        store.write(f"SYM{rows}", timestamps, {"open": close, "high": close * 1.001, "low": close * 0.999,
+                                               "close": close, "volume": np.full(rows, 1000.0)})
+    return store
+
+
+def mask_query(store, symbol, start, end):
+    history = store.history(symbol)
+    mask = (history.timestamps >= start) & (history.timestamps <= end)
+    return history.timestamps[mask], history.close[mask]
+
+
+@pytest.mark.parametrize("method", ("index", "mask"))
+@pytest.mark.parametrize("rows", STORE_ROWS)
+def test_range_query(benchmark, store, rows, method):
+    symbol = f"SYM{rows}"
+    # The last tenth of the history, like "the last month"
+    start, end = START + int(rows * 0.9) * 60, START + rows * 60
+    benchmark.group = f"range query {rows} rows"
+    if method == "index":
+        result = benchmark(store.history, symbol, start, end)
+        benchmark.extra_info["bars"] = len(result)
+    else:
+        timestamps, _ = benchmark(mask_query, store, symbol, start, end)
+        benchmark.extra_info["bars"] = len(timestamps)
+
+
+def chart_from_arrays(store, symbol, start, end):
+    history = store.history(symbol, start, end).downsample(PRICE_PLOT_MAX_POINTS)
+    fig = financial_api.create_series_plot({symbol: (history.dates(), history.close)}, title=symbol)
+    return plot_renderer.figure_json(fig)
+
+
+def chart_from_records(records):
+    fig = financial_api.create_plot(records, plot_type="line", title="Price", x_column="date", y_column="close")
+    return plot_renderer.figure_json(fig)
+
+
+def records_for(store, symbol, start, end):
+    history = store.history(symbol, start, end)
+    dates = np.datetime_as_string(history.dates(), unit="m").tolist()
+    return [{"date": date, "close": round(float(close), 4)} for date, close in zip(dates, history.close)]
+
+
+@pytest.mark.parametrize("path", ("arrays", "records"))
+@pytest.mark.parametrize("bars", CHART_BARS)
+def test_price_chart(benchmark, store, bars, path):
+    symbol = f"SYM{STORE_ROWS[-1]}"
+    start = START + 60
+    end = start + (bars - 1) * 60
+    benchmark.group = f"price chart {bars} bars"
+    if path == "arrays":
+        figure = benchmark.pedantic(chart_from_arrays, args=(store, symbol, start, end), rounds=10, warmup_rounds=1)
+        tool_result = json_codec.dumps_str(summarize_history(store.history(symbol, start, end)))
+    else:
+        records = records_for(store, symbol, start, end)
+        figure = benchmark.pedantic(chart_from_records, args=(records,), rounds=3 if bars > 10_000 else 10, warmup_rounds=1)
+        tool_result = json_codec.dumps_str(records)
+    benchmark.extra_info["figure_bytes"] = len(figure)
+    benchmark.extra_info["tool_result_bytes"] = len(tool_result)
+    benchmark.extra_info["tool_result_tokens"] = count_tokens(tool_result)
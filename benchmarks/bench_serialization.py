@@ -0,0 +1,147 @@
+"""
+Serialization cost of one /query request, before and after the JSON backend.
+
+A request decodes a portfolio from the gateway or Kafka, encodes the tool
+result for the model (raw for the size metric, then compacted), emits about a
+dozen log events and renders the APIResponse. Each step is timed on its own
+and all of them together, for two paths:
+
+    legacy   stdlib json, log extras encoded at the call site and again in the
+             logger, FastAPI's response_model round trip (serialize_response)
+             then JSONResponse
+    backend  src/utils/json_codec.py (orjson when installed, see JSON_BACKEND),
+             extras encoded once, FastJSONResponse
+
+Set JSON_BACKEND=json to time the standard library fallback of the backend path.
+
+    python -m pytest benchmarks -k serialization
+"""
+import gzip
+import json
+from types import SimpleNamespace
+
+import plotly.io
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from benchmarks.fakes.gateway import make_holdings
+from src.models import APIResponse
+from src.tools import financial_api
+from src.utils import json_codec
+from src.utils.json_codec import FastJSONResponse
+from src.utils.kafka_codecs import get_codec
+from src.utils.logger_factory import LogLevel, ProtocolAxiomLogger, _encode_events
+from src.utils.tool_compaction import compact_tool_result
+
+HOLDINGS = (10, 100, 1_000)
+PATHS = ("legacy", "backend")
+LOG_EVENTS_PER_REQUEST = 12
+RESPONSE_FIELD = create_model_field(name="Response_query", type_=APIResponse, mode="serialization")
+
+# Stands in for a request logger; _format_protocol_log_data only reads these attributes
+LOG_SELF = SimpleNamespace(
+    default_context={"request_path": "/query", "request_ip": "10.0.0.1", "user_agent": "bench", "is_console_command": False},
+    environment="production",
+    service_name="invest-gpt",
+)
+
+
+def run_sync(coroutine):
+    """Drive a coroutine that never suspends, without an event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine suspended")
+
+
+def make_case(holdings: int):
+    portfolio = {"stocks": make_holdings("stock", holdings), "crypto": make_holdings("crypto", holdings)}
+    records = [{"name": h["symbol"], "value": h["currentValue"]} for h in portfolio["stocks"][:20]]
+    html = plotly.io.to_html(financial_api.create_plot(records, plot_type="bar", x_column="name", y_column="value"),
+                             include_plotlyjs='cdn', full_html=False)
+    answer = "Your portfolio is up 4.2% this month. " * 40
+    return {
+        "portfolio_bytes": json.dumps(portfolio).encode("utf-8"),
+        "compacted": compact_tool_result("portfolio_get_data", portfolio),
+        "events": [
+            ("Tool call completed", {"trace_id": f"t{i}"}, {"request_trace_id": "r1", "request_id": "q1", "step": i,
+                                                             "function_name": "portfolio_get_data", "duration": 0.123})
+            for i in range(LOG_EVENTS_PER_REQUEST)
+        ],
+        "response": APIResponse(
+            statusCode=200, headers={"Content-Type": "text/html"},
+            body=[{"type": "text", "text": answer, "annotations": []}], html=html, session_id="s1"
+        ),
+    }
+
+
+def decode_reply(path, case):
+    if path == "legacy":
+        return json.loads(case["portfolio_bytes"].decode("utf-8"))
+    return get_codec("json").decode(case["portfolio_bytes"])
+
+
+def encode_tool_result(path, case, portfolio):
+    if path == "legacy":
+        encode = lambda value: json.dumps(value, separators=(",", ":"), default=str)
+    else:
+        encode = json_codec.dumps_str
+    return len(encode(portfolio)) + len(encode(case["compacted"]))
+
+
+def encode_logs(path, case):
+    format_event = ProtocolAxiomLogger._format_protocol_log_data
+    if path == "legacy":
+        events = [format_event(LOG_SELF, message, LogLevel.INFO, context, extra=json.dumps(json.dumps(extra)))
+                  for message, context, extra in case["events"]]
+        return len(gzip.compress("\n".join(json.dumps(event) for event in events).encode("utf-8")))
+    events = [format_event(LOG_SELF, message, LogLevel.INFO, context, extra=extra) for message, context, extra in case["events"]]
+    return len(_encode_events(events))
+
+
+def render_response(path, case):
+    if path == "legacy":
+        content = run_sync(serialize_response(field=RESPONSE_FIELD, response_content=case["response"]))
+        return len(JSONResponse(content).body)
+    return len(FastJSONResponse(case["response"]).body)
+
+
+def serialize_request(path, case):
+    portfolio = decode_reply(path, case)
+    return encode_tool_result(path, case, portfolio) + encode_logs(path, case) + render_response(path, case)
+
+
+@pytest.fixture(scope="module", params=HOLDINGS, ids=lambda holdings: f"{holdings}holdings")
+def case(request):
+    return make_case(request.param)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_serialization_per_request(benchmark, case, path):
+    benchmark.extra_info["backend"] = json_codec.BACKEND
+    benchmark.extra_info["bytes"] = serialize_request(path, case)
+    benchmark(serialize_request, path, case)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_decode_reply(benchmark, case, path):
+    benchmark(decode_reply, path, case)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_encode_tool_result(benchmark, case, path):
+    portfolio = decode_reply(path, case)
+    benchmark(encode_tool_result, path, case, portfolio)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_encode_logs(benchmark, case, path):
+    benchmark(encode_logs, path, case)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_render_response(benchmark, case, path):
+    benchmark(render_response, path, case)
@@ -0,0 +1,87 @@
+"""
+Fake InvestmentMarket gateway for load tests.
+
+Implements the token refresh and the stock and crypto portfolio endpoints used
+by src/tools/financial_api.py, with a configurable latency, portfolio size and
+error rate. Point the app at it with INVESTMENT_MARKET_API_BASE_URL=host:port.
+
+Usage:
+    python -m benchmarks.fakes.gateway --port 9102 --holdings 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+
+def make_holdings(kind: str, count: int):
+    """Holdings shaped like the gateway's, including the fields the model never needs"""
+    holdings = []
+    for i in range(count):
+        quantity = round(random.uniform(0.01, 500), 6)
+        average_price = round(random.uniform(0.5, 900), 4)
+        current_price = round(average_price * random.uniform(0.6, 1.6), 4)
+        invested = quantity * average_price
+        value = quantity * current_price
+        holdings.append({
+            "id": str(uuid.uuid4()),
+            "symbol": f"{kind[:1].upper()}{i:03d}",
+            "name": f"{kind.title()} asset {i}",
+            "logoUrl": f"https://cdn.example.com/logos/{kind}/{i}.png",
+            "quantity": quantity,
+            "averagePrice": average_price,
+            "currentPrice": current_price,
+            "investedAmount": invested,
+            "currentValue": value,
+            "profitLoss": value - invested,
+            "profitLossPercentage": (value - invested) / invested * 100,
+            "currency": "USD",
+            "createdAt": "2024-01-01T00:00:00Z",
+            "updatedAt": "2025-01-01T00:00:00Z",
+        })
+    return holdings
+
+
+def create_app(holdings: int, latency: float, jitter: float, error_rate: float) -> FastAPI:
+    app = FastAPI(title="Fake InvestmentMarket gateway")
+    portfolios = {kind: make_holdings(kind, holdings) for kind in ("stocks", "crypto")}
+
+    async def respond(payload):
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if random.random() < error_rate:
+            return JSONResponse(status_code=503, content={"message": "Service unavailable"})
+        return payload
+
+    @app.post("/auth/refresh-token")
+    async def refresh_token():
+        return await respond({"data": {"accessToken": uuid.uuid4().hex}})
+
+    @app.get("/api-gateway/portfolio/{kind}")
+    async def portfolio(kind: str):
+        return await respond({"data": {"holdings": portfolios.get(kind, [])}})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--holdings", type=int, default=50, help="Holdings per portfolio section")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 503")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(
+        create_app(args.holdings, args.latency, args.jitter, args.error_rate),
+        host=args.host, port=args.port, log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+In-process Kafka stand-in for benchmarks.
+
+LocalBroker keeps every topic as a single in-memory partition. LocalProducer and
+LocalConsumer implement the subset of the aiokafka API used by KafkaRPCClient and
+accept the same constructor arguments, so they plug into its producer_factory and
+consumer_factory hooks. PortfolioResponder plays the backend service that answers
+portfolio requests on the reply topic.
+"""
+import asyncio
+import random
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional
+
+from aiokafka import TopicPartition
+from src.utils.kafka_codecs import ACCEPT_HEADER, CONTENT_TYPE_HEADER, codec_for_headers, header_value, negotiate_codec
+
+
+ConsumerRecord = namedtuple("ConsumerRecord", ["topic", "partition", "offset", "key", "value", "headers"])
+RecordMetadata = namedtuple("RecordMetadata", ["topic", "partition", "offset"])
+
+
+class LocalBroker:
+    """Topics as append-only lists with a condition to wake waiting consumers"""
+
+    def __init__(self, network_delay: float = 0.0005):
+        self.network_delay = network_delay
+        self.topics: Dict[str, List[tuple]] = {}
+        self.bytes_appended: Dict[str, int] = {}
+        self._appended = asyncio.Condition()
+
+    def create_topic(self, topic: str):
+        self.topics.setdefault(topic, [])
+
+    async def append(self, topic: str, key: bytes, value: bytes, headers=None) -> int:
+        async with self._appended:
+            log = self.topics.setdefault(topic, [])
+            log.append((key, value, tuple(headers or ())))
+            self.bytes_appended[topic] = self.bytes_appended.get(topic, 0) + len(value or b"")
+            self._appended.notify_all()
+            return len(log) - 1
+
+    async def wait_for(self, predicate: Callable[[], bool]):
+        async with self._appended:
+            await self._appended.wait_for(predicate)
+
+    def producer_factory(self, **kwargs) -> "LocalProducer":
+        return LocalProducer(self, **kwargs)
+
+    def consumer_factory(self, *topics, **kwargs) -> "LocalConsumer":
+        return LocalConsumer(self, *topics, **kwargs)
+
+
+class LocalProducer:
+    """Producer that serializes like aiokafka and appends to the local broker"""
+
+    def __init__(self, broker: LocalBroker, value_serializer: Callable = None,
+                 key_serializer: Callable = None, **kwargs):
+        self.broker = broker
+        self.value_serializer = value_serializer or (lambda v: v)
+        self.key_serializer = key_serializer or (lambda k: k)
+        self.sent = 0
+        self.flushes = 0
+
+    async def start(self):
+        await asyncio.sleep(self.broker.network_delay)
+
+    async def stop(self):
+        pass
+
+    async def send(self, topic: str, value: Any = None, key: Any = None, headers=None, **kwargs) -> asyncio.Future:
+        """Queue a message and return a delivery future, like aiokafka's accumulator"""
+        future = asyncio.get_running_loop().create_future()
+        asyncio.ensure_future(self._deliver(topic, self.key_serializer(key), self.value_serializer(value), headers, future))
+        return future
+
+    async def _deliver(self, topic, key, value, headers, future):
+        self.flushes += 1
+        await asyncio.sleep(self.broker.network_delay)
+        offset = await self.broker.append(topic, key, value, headers)
+        self.sent += 1
+        future.set_result(RecordMetadata(topic, 0, offset))
+
+    async def send_and_wait(self, topic: str, value: Any = None, key: Any = None, headers=None, **kwargs):
+        return await (await self.send(topic, value=value, key=key, headers=headers))
+
+    async def flush(self):
+        pass
+
+
+class LocalConsumer:
+    """Consumer over manually assigned single-partition topics of the local broker"""
+
+    def __init__(self, broker: LocalBroker, *topics, value_deserializer: Callable = None,
+                 key_deserializer: Callable = None, **kwargs):
+        self.broker = broker
+        self.value_deserializer = value_deserializer or (lambda v: v)
+        self.key_deserializer = key_deserializer or (lambda k: k)
+        self._positions: Dict[TopicPartition, int] = {}
+        for topic in topics:
+            self.broker.create_topic(topic)
+            self._positions[TopicPartition(topic, 0)] = len(self.broker.topics[topic])
+
+    async def start(self):
+        await asyncio.sleep(self.broker.network_delay)
+
+    async def stop(self):
+        pass
+
+    async def topics(self):
+        return set(self.broker.topics)
+
+    def partitions_for_topic(self, topic: str):
+        return {0} if topic in self.broker.topics else None
+
+    def assignment(self):
+        return set(self._positions)
+
+    def assign(self, partitions):
+        self._positions = {tp: self._positions.get(tp, 0) for tp in partitions}
+
+    def seek(self, tp: TopicPartition, offset: int):
+        self._positions[tp] = offset
+
+    async def seek_to_end(self, *partitions):
+        for tp in partitions or list(self._positions):
+            self._positions[tp] = len(self.broker.topics.get(tp.topic, []))
+
+    async def position(self, tp: TopicPartition) -> int:
+        return self._positions[tp]
+
+    def _next_available(self) -> Optional[TopicPartition]:
+        for tp, offset in self._positions.items():
+            if offset < len(self.broker.topics.get(tp.topic, [])):
+                return tp
+        return None
+
+    async def getone(self) -> ConsumerRecord:
+        tp = self._next_available()
+        if tp is None:
+            await self.broker.wait_for(lambda: self._next_available() is not None)
+            tp = self._next_available()
+        offset = self._positions[tp]
+        key, value, headers = self.broker.topics[tp.topic][offset]
+        self._positions[tp] = offset + 1
+        return ConsumerRecord(
+            tp.topic, tp.partition, offset,
+            self.key_deserializer(key), self.value_deserializer(value), list(headers)
+        )
+
+
+class PortfolioResponder:
+    """
+    Plays the backend portfolio service: reads the request topic and replies on the
+    topic named in each request, keyed by its correlation id, in the first codec
+    listed in the request's accept header (or JSON when negotiate is False).
+    """
+
+    def __init__(self, broker: LocalBroker, request_topic: str = "request-topic",
+                 latency: float = 0.005, jitter: float = 0.002, holdings: int = 20,
+                 drop_accounts: Optional[set] = None, negotiate: bool = True):
+        self.broker = broker
+        self.request_topic = request_topic
+        self.latency = latency
+        self.jitter = jitter
+        self.holdings = holdings
+        self.drop_accounts = drop_accounts or set()
+        self.negotiate = negotiate
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set = set()
+        self.broker.create_topic(request_topic)
+        self._consumer = LocalConsumer(broker, request_topic)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            for task in list(self._pending):
+                task.cancel()
+
+    async def _run(self):
+        while True:
+            message = await self._consumer.getone()
+            task = asyncio.ensure_future(self._reply(message))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _reply(self, message: ConsumerRecord):
+        request = codec_for_headers(message.headers).decode(message.value)
+        reply_codec = negotiate_codec(header_value(message.headers, ACCEPT_HEADER) if self.negotiate else None)
+        if request.get("accountId") in self.drop_accounts:
+            return
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        reply = {
+            "accountId": request.get("accountId"),
+            "holdings": [
+                {"symbol": f"SYM{i}", "quantity": i + 1, "currentValue": round(100.0 * (i + 1), 2)}
+                for i in range(self.holdings)
+            ]
+        }
+        await self.broker.append(
+            request["response_topic"], message.key, reply_codec.encode(reply),
+            [(CONTENT_TYPE_HEADER, reply_codec.content_type.encode("utf-8"))]
+        )
@@ -0,0 +1,222 @@
+"""
+Fake OpenAI API for load tests.
+
+Serves /v1/chat/completions (classifier and cleaner) and /v1/responses (the
+tool-bound main model, which uses the Responses API because of the built-in web
+search tool) with a fixed latency, so the service can be driven at full load
+without paid calls. Point the app at it with OPENAI_BASE_URL=http://host:port/v1.
+
+Tool calls are scripted: the first rule whose pattern matches the last user
+message makes the model call that tool, once per question. The default rules
+call portfolio_get_data for portfolio questions and create_plot for charts; a
+JSON file of {"match", "tool", "arguments"} rules replaces them.
+
+Usage:
+    python -m benchmarks.fakes.openai_server --port 9101 --latency 0.3
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+
+DEFAULT_RULES = [
+    {"match": r"\b(plot|chart|graph|visuali[sz]e)\b", "tool": "create_plot", "arguments": {
+        "data": [
+            {"name": "Stocks", "value": 3053.75, "category": "Assets"},
+            {"name": "Crypto", "value": 3896.62, "category": "Assets"},
+        ],
+        "plot_type": "pie",
+        "title": "Portfolio Allocation",
+    }},
+    {"match": r"\b(my|portfolio|holdings?)\b", "tool": "portfolio_get_data", "arguments": {}},
+]
+
+# Prompt caching starts at 1024 tokens and grows in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+
+def estimate_tokens(value: Any) -> int:
+    return len(json.dumps(value, default=str)) // 4 + 1
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+class ScriptedModel:
+    """Decides what the fake model answers and tracks cached prompt prefixes"""
+
+    def __init__(self, rules: List[Dict[str, Any]], latency: float, jitter: float, answer_words: int):
+        self.rules = [dict(rule, pattern=re.compile(rule["match"], re.IGNORECASE)) for rule in rules]
+        self.latency = latency
+        self.jitter = jitter
+        self.answer_words = answer_words
+        self._seen_prefixes: set = set()
+        self.requests = 0
+
+    async def delay(self):
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def cached_tokens(self, prefix: str, prompt_tokens: int) -> int:
+        """Report the stable prefix as cached from its second use, like the real prompt cache"""
+        digest = hashlib.blake2b(prefix.encode("utf-8"), digest_size=16).digest()
+        if digest not in self._seen_prefixes:
+            self._seen_prefixes.add(digest)
+            return 0
+        prefix_tokens = min(estimate_tokens(prefix), prompt_tokens)
+        if prefix_tokens < CACHE_MIN_TOKENS:
+            return 0
+        return prefix_tokens - prefix_tokens % CACHE_INCREMENT
+
+    def tool_call(self, question: str, answered_tools: bool, tool_names: List[str]) -> Optional[Dict[str, Any]]:
+        if answered_tools:
+            return None
+        for rule in self.rules:
+            if rule["tool"] in tool_names and rule["pattern"].search(question):
+                return rule
+        return None
+
+    def answer(self, question: str) -> str:
+        filler = " ".join(["InvestmentMarket.ae"] + ["analysis"] * max(self.answer_words - 5, 0))
+        return f"Here is what I found about {question[:80]!r}. {filler}."
+
+    def classify_or_clean(self, prompt: str) -> str:
+        if "Response (YES, SIMPLE or NO)" in prompt or "Response (YES or NO)" in prompt:
+            return "YES"
+        if "Text to clean:" in prompt:
+            cleaned = prompt.split("Text to clean:", 1)[1].rsplit("Cleaned text:", 1)[0]
+            return cleaned.strip()
+        return self.answer(prompt)
+
+
+def create_app(model: ScriptedModel) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model.requests += 1
+        await model.delay()
+        messages = body.get("messages", [])
+        prompt = _text(messages[-1].get("content")) if messages else ""
+        text = model.classify_or_clean(prompt)
+        prompt_tokens = estimate_tokens(messages)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": estimate_tokens(text),
+                "total_tokens": prompt_tokens + estimate_tokens(text),
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+        model.requests += 1
+        await model.delay()
+        items = body.get("input", [])
+        if isinstance(items, str):
+            items = [{"role": "user", "content": items}]
+
+        last_user = max((i for i, item in enumerate(items) if item.get("role") == "user"), default=-1)
+        question = _text(items[last_user].get("content")) if last_user >= 0 else ""
+        answered_tools = any(item.get("type") == "function_call_output" for item in items[last_user + 1:])
+        tool_names = [tool.get("name") for tool in body.get("tools", []) if tool.get("type") == "function"]
+        rule = model.tool_call(question, answered_tools, tool_names)
+
+        if rule:
+            call_id = f"call_{uuid.uuid4().hex[:24]}"
+            output = [{
+                "type": "function_call",
+                "id": f"fc_{uuid.uuid4().hex}",
+                "call_id": call_id,
+                "name": rule["tool"],
+                "arguments": json.dumps(rule["arguments"]),
+                "status": "completed",
+            }]
+            output_text = json.dumps(rule["arguments"])
+        else:
+            output_text = json.dumps(model.answer(question))
+            output = [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": output_text, "annotations": []}],
+            }]
+
+        prompt_tokens = estimate_tokens(items) + estimate_tokens(body.get("tools", []))
+        # The system prompt and tool schemas form the prefix the real API would cache
+        prefix = json.dumps([body.get("tools", []), items[:1]], sort_keys=True)
+        cached = model.cached_tokens(prefix, prompt_tokens)
+        output_tokens = estimate_tokens(output_text)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": time.time(),
+            "model": body.get("model", "gpt-4o"),
+            "status": "completed",
+            "output": output,
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": prompt_tokens,
+                "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": prompt_tokens + output_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": model.requests}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--script", help="JSON file of tool call rules replacing the defaults")
+    args = parser.parse_args()
+
+    rules = DEFAULT_RULES
+    if args.script:
+        with open(args.script) as f:
+            rules = json.load(f)
+
+    import uvicorn
+    model = ScriptedModel(rules, args.latency, args.jitter, args.answer_words)
+    uvicorn.run(create_app(model), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
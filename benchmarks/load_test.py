@@ -0,0 +1,282 @@
+"""
+Load test for the whole service against local fakes.
+
+Starts the fake OpenAI API, the fake InvestmentMarket gateway and the service
+(benchmarks/serve.py, with the Kafka stand-in) as separate processes, then runs
+a closed-loop load of concurrent clients over a mix of scenarios:
+
+    query       general /query answered without tools
+    portfolio   /query that calls portfolio_get_data on the gateway
+    plot        /query that calls create_plot and returns chart HTML
+    kafka       /portfolio request/reply over the Kafka stand-in
+
+and reports throughput, p50/p95/p99 latency per scenario, and the memory and
+event-loop lag of every worker. Nothing leaves the machine.
+
+Usage:
+    python -m benchmarks.load_test --workers 2 --concurrency 32 --duration 30
+    python -m benchmarks.load_test --url http://127.0.0.1:8001 --api-key ...   # an already running service
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+SCENARIOS = ("query", "portfolio", "plot", "kafka")
+QUESTIONS = {
+    "query": "What moves the price of Bitcoin and Ethereum?",
+    "portfolio": "How is my portfolio performing?",
+    "plot": "Show me a chart of my portfolio allocation",
+}
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse 'query=4,portfolio=2,plot=1,kafka=1' into scenario weights"""
+    mix = {}
+    for entry in value.split(","):
+        name, _, weight = entry.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class ServiceProcesses:
+    """The fakes and the service under test, started as subprocesses"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+
+    def _spawn(self, *command: str, env: Optional[Dict[str, str]] = None):
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", *command],
+            env={**os.environ, **(env or {})},
+            stdout=subprocess.DEVNULL if not self.args.verbose else None,
+            stderr=subprocess.DEVNULL if not self.args.verbose else None
+        ))
+
+    def start_fakes(self):
+        args = self.args
+        self._spawn(
+            "benchmarks.fakes.openai_server", "--port", str(args.openai_port),
+            "--latency", str(args.llm_latency)
+        )
+        self._spawn(
+            "benchmarks.fakes.gateway", "--port", str(args.gateway_port),
+            "--holdings", str(args.holdings), "--latency", str(args.gateway_latency)
+        )
+
+    def service_env(self) -> Dict[str, str]:
+        """Environment that points the service at the fakes"""
+        args = self.args
+        return {
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+            "OPENAI_API_KEY": "bench",
+            "API_KEY": args.api_key,
+            "INVESTMENT_MARKET_API_BASE_URL": f"127.0.0.1:{args.gateway_port}",
+            "REFRESH_TOKEN": "bench",
+            "USER_NAME": "bench",
+            "RESPONSE_CACHE_ENABLED": "true" if args.response_cache else "false",
+            "GUNICORN_WORKERS": str(args.workers),
+            "BENCH_KAFKA_LATENCY": str(args.kafka_latency),
+            "BENCH_KAFKA_HOLDINGS": str(args.holdings),
+        }
+
+    def start(self):
+        args = self.args
+        self.start_fakes()
+        self._spawn(
+            "uvicorn", "benchmarks.serve:create_app", "--factory",
+            "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers),
+            "--log-level", "warning",
+            env=self.service_env()
+        )
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Service did not become ready")
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, sequence: int, api_key: str) -> bool:
+    """Send one request of a scenario and report whether it succeeded"""
+    if scenario == "kafka":
+        response = await client.post("/portfolio", params={"user_id": f"bench-{sequence}"})
+        return response.status_code == 200 and response.json().get("status") == "success"
+
+    # A distinct suffix per request keeps the response cache from answering
+    query = f"{QUESTIONS[scenario]} (request {sequence})"
+    response = await client.post(
+        "/query", json={"query": query}, headers={"Authorization": f"Bearer {api_key}"}
+    )
+    if response.status_code != 200:
+        return False
+    body = response.json()
+    if body.get("statusCode") != 200:
+        return False
+    return scenario != "plot" or bool(body.get("html"))
+
+
+async def sample_workers(client: httpx.AsyncClient, workers: Dict[int, Dict[str, Any]], stop: asyncio.Event):
+    """Poll /bench/stats; requests land on random workers, so over the run every worker is seen"""
+    while not stop.is_set():
+        try:
+            response = await client.get("/bench/stats")
+            if response.status_code == 200:
+                stats = response.json()
+                worker = workers.setdefault(stats["pid"], {"peak_rss_bytes": 0})
+                worker["peak_rss_bytes"] = max(worker["peak_rss_bytes"], stats["rss_bytes"])
+                worker.update(rss_bytes=stats["rss_bytes"], loop_lag=stats["loop_lag"])
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(url: str, api_key: str, mix: Dict[str, float], concurrency: int, duration: float,
+                   warmup: float) -> Tuple[Dict[str, List[Tuple[float, bool]]], Dict[int, Dict[str, Any]], float]:
+    results: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+    workers: Dict[int, Dict[str, Any]] = {}
+    names, weights = zip(*mix.items())
+    sequence = iter(range(10 ** 9))
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        await wait_until_ready(client)
+
+        async def user(measure_from: float, until: float):
+            while time.monotonic() < until:
+                scenario = random.choices(names, weights)[0]
+                started = time.monotonic()
+                try:
+                    ok = await run_scenario(client, scenario, next(sequence), api_key)
+                except httpx.HTTPError:
+                    ok = False
+                if started >= measure_from:
+                    results[scenario].append((time.monotonic() - started, ok))
+
+        stop = asyncio.Event()
+        sampler = asyncio.ensure_future(sample_workers(client, workers, stop))
+        started = time.monotonic()
+        await asyncio.gather(*(user(started + warmup, started + warmup + duration) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started - warmup
+        stop.set()
+        await sampler
+    return results, workers, elapsed
+
+
+def report(results: Dict[str, List[Tuple[float, bool]]], workers: Dict[int, Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    summary = {"elapsed_seconds": round(elapsed, 3), "scenarios": {}, "workers": {}}
+    print(f"\n{'scenario':<10} {'requests':>8} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    everything = []
+    for scenario in list(SCENARIOS) + ["total"]:
+        samples = everything if scenario == "total" else results.get(scenario, [])
+        if scenario != "total":
+            everything.extend(samples)
+        if not samples:
+            continue
+        ordered = sorted(latency for latency, _ in samples)
+        row = {
+            "requests": len(samples),
+            "errors": sum(1 for _, ok in samples if not ok),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+        }
+        summary["scenarios"][scenario] = row
+        print(f"{scenario:<10} {row['requests']:>8} {row['errors']:>7} {row['rps']:>8} {row['p50_ms']:>9} "
+              f"{row['p95_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}")
+
+    print(f"\n{'worker pid':<10} {'rss MB':>8} {'peak MB':>8} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for pid, worker in sorted(workers.items()):
+        lag = worker.get("loop_lag", {})
+        summary["workers"][pid] = worker
+        print(f"{pid:<10} {worker['rss_bytes'] / 2 ** 20:>8.1f} {worker['peak_rss_bytes'] / 2 ** 20:>8.1f} "
+              f"{lag.get('p50_ms', 0):>11} {lag.get('p99_ms', 0):>11} {lag.get('max_ms', 0):>11}")
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Load an already running service instead of starting one with the fakes")
+    parser.add_argument("--api-key", default="bench")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("query=4,portfolio=2,plot=1,kafka=1"),
+                        help="Scenario weights, e.g. query=4,portfolio=2,plot=1,kafka=1")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--openai-port", type=int, default=9101)
+    parser.add_argument("--gateway-port", type=int, default=9102)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds per fake model call")
+    parser.add_argument("--gateway-latency", type=float, default=0.05)
+    parser.add_argument("--kafka-latency", type=float, default=0.01)
+    parser.add_argument("--holdings", type=int, default=50, help="Holdings per portfolio section")
+    parser.add_argument("--response-cache", action="store_true", help="Leave the response cache enabled")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the started processes")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    processes = None
+    url = args.url
+    if not url:
+        processes = ServiceProcesses(args)
+        processes.start()
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        results, workers, elapsed = asyncio.run(
+            run_load(url, args.api_key, args.mix, args.concurrency, args.duration, args.warmup)
+        )
+    finally:
+        if processes:
+            processes.stop()
+
+    summary = report(results, workers, elapsed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Per-worker memory of the service under gunicorn, without and with preload.
+
+Starts the fakes, then gunicorn with gunicorn_config.py, once with
+GUNICORN_PRELOAD=false and once with true. After a short load, so every
+worker has served each scenario, it reads /proc/<pid>/smaps_rollup of the
+master and of each worker:
+
+    USS  the process's private pages, what it alone costs
+    PSS  private pages plus its share of shared ones; summed over all processes
+         it is the real footprint against the pod's memory limit
+    RSS  every page mapped in, shared pages counted in each process
+
+Linux only.
+
+Usage:
+    python -m benchmarks.memory_report --workers 4
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.load_test import ServiceProcesses, build_parser, run_load
+
+MODES = {"no preload": "false", "preload": "true"}
+
+
+def smaps(pid: int) -> Dict[str, int]:
+    """Memory counters of a process in bytes"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure(processes: ServiceProcesses, args, preload: str) -> Dict[str, Any]:
+    env = {**os.environ, **processes.service_env(), "GUNICORN_PRELOAD": preload, "WEB_CONCURRENCY": str(args.workers)}
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "-b", f"127.0.0.1:{args.port}",
+         "--log-level", "warning", "benchmarks.serve:create_app()"],
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL
+    )
+    try:
+        started = time.monotonic()
+        asyncio.run(run_load(
+            f"http://127.0.0.1:{args.port}", args.api_key, args.mix,
+            args.concurrency, args.duration, warmup=0
+        ))
+        time.sleep(1)
+        workers = {pid: smaps(pid) for pid in children(master.pid)}
+        return {
+            "ready_and_load_seconds": round(time.monotonic() - started, 1),
+            "master": smaps(master.pid),
+            "workers": workers,
+            "worker_uss_total": sum(w["uss"] for w in workers.values()),
+            "pss_total": smaps(master.pid)["pss"] + sum(w["pss"] for w in workers.values()),
+        }
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+
+
+def mb(value: int) -> str:
+    return f"{value / 2 ** 20:8.1f}"
+
+
+def main():
+    parser = build_parser()
+    parser.description = __doc__
+    parser.set_defaults(workers=4, concurrency=8, duration=10)
+    args = parser.parse_args()
+
+    processes = ServiceProcesses(args)
+    processes.start_fakes()
+    results = {}
+    try:
+        for mode, preload in MODES.items():
+            results[mode] = measure(processes, args, preload)
+    finally:
+        processes.stop()
+
+    for mode, result in results.items():
+        print(f"\n{mode}")
+        print(f"{'process':<16} {'rss MB':>8} {'pss MB':>8} {'uss MB':>8}")
+        print(f"{'master':<16} {mb(result['master']['rss'])} {mb(result['master']['pss'])} {mb(result['master']['uss'])}")
+        for pid, worker in sorted(result["workers"].items()):
+            print(f"{'worker ' + str(pid):<16} {mb(worker['rss'])} {mb(worker['pss'])} {mb(worker['uss'])}")
+
+    print(f"\n{'':<16} {'worker USS MB':>14} {'per worker':>11} {'total PSS MB':>13}")
+    for mode, result in results.items():
+        count = max(len(result["workers"]), 1)
+        print(f"{mode:<16} {mb(result['worker_uss_total']):>14} {mb(result['worker_uss_total'] // count):>11} "
+              f"{mb(result['pss_total']):>13}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+The service as load tests run it: the real app with the in-process Kafka
+stand-in wired into its shared Kafka client, and a /bench/stats endpoint
+reporting the worker's memory and event-loop lag.
+
+Every uvicorn worker calls the factory, so each gets its own broker and client:
+
+    python -m uvicorn benchmarks.serve:create_app --factory --workers 2 --port 9100
+
+Kafka reply latency and portfolio size come from BENCH_KAFKA_LATENCY and
+BENCH_KAFKA_HOLDINGS.
+"""
+import os
+import resource
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from benchmarks.fakes.kafka import LocalBroker, PortfolioResponder
+
+
+def rss_bytes() -> int:
+    """Current resident set size, peak RSS where /proc is not available"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def create_app():
+    import app as service
+    from src.statics import PORTFOLIO_REQUEST_TOPIC, PORTFOLIO_RESPONSE_TOPIC
+    from src.utils import kafka_rpc
+    from src.utils.loop_monitor import loop_monitor
+
+    broker = LocalBroker()
+    broker.create_topic(PORTFOLIO_RESPONSE_TOPIC)
+    kafka_rpc._client = kafka_rpc.KafkaRPCClient(
+        reply_topics=[PORTFOLIO_RESPONSE_TOPIC],
+        producer_factory=broker.producer_factory,
+        consumer_factory=broker.consumer_factory
+    )
+    service_lifespan = service.app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        responder = PortfolioResponder(
+            broker, PORTFOLIO_REQUEST_TOPIC,
+            latency=float(os.getenv("BENCH_KAFKA_LATENCY", "0.01")),
+            holdings=int(os.getenv("BENCH_KAFKA_HOLDINGS", "20"))
+        )
+        responder.start()
+        async with service_lifespan(app) as state:
+            yield state
+        await responder.stop()
+
+    service.app.router.lifespan_context = lifespan
+
+    @service.app.get("/bench/stats", include_in_schema=False)
+    async def bench_stats() -> Dict[str, Any]:
+        return {"pid": os.getpid(), "rss_bytes": rss_bytes(), "loop_lag": loop_monitor.lag_stats()}
+
+    return service.app
@@ -1,15 +1,99 @@
 # gunicorn_config.py
 
+import gc
 import multiprocessing
+import os
+
+
+def cpu_limit() -> float:
+    """CPUs this container may use: the cgroup CPU quota if one is set, else the cores it can run on"""
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" when unlimited
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: a quota of -1 means unlimited
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    try:
+        return float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return float(multiprocessing.cpu_count())
+
+
+def worker_count() -> int:
+    """
+    Number of worker processes.
+
+    WEB_CONCURRENCY sets it explicitly. Otherwise GUNICORN_WORKER_MODE=async (the
+    default) runs one UvicornWorker per whole CPU of the container's quota, at least
+    one: a worker serves many requests at once on its event loop, so more processes
+    than CPUs only adds copies of langchain and plotly competing for the same
+    quota. GUNICORN_WORKER_MODE=legacy keeps the old cpu_count * 2 + 1.
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    if os.getenv("GUNICORN_WORKER_MODE", "async").lower() == "legacy":
+        return multiprocessing.cpu_count() * 2 + 1
+    count = max(1, int(cpu_limit()))
+    max_workers = os.getenv("GUNICORN_MAX_WORKERS")
+    return min(count, int(max_workers)) if max_workers else count
+
 
 bind = "0.0.0.0:8001"  # IP and port to bind the server
-workers = multiprocessing.cpu_count() * 2 + 1  # Number of worker processes
+workers = worker_count()  # Number of worker processes
+raw_env = [f"GUNICORN_WORKERS={workers}"]  # Lets each worker take its share of the LLM rate limits
 worker_class = "uvicorn.workers.UvicornWorker"  # Worker class for handling requests
-threads = multiprocessing.cpu_count() * 2  # Number of threads per worker
-worker_connections = 1000  # Maximum number of simultaneous clients
+# Uvicorn workers ignore threads and worker_connections; concurrent requests per worker
+# are capped by MAX_CONCURRENT_REQUESTS in the app instead
 timeout = 300  # Timeout for worker processes
 keepalive = 300  # Time in seconds to keep an idle client connection open
 max_requests = 1000  # Maximum number of requests a worker will process before restarting
 max_requests_jitter = 50  # Randomize max_requests by this much
 graceful_timeout = 300  # Timeout for graceful worker shutdown
-loglevel = "debug"
\ No newline at end of file
+loglevel = "debug"
+
+# Preload: the master imports the app and warms its immutable state once, and workers
+# fork from it sharing those pages copy-on-write. Recycled workers (max_requests) then
+# start without re-importing langchain, openai, plotly and pandas.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+if preload_app:
+    # No collections in the master while the app loads: freed objects would leave holes
+    # in pages the workers share, and a collection in a worker writes to every object it
+    # scans. Re-enabled once the loaded heap is frozen in when_ready, and in each worker.
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        from src.utils.preload import warm_shared_state
+        warm_shared_state(server.app.wsgi())
+        gc.freeze()
+        # The master keeps running (signals, recycling workers); frozen objects are not
+        # scanned, so collecting what it allocates from here on leaves the shared pages alone
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Anything the master allocated since the last fork joins the permanent generation
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        # Log sessions opened by the master while loading are not shared between processes
+        from src.utils.logger_factory import close_log_sinks
+        close_log_sinks()
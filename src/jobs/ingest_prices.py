@@ -0,0 +1,160 @@
+"""
+Load OHLCV price history into the local price store.
+
+Each source is a CSV file or an http(s) URL with a header row naming a time
+column (date, datetime, timestamp or time) and any of open, high, low, close
+and volume; names are matched case-insensitively and 'Adj Close' is used for
+close when present. Times are dates, ISO datetimes or epoch seconds or
+milliseconds. Bars are merged into what the store already has, so the job
+can run on a schedule with only the latest bars.
+
+Usage:
+    python -m src.jobs.ingest_prices data/AAPL.csv data/BTC-USD.csv
+    python -m src.jobs.ingest_prices --symbol AAPL https://example.com/aapl.csv
+    PRICE_HISTORY_SOURCE_URL='https://example.com/{symbol}.csv' python -m src.jobs.ingest_prices --symbols AAPL,MSFT
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import requests
+
+from src.utils.logger_factory import LoggerFactory
+from src.utils.price_store import COLUMNS, PriceStore, PriceStoreError, normalize_symbol, price_store
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# Where --symbols fetches each symbol's CSV from, with {symbol} substituted
+PRICE_HISTORY_SOURCE_URL = os.getenv("PRICE_HISTORY_SOURCE_URL", "")
+PRICE_HISTORY_SOURCE_TIMEOUT = float(os.getenv("PRICE_HISTORY_SOURCE_TIMEOUT", "30"))
+
+TIME_COLUMNS = ("timestamp", "datetime", "date", "time")
+# Epoch values above this are milliseconds, it is in the year 33658 as seconds
+_EPOCH_MILLISECONDS = 10 ** 12
+
+
+def read_source(source: str) -> str:
+    """Text of a CSV file or URL"""
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source, timeout=PRICE_HISTORY_SOURCE_TIMEOUT)
+        response.raise_for_status()
+        return response.text
+    with open(source, encoding="utf-8-sig") as f:
+        return f.read()
+
+
+def parse_csv(text: str) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Parse OHLCV CSV text into epoch-second timestamps and float columns.
+    Rows whose time cannot be read are skipped; empty or 'null' prices are NaN.
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = [name.strip().lower() for name in next(reader, [])]
+    time_index = next((header.index(name) for name in TIME_COLUMNS if name in header), None)
+    if time_index is None:
+        raise PriceStoreError(f"No time column, expected one of {', '.join(TIME_COLUMNS)}")
+    indices = {name: header.index(name) for name in COLUMNS if name in header}
+    if "adj close" in header:
+        indices["close"] = header.index("adj close")
+    if "close" not in indices:
+        raise PriceStoreError("No close column")
+
+    times: List[str] = []
+    values: Dict[str, List[float]] = {name: [] for name in indices}
+    for row in reader:
+        if len(row) <= time_index or not row[time_index].strip():
+            continue
+        times.append(row[time_index].strip())
+        for name, index in indices.items():
+            try:
+                values[name].append(float(row[index]))
+            except (IndexError, ValueError):
+                values[name].append(np.nan)
+
+    timestamps = _parse_times(times)
+    valid = timestamps >= 0
+    return timestamps[valid], {name: np.asarray(column, dtype=np.float64)[valid] for name, column in values.items()}
+
+
+def _parse_times(times: List[str]) -> np.ndarray:
+    """Epoch seconds of each time, -1 where it cannot be read"""
+    if times and times[0].replace(".", "", 1).isdigit():
+        try:
+            epochs = np.asarray(times, dtype=np.float64)
+        except ValueError:
+            pass
+        else:
+            epochs = np.where(epochs > _EPOCH_MILLISECONDS, epochs / 1000, epochs)
+            return epochs.astype(np.int64)
+    parsed = np.empty(len(times), dtype=np.int64)
+    for i, value in enumerate(times):
+        try:
+            parsed[i] = np.datetime64(value.rstrip("Z"), "s").astype(np.int64)
+        except ValueError:
+            parsed[i] = -1
+    return parsed
+
+
+def ingest(store: PriceStore, symbol: str, source: str) -> int:
+    """Load one source into the store; returns the rows the symbol has afterwards"""
+    started = time.perf_counter()
+    timestamps, columns = parse_csv(read_source(source))
+    if not len(timestamps):
+        raise PriceStoreError(f"No bars in {source}")
+    rows = store.write(symbol, timestamps, columns)
+    logger.info(
+        f"Ingested {len(timestamps)} bars for {symbol}",
+        context={"symbol": symbol, "source": source},
+        extra={"bars": len(timestamps), "rows": rows, "seconds": round(time.perf_counter() - started, 3)}
+    )
+    return rows
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="*", help="CSV files or URLs; the symbol is the file name unless --symbol is given")
+    parser.add_argument("--symbol", help="Symbol for a single source")
+    parser.add_argument("--symbols", help="Comma-separated symbols to fetch from PRICE_HISTORY_SOURCE_URL")
+    parser.add_argument("--store", help="Store directory, defaults to PRICE_STORE_DIR")
+    return parser
+
+
+def main() -> int:
+    parser = build_parser()
+    args = parser.parse_args()
+    store = PriceStore(args.store) if args.store else price_store
+
+    jobs = []
+    if args.symbol and len(args.sources) != 1:
+        parser.error("--symbol needs exactly one source")
+    for source in args.sources:
+        name = args.symbol or os.path.splitext(os.path.basename(source.split("?")[0]))[0]
+        jobs.append((name, source))
+    if args.symbols:
+        if not PRICE_HISTORY_SOURCE_URL:
+            parser.error("--symbols needs PRICE_HISTORY_SOURCE_URL")
+        for name in args.symbols.split(","):
+            jobs.append((name, PRICE_HISTORY_SOURCE_URL.format(symbol=name.strip())))
+    if not jobs:
+        parser.error("nothing to ingest, give CSV sources or --symbols")
+
+    failed = 0
+    for name, source in jobs:
+        try:
+            rows = ingest(store, normalize_symbol(name), source)
+            print(f"{normalize_symbol(name):<12} {rows:>10} rows")
+        except (PriceStoreError, OSError, requests.RequestException) as e:
+            failed += 1
+            logger.error(f"Ingesting {name} failed", context={"source": source}, exception=e)
+            print(f"{name:<12} failed: {e}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
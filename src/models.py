@@ -1,9 +1,20 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal, Optional
 
 class QueryRequest(BaseModel):
     """Model for query requests"""
     query: str
+    session_id: Optional[str] = Field(None, max_length=128)
+    # Clients that keep the chart page open can take changes to it as a plot_patch instead of a new page
+    plot_patches: bool = False
+    # Clients that cannot run plotly.js (email, push, PDF) get charts as a rendered image instead of HTML
+    image_format: Optional[Literal["png", "svg"]] = None
+
+class PortfolioBatchRequest(BaseModel):
+    """Model for batched portfolio requests"""
+    account_ids: List[str] = Field(..., min_length=1, max_length=500)
+    timeout: float = Field(15, gt=0, le=60)
+    stream: bool = False
 
 class ResponseBody(BaseModel):
     """Model for response body structure"""
@@ -17,3 +28,7 @@ class APIResponse(BaseModel):
     headers: Dict[str, str]
     body: List[Dict[str, Any]] = []
     html: Optional[str] = None
+    plot_id: Optional[str] = None
+    plot_patch: Optional[Dict[str, Any]] = None
+    image: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
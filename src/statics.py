@@ -1,10 +1,10 @@
-from datetime import datetime 
+import os
 
 STATICS = {
     
-"SYSTEM_PROMPT": f"IMPORTANT: today's date is {datetime.now().strftime('%Y-%m-%d')}"+"""
-
-You are the official AI trading assistant for InvestmentMarket.ae, the premier investment and trading platform in the UAE. Your mission is to provide exceptional trading guidance.
+# Kept byte-identical between requests so the provider can cache it as a prompt prefix;
+# anything that changes, like today's date, is sent as a separate trailing message
+"SYSTEM_PROMPT": """You are the official AI trading assistant for InvestmentMarket.ae, the premier investment and trading platform in the UAE. Your mission is to provide exceptional trading guidance.
 
 SUPPORT CONTACT: If users ask for support, help, contact information, or need to speak with someone, provide this email:support@investmentmarket.ae
 
@@ -27,6 +27,7 @@ IMPORTANT: NO GROUNDING REQUIRED - You do not need to cite sources or mention wh
 For investment/trading queries:
 - Use portfolio_get_data function for portfolio-related questions
 - Use create_plot or create_subplots for visualization requests.(If and only if the user asks for a visualization,plot,graph,chart or show)
+- Use update_plot to change a chart already shown (type, colors, titles, adding a series) instead of creating it again
 
 TONE AND STYLE:
 - Professional yet approachable
@@ -234,92 +235,80 @@ Invalid JSON:
     }
 
 """,
+
+# Sent after SYSTEM_PROMPT only while the price store has symbols, together with the get_price_history tool
+"PRICE_HISTORY_PROMPT": "For historical prices of a stock or crypto use get_price_history, with plot set to chart them; search the web only for symbols it does not have.",
 }
 
 COIN_MARKET_CAP_API_BASE_URL = "pro-api.coinmarketcap.com"
-INVESTMENT_MARKET_API_BASE_URL = "api-stg-invmkt.agentmarket.ae"
+# Overridable so load tests can point the gateway client at a local fake
+INVESTMENT_MARKET_API_BASE_URL = os.getenv("INVESTMENT_MARKET_API_BASE_URL", "api-stg-invmkt.agentmarket.ae")
 WEBSEARCH_MODEL="gpt-4o-search-preview-2025-03-11"
 MODEL_NAME="gpt-4o"
+PORTFOLIO_REQUEST_TOPIC="request-topic"
+PORTFOLIO_RESPONSE_TOPIC="request-topic.replay"
 
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {
-            margin: 0;
-            padding: 0;
-            background-color: #E6ECF5;
-        }
-        #chart-container {
-            width: 100%;
-            height: 500px;
-        }
-       
-        .js-plotly-plot .plotly .main-svg {
-            font-size: 16px !important;
-        }
-        .js-plotly-plot .plotly .gtitle {
-            font-size: 2vw !important;
-            min-font-size: 14px;
-        }
-        .js-plotly-plot .plotly .xtick, 
-        .js-plotly-plot .plotly .ytick {
-            font-size: 1.5vw !important;
-            min-font-size: 12px;
-        }
-        .js-plotly-plot .plotly .annotation-text {
-            font-size: 1.5vw !important;
-            min-font-size: 12px;
-        }
-       
-        @media (max-width: 768px) {
-            #chart-container {
-                height: 300px;
-            }
-            .js-plotly-plot .plotly .gtitle {
-                font-size: 4vw !important;
-                min-font-size: 16px;
-            }
-            .js-plotly-plot .plotly .xtick, 
-            .js-plotly-plot .plotly .ytick {
-                font-size: 3vw !important;
-                min-font-size: 14px;
-            }
-            .js-plotly-plot .plotly .annotation-text {
-                font-size: 3vw !important;
-                min-font-size: 14px;
-            }
-        }
-        @media (max-width: 480px) {
-            .js-plotly-plot .plotly .gtitle {
-                font-size: 5vw !important;
-                min-font-size: 18px;
-            }
-            .js-plotly-plot .plotly .xtick, 
-            .js-plotly-plot .plotly .ytick {
-                font-size: 4vw !important;
-                min-font-size: 16px;
-            }
-            .js-plotly-plot .plotly .annotation-text {
-                font-size: 4vw !important;
-                min-font-size: 16px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div id="chart-container">
-        {plotly_html}
-    </div>
-    <script>
-        window.addEventListener('resize', function() {
-            Plotly.Plots.resize(document.querySelector('.js-plotly-plot'));
-        });
-    </script>
-</body>
-</html>
-"""
\ No newline at end of file
+# Stylesheet of the plot page shell, shared by every chart (see src/utils/plot_renderer.py)
+PLOT_SHELL_CSS = """
+body {
+    margin: 0;
+    padding: 0;
+    background-color: #E6ECF5;
+}
+#chart-container {
+    width: 100%;
+    height: 500px;
+}
+
+.js-plotly-plot .plotly .main-svg {
+    font-size: 16px !important;
+}
+.js-plotly-plot .plotly .gtitle {
+    font-size: 2vw !important;
+    min-font-size: 14px;
+}
+.js-plotly-plot .plotly .xtick, 
+.js-plotly-plot .plotly .ytick {
+    font-size: 1.5vw !important;
+    min-font-size: 12px;
+}
+.js-plotly-plot .plotly .annotation-text {
+    font-size: 1.5vw !important;
+    min-font-size: 12px;
+}
+
+@media (max-width: 768px) {
+    #chart-container {
+        height: 300px;
+    }
+    .js-plotly-plot .plotly .gtitle {
+        font-size: 4vw !important;
+        min-font-size: 16px;
+    }
+    .js-plotly-plot .plotly .xtick, 
+    .js-plotly-plot .plotly .ytick {
+        font-size: 3vw !important;
+        min-font-size: 14px;
+    }
+    .js-plotly-plot .plotly .annotation-text {
+        font-size: 3vw !important;
+        min-font-size: 14px;
+    }
+}
+@media (max-width: 480px) {
+    .js-plotly-plot .plotly .gtitle {
+        font-size: 5vw !important;
+        min-font-size: 18px;
+    }
+    .js-plotly-plot .plotly .xtick, 
+    .js-plotly-plot .plotly .ytick {
+        font-size: 4vw !important;
+        min-font-size: 16px;
+    }
+    .js-plotly-plot .plotly .annotation-text {
+        font-size: 4vw !important;
+        min-font-size: 16px;
+    }
+}
+"""
@@ -1,10 +1,15 @@
-import http.client,os,json,http,logging
+import os,json,logging,threading,time
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from src.statics import INVESTMENT_MARKET_API_BASE_URL
+import numpy as np
 import plotly.graph_objects as go, plotly.colors as pc
 from plotly.subplots import make_subplots
 from datetime import datetime
 from src.utils.logger_factory import LoggerFactory
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.utils import json_codec
 from typing import Dict, Any, List, Optional, Tuple, Union
 
 
@@ -15,6 +20,53 @@ logger.notice("Application starting up, Protocol Logger initialized")
 
 payload = ''
 
+# Connect and read timeout for gateway calls, so an outage cannot pin threadpool threads
+GATEWAY_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT_SECONDS", "5"))
+# Keep-alive connections to the gateway, at most one per threadpool thread calling it
+GATEWAY_POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", "20"))
+# How old last-known-good portfolio data may be and still be served during an outage
+PORTFOLIO_STALE_MAX_AGE = int(os.getenv("PORTFOLIO_STALE_MAX_AGE_SECONDS", "86400"))
+
+gateway_breaker = CircuitBreaker(
+    "investment_market_gateway",
+    failure_threshold=float(os.getenv("GATEWAY_BREAKER_FAILURE_RATE", "0.5")),
+    minimum_calls=int(os.getenv("GATEWAY_BREAKER_MINIMUM_CALLS", "5")),
+    window_seconds=float(os.getenv("GATEWAY_BREAKER_WINDOW_SECONDS", "30")),
+    reset_timeout=float(os.getenv("GATEWAY_BREAKER_RESET_SECONDS", "30"))
+)
+
+# Last successful holdings per portfolio section: {"stocks": (fetched_at, holdings), ...}
+_last_known_good: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+_last_known_good_lock = threading.Lock()
+
+_gateway_session: Optional[requests.Session] = None
+_gateway_session_lock = threading.Lock()
+
+
+def gateway_session() -> requests.Session:
+    """
+    The worker's pooled HTTP session for the gateway.
+
+    Reusing connections saves a TCP handshake on each of the three calls a
+    portfolio lookup makes (token refresh, stocks, crypto).
+    """
+    global _gateway_session
+    with _gateway_session_lock:
+        if _gateway_session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=GATEWAY_POOL_SIZE))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=GATEWAY_POOL_SIZE))
+            _gateway_session = session
+        return _gateway_session
+
+
+def close_gateway_session():
+    global _gateway_session
+    with _gateway_session_lock:
+        if _gateway_session is not None:
+            _gateway_session.close()
+            _gateway_session = None
+
 class AuthenticationError(Exception):
     """Exception raised for authentication issues."""
     pass
@@ -31,7 +83,6 @@ def get_new_token() -> str:
         AuthenticationError: If token retrieval fails
     """
     try:
-        conn = http.client.HTTPConnection(INVESTMENT_MARKET_API_BASE_URL)
         payload = json.dumps({
             "refreshToken": os.getenv("REFRESH_TOKEN"),
             "userName": os.getenv("USER_NAME")
@@ -39,26 +90,27 @@ def get_new_token() -> str:
         headers = {
             'Content-Type': 'application/json',
         }
-        logger.info("Getting new token", extra=json.dumps({"payload_length": len(payload)}))
+        logger.info("Getting new token", extra={"payload_length": len(payload)})
         
-        conn.request("POST", "/auth/refresh-token", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
-        data_r = json.loads(data.decode("utf-8"))
+        res = gateway_session().post(
+            f"http://{INVESTMENT_MARKET_API_BASE_URL}/auth/refresh-token",
+            data=payload, headers=headers, timeout=GATEWAY_TIMEOUT
+        )
+        data_r = json_codec.loads(res.content)
         
         # Check if the 'data' key exists in the response
         if 'data' not in data_r:
-            logger.error("Invalid token response", extra=json.dumps({"response": data_r}))
+            logger.error("Invalid token response", extra={"response": data_r})
             raise AuthenticationError("Invalid token response format")
         
         # Check if the 'accessToken' key exists in the data
         if 'accessToken' not in data_r['data']:
-            logger.error("No accessToken in response data", extra=json.dumps({"data": data_r['data']}))
+            logger.error("No accessToken in response data", extra={"data": data_r['data']})
             raise AuthenticationError("No access token in response")
         
         return data_r['data']['accessToken']
     except json.JSONDecodeError as e:
-        logger.error("JSON decode error in token response", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 400}})
+        logger.error("JSON decode error in token response", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 400}})
         raise AuthenticationError(f"Failed to parse token response: {str(e)}")
 
 
@@ -67,6 +119,9 @@ def make_authenticated_request(endpoint: str, method: str = "GET", payload: str
     """
     Make an authenticated request to the investment market API.
     
+    Calls go through the gateway circuit breaker: while the gateway is failing
+    they are refused immediately instead of waiting on a dead connection.
+    
     Args:
         endpoint: API endpoint path
         method: HTTP method (GET, POST, etc.)
@@ -77,32 +132,42 @@ def make_authenticated_request(endpoint: str, method: str = "GET", payload: str
         
     Raises:
         AuthenticationError: If authentication fails
-        ConnectionError: If connection fails
+        ConnectionError: If connection fails, the gateway returns a server error
+            or the circuit is open (CircuitOpenError)
         ValueError: If response parsing fails
     """
     try:
-        token = get_new_token()
-        bearer = f"Bearer {token}"
-        
-        conn = http.client.HTTPConnection(INVESTMENT_MARKET_API_BASE_URL)
-        headers = {
-            'Authorization': bearer,
-        }
-        
-        conn.request(method, endpoint, payload, headers)
-        res = conn.getresponse()
-        data = res.read()
-        
-        try:
-            return json.loads(data.decode("utf-8"))
-        except json.JSONDecodeError as e:
-            logger.error("Failed to parse API response", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 400}})
-            raise ValueError(f"Invalid JSON response: {str(e)}")
+        return gateway_breaker.call(_gateway_request, endpoint, method, payload)
+    except CircuitOpenError:
+        raise
     except Exception as e:
-        logger.error("API request failed", extra=json.dumps({"endpoint": endpoint, "error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("API request failed", extra={"endpoint": endpoint, "error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         raise ConnectionError(f"Failed to connect to API: {str(e)}")
 
 
+def _gateway_request(endpoint: str, method: str, payload: str) -> Dict[str, Any]:
+    token = get_new_token()
+    bearer = f"Bearer {token}"
+    
+    headers = {
+        'Authorization': bearer,
+    }
+    
+    res = gateway_session().request(
+        method, f"http://{INVESTMENT_MARKET_API_BASE_URL}{endpoint}",
+        data=payload or None, headers=headers, timeout=GATEWAY_TIMEOUT
+    )
+    
+    if res.status_code >= 500:
+        raise ConnectionError(f"Gateway returned HTTP {res.status_code}")
+    
+    try:
+        return json_codec.loads(res.content)
+    except json.JSONDecodeError as e:
+        logger.error("Failed to parse API response", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 400}})
+        raise ValueError(f"Invalid JSON response: {str(e)}")
+
+
 def portfolio_stocks() -> Dict[str, Any]:
     """
     Get user's stock portfolio information
@@ -117,7 +182,7 @@ def portfolio_stocks() -> Dict[str, Any]:
     try:
         return make_authenticated_request("/api-gateway/portfolio/stocks")
     except (AuthenticationError, ConnectionError) as e:
-        logger.error("Failed to get stock portfolio", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Failed to get stock portfolio", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         return {"error": str(e)}
 
 
@@ -135,7 +200,7 @@ def portfolio_crypto() -> Dict[str, Any]:
     try:
         return make_authenticated_request("/api-gateway/portfolio/crypto")
     except (AuthenticationError, ConnectionError) as e:
-        logger.error("Failed to get crypto portfolio", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Failed to get crypto portfolio", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         return {"error": str(e)}
 
 class PlotHelper:
@@ -212,12 +277,12 @@ def create_subplots(
     Returns:
         Plotly figure object with subplots
     """
-    logger.debug("create_subplots called", extra=json.dumps({
+    logger.debug("create_subplots called", extra={
         "data_type": str(type(data)),
         "data_keys": list(data.keys()) if data else None,
         "plot_types": plot_types,
         "title": title
-    }))
+    })
     
     # Handle empty data case
     if not data:
@@ -226,7 +291,7 @@ def create_subplots(
         fig.update_layout(title=title, height=height, width=width)
         return fig
     
-    logger.debug("Data validation passed", extra=json.dumps({"subplots_count": len(data)}))
+    logger.debug("Data validation passed", extra={"subplots_count": len(data)})
     
     # Convert string keys to integers and sort
     try:
@@ -234,33 +299,33 @@ def create_subplots(
         # Convert keys to integers, handling both string and int keys
         converted_data = {}
         for key, value in data.items():
-            logger.debug("Processing key", extra=json.dumps({"key": str(key), "key_type": str(type(key))}))
+            logger.debug("Processing key", extra={"key": str(key), "key_type": str(type(key))})
             if isinstance(key, str):
                 try:
                     int_key = int(key)
                     converted_data[int_key] = value
-                    logger.debug("Converted string key to integer", extra=json.dumps({"original": key, "converted": int_key}))
+                    logger.debug("Converted string key to integer", extra={"original": key, "converted": int_key})
                 except ValueError:
                     # If string key can't be converted to int, use hash or enumerate
-                    logger.warning("Non-numeric string key found, using hash-based conversion", extra=json.dumps({"key": key}))
+                    logger.warning("Non-numeric string key found, using hash-based conversion", extra={"key": key})
                     int_key = hash(key) % 1000  # Use a reasonable range
                     converted_data[int_key] = value
-                    logger.debug("Hash-converted string key", extra=json.dumps({"original": key, "converted": int_key}))
+                    logger.debug("Hash-converted string key", extra={"original": key, "converted": int_key})
             else:
                 converted_data[key] = value
-                logger.debug("Integer key kept as-is", extra=json.dumps({"key": key}))
+                logger.debug("Integer key kept as-is", extra={"key": key})
         
         data = converted_data
         subplot_indices = sorted(data.keys())
         max_subplot_idx = max(subplot_indices)
         
-        logger.debug("Key conversion successful", extra=json.dumps({
+        logger.debug("Key conversion successful", extra={
             "subplot_indices": subplot_indices,
             "max_subplot_idx": max_subplot_idx
-        }))
+        })
         
     except Exception as e:
-        logger.error("Error processing data keys", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Error processing data keys", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         # Fallback: create sequential integer keys
         subplot_indices = list(range(1, len(data) + 1))
         max_subplot_idx = len(data)
@@ -268,7 +333,7 @@ def create_subplots(
         for i, (key, value) in enumerate(data.items(), 1):
             converted_data[i] = value
         data = converted_data
-        logger.debug("Fallback: created sequential keys", extra=json.dumps({"subplot_indices": subplot_indices}))
+        logger.debug("Fallback: created sequential keys", extra={"subplot_indices": subplot_indices})
     
     # Create a mapping from user indices to grid positions
     logger.debug("Creating grid mapping")
@@ -277,32 +342,32 @@ def create_subplots(
         grid_row = i // cols + 1
         grid_col = i % cols + 1
         grid_mapping[idx] = (grid_row, grid_col)
-        logger.debug("Grid position mapped", extra=json.dumps({"subplot": idx, "grid_row": grid_row, "grid_col": grid_col}))
+        logger.debug("Grid position mapped", extra={"subplot": idx, "grid_row": grid_row, "grid_col": grid_col})
     
     # Determine actual rows needed based on data
     actual_rows = (len(subplot_indices) - 1) // cols + 1 if subplot_indices else rows
     actual_rows = max(rows, actual_rows)  # Ensure at least the specified number of rows
-    logger.debug("Grid dimensions determined", extra=json.dumps({"actual_rows": actual_rows, "cols": cols}))
+    logger.debug("Grid dimensions determined", extra={"actual_rows": actual_rows, "cols": cols})
     
     # Prepare subplot specs - default to xy type
     specs = [[{"type": "xy"} for _ in range(cols)] for _ in range(actual_rows)]
-    logger.debug("Created specs", extra=json.dumps({"specs_count": len(specs)}))
+    logger.debug("Created specs", extra={"specs_count": len(specs)})
     
     # Prepare subplot titles list
     if subplot_titles:
-        logger.debug("Using provided subplot titles", extra=json.dumps({"titles": subplot_titles}))
+        logger.debug("Using provided subplot titles", extra={"titles": subplot_titles})
         # Extend titles if necessary
         if len(subplot_titles) < len(subplot_indices):
             subplot_titles.extend([f"Plot {i}" for i in range(len(subplot_titles) + 1, max_subplot_idx + 1)])
-            logger.debug("Extended titles", extra=json.dumps({"extended_titles": subplot_titles}))
+            logger.debug("Extended titles", extra={"extended_titles": subplot_titles})
     else:
         # Create default titles if none provided
         subplot_titles = [f"Plot {i}" for i in range(1, actual_rows * cols + 1)]
-        logger.debug("Created default titles", extra=json.dumps({"default_titles": subplot_titles}))
+        logger.debug("Created default titles", extra={"default_titles": subplot_titles})
     
     # Validate and fix column_widths
     if column_widths:
-        logger.debug("Processing column widths", extra=json.dumps({"column_widths": column_widths}))
+        logger.debug("Processing column widths", extra={"column_widths": column_widths})
         if len(column_widths) != cols:
             # If column_widths length doesn't match cols, adjust it
             if len(column_widths) < cols:
@@ -322,7 +387,7 @@ def create_subplots(
                 column_widths = [w / total_width for w in column_widths]
             else:
                 column_widths = None  # Use default equal widths
-        logger.debug("Final column widths", extra=json.dumps({"column_widths": column_widths}))
+        logger.debug("Final column widths", extra={"column_widths": column_widths})
     
     # Convert plot types to a dictionary mapped to subplot indices
     logger.debug("Mapping plot types to subplots")
@@ -336,7 +401,7 @@ def create_subplots(
         else:
             # Default to bar if no plot types provided
             plot_type_map[idx] = "bar"
-        logger.debug("Plot type mapped", extra=json.dumps({"subplot": idx, "plot_type": plot_type_map[idx]}))
+        logger.debug("Plot type mapped", extra={"subplot": idx, "plot_type": plot_type_map[idx]})
     
     # Update specs for special plot types (like pie charts)
     logger.debug("Updating specs for special plot types")
@@ -345,7 +410,7 @@ def create_subplots(
             grid_row, grid_col = grid_mapping[idx]
             # Adjust for 0-based indexing in specs
             specs[grid_row-1][grid_col-1] = {"type": "domain"}
-            logger.debug("Updated spec for pie chart", extra=json.dumps({"subplot": idx}))
+            logger.debug("Updated spec for pie chart", extra={"subplot": idx})
     
     # Create subplots
     logger.debug("Creating subplots")
@@ -359,36 +424,36 @@ def create_subplots(
         )
         logger.debug("Subplots structure created successfully")
     except Exception as e:
-        logger.error("Error creating subplots structure", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Error creating subplots structure", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         raise
     
     # Default colors if not provided
     colors = colors or PlotHelper.get_default_colors()
-    logger.debug("Using colors", extra=json.dumps({"colors_count": len(colors)}))
+    logger.debug("Using colors", extra={"colors_count": len(colors)})
     
     # Add traces for each subplot
     logger.debug("Adding traces to subplots")
     for subplot_idx, traces in data.items():
-        logger.debug("Processing subplot", extra=json.dumps({"subplot_idx": subplot_idx, "traces": list(traces.keys())}))
+        logger.debug("Processing subplot", extra={"subplot_idx": subplot_idx, "traces": list(traces.keys())})
         
         # Skip if subplot index not in grid mapping
         if subplot_idx not in grid_mapping:
-            logger.warning("Skipping subplot - not in grid mapping", extra=json.dumps({"subplot_idx": subplot_idx}))
+            logger.warning("Skipping subplot - not in grid mapping", extra={"subplot_idx": subplot_idx})
             continue
             
         grid_row, grid_col = grid_mapping[subplot_idx]
         plot_type = plot_type_map.get(subplot_idx, 'bar')  # Default to bar if not specified
-        logger.debug("Adding traces to grid position", extra=json.dumps({
+        logger.debug("Adding traces to grid position", extra={
             "plot_type": plot_type,
             "grid_row": grid_row,
             "grid_col": grid_col
-        }))
+        })
         
         try:
             _add_traces_to_subplot(fig, traces, plot_type, grid_row, grid_col, colors)
-            logger.debug("Successfully added traces for subplot", extra=json.dumps({"subplot_idx": subplot_idx}))
+            logger.debug("Successfully added traces for subplot", extra={"subplot_idx": subplot_idx})
         except Exception as e:
-            logger.error("Error adding traces for subplot", extra=json.dumps({"subplot_idx": subplot_idx, "error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+            logger.error("Error adding traces for subplot", extra={"subplot_idx": subplot_idx, "error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
             raise
     
     # Update layout
@@ -405,18 +470,18 @@ def create_subplots(
     for plot_type in plot_type_map.values():
         if plot_type == 'bar':
             layout_params['barmode'] = barmode
-            logger.debug("Set barmode", extra=json.dumps({"barmode": barmode}))
+            logger.debug("Set barmode", extra={"barmode": barmode})
             break
     
     if layout_custom:
         layout_params.update(layout_custom)
-        logger.debug("Applied custom layout", extra=json.dumps({"layout_custom": layout_custom}))
+        logger.debug("Applied custom layout", extra={"layout_custom": layout_custom})
     
     try:
         fig.update_layout(**layout_params)
         logger.debug("Layout updated successfully")
     except Exception as e:
-        logger.error("Error updating layout", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Error updating layout", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         raise
     
     # Update axes titles if provided in data
@@ -428,10 +493,10 @@ def create_subplots(
         grid_row, grid_col = grid_mapping[subplot_idx]
         if 'xaxis_title' in traces:
             fig.update_xaxes(title_text=traces['xaxis_title'], row=grid_row, col=grid_col)
-            logger.debug("Set x-axis title", extra=json.dumps({"subplot_idx": subplot_idx, "title": traces['xaxis_title']}))
+            logger.debug("Set x-axis title", extra={"subplot_idx": subplot_idx, "title": traces['xaxis_title']})
         if 'yaxis_title' in traces:
             fig.update_yaxes(title_text=traces['yaxis_title'], row=grid_row, col=grid_col)
-            logger.debug("Set y-axis title", extra=json.dumps({"subplot_idx": subplot_idx, "title": traces['yaxis_title']}))
+            logger.debug("Set y-axis title", extra={"subplot_idx": subplot_idx, "title": traces['yaxis_title']})
     
     logger.debug("create_subplots completed successfully")
     return fig
@@ -455,26 +520,26 @@ def _add_traces_to_subplot(
         grid_col: Column position in grid
         colors: List of colors to use
     """
-    logger.debug("_add_traces_to_subplot called", extra=json.dumps({
+    logger.debug("_add_traces_to_subplot called", extra={
         "plot_type": plot_type,
         "grid_row": grid_row,
         "grid_col": grid_col,
         "traces": list(traces.keys()),
         "colors_available": len(colors)
-    }))
+    })
     
     color_idx = 0
     for trace_name, trace_data in traces.items():
-        logger.debug("Processing trace", extra=json.dumps({
+        if trace_name in ['xaxis_title', 'yaxis_title']:
+            logger.debug("Skipping axis title", extra={"trace_name": trace_name})
+            continue
+        
+        logger.debug("Processing trace", extra={
             "trace_name": trace_name,
             "trace_data_keys": list(trace_data.keys()),
             "x_data": trace_data.get('x', []),
             "y_data": trace_data.get('y', [])
-        }))
-        
-        if trace_name in ['xaxis_title', 'yaxis_title']:
-            logger.debug("Skipping axis title", extra=json.dumps({"trace_name": trace_name}))
-            continue
+        })
         
         # Plot type specific configurations
         if plot_type == 'bar':
@@ -586,16 +651,16 @@ def _add_traces_to_subplot(
             )
             logger.debug("Histogram trace added successfully")
         else:
-            logger.warning("Unknown plot type", extra=json.dumps({"plot_type": plot_type}))
+            logger.warning("Unknown plot type", extra={"plot_type": plot_type})
             
         color_idx += 1
-        logger.debug("Color index incremented", extra=json.dumps({"color_idx": color_idx}))
+        logger.debug("Color index incremented", extra={"color_idx": color_idx})
     
-    logger.debug("_add_traces_to_subplot completed", extra=json.dumps({
+    logger.debug("_add_traces_to_subplot completed", extra={
         "plot_type": plot_type,
         "grid_row": grid_row,
         "grid_col": grid_col
-    }))
+    })
 
 def create_plot(
     data: List[Dict[str, Any]],
@@ -631,7 +696,7 @@ def create_plot(
     Returns:
         Plotly figure object
     """
-    logger.debug("create_plot called", extra=json.dumps({
+    logger.debug("create_plot called", extra={
         "plot_type": plot_type,
         "title": title,
         "data_count": len(data) if data else 0,
@@ -642,7 +707,7 @@ def create_plot(
         "text_column": text_column,
         "width": width,
         "height": height
-    }))
+    })
     
     # Default configurations for different plot types
     default_configs = {
@@ -672,7 +737,7 @@ def create_plot(
     # Get default config for the plot type
     config = default_configs.get(plot_type, {})
     config.update(kwargs)
-    logger.debug("Plot configuration prepared", extra=json.dumps({"config": config}))
+    logger.debug("Plot configuration prepared", extra={"config": config})
     
     # Create figure based on plot type
     plot_creators = {
@@ -685,10 +750,10 @@ def create_plot(
     
     creator = plot_creators.get(plot_type)
     if not creator:
-        logger.error("Unsupported plot type", extra=json.dumps({"plot_type": plot_type, "supported_types": list(plot_creators.keys())}))
+        logger.error("Unsupported plot type", extra={"plot_type": plot_type, "supported_types": list(plot_creators.keys())})
         raise ValueError(f"Unsupported plot type: {plot_type}")
     
-    logger.debug("Creating plot with selected creator", extra=json.dumps({"creator_function": creator.__name__}))
+    logger.debug("Creating plot with selected creator", extra={"creator_function": creator.__name__})
     result = creator(data, title, x_column, y_column, color_column, size_column, 
                   text_column, color_map, width, height, **config)
     logger.debug("Plot created successfully")
@@ -710,7 +775,7 @@ def _create_pie_plot(
     **kwargs
 ) -> go.Figure:
     """Helper function to create pie plot"""
-    logger.debug("_create_pie_plot called", extra=json.dumps({"data_count": len(data), "title": title}))
+    logger.debug("_create_pie_plot called", extra={"data_count": len(data), "title": title})
     
     # Sort data by value in descending order
     data = sorted(data, key=lambda x: x.get('value', 0), reverse=True)
@@ -722,7 +787,7 @@ def _create_pie_plot(
     
     # Calculate total value
     total_value = sum(values)
-    logger.debug("Pie chart data prepared", extra=json.dumps({"total_value": total_value, "item_count": len(names)}))
+    logger.debug("Pie chart data prepared", extra={"total_value": total_value, "item_count": len(names)})
     
     # Create labels with name and percentage
     labels = [f"{name} ({value/total_value*100:.1f}%)" for name, value in zip(names, values)]
@@ -808,7 +873,7 @@ def _create_bar_plot(
     **kwargs
 ) -> go.Figure:
     """Helper function to create bar plot"""
-    logger.debug("_create_bar_plot called", extra=json.dumps({"data_count": len(data), "title": title}))
+    logger.debug("_create_bar_plot called", extra={"data_count": len(data), "title": title})
     
     # Create figure
     fig = go.Figure()
@@ -849,7 +914,7 @@ def _create_bar_plot(
             textposition='auto'
         ))
         
-        logger.debug("Single series bar chart created", extra=json.dumps({"data_points": len(data)}))
+        logger.debug("Single series bar chart created", extra={"data_points": len(data)})
     
     layout = PlotHelper.create_figure_layout(
         title=title,
@@ -1007,20 +1072,20 @@ def _create_line_plot(
             ))
     else:
         # No categories, add all data as one trace
-        logger.debug("Creating single trace without categories", extra=json.dumps({"data_count": len(data)}))
+        logger.debug("Creating single trace without categories", extra={"data_count": len(data)})
         
         # Sort items by x value for proper line connection
         sorted_data = sorted(data, key=lambda x: x.get(x_column, 0))
-        logger.debug("Data sorted by x_column", extra=json.dumps({"x_column": x_column}))
+        logger.debug("Data sorted by x_column", extra={"x_column": x_column})
         
         x_values = [item.get(x_column, 0) for item in sorted_data]
         y_values = [item.get(y_column, 0) for item in sorted_data]
         
-        logger.debug("Line plot data prepared", extra=json.dumps({
+        logger.debug("Line plot data prepared", extra={
             "x_values": x_values,
             "y_values": y_values,
             "mode": kwargs.get('mode', 'lines')
-        }))
+        })
         
         fig.add_trace(go.Scatter(
             x=x_values,
@@ -1030,11 +1095,11 @@ def _create_line_plot(
         
         logger.debug("Scatter trace added successfully")
     
-    logger.debug("Creating layout", extra=json.dumps({
+    logger.debug("Creating layout", extra={
         "title": title,
         "width": width,
         "height": height
-    }))
+    })
     layout = PlotHelper.create_figure_layout(
         title=title,
         width=None,
@@ -1047,10 +1112,51 @@ def _create_line_plot(
     
     return fig
 
+def create_series_plot(
+    series: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    title: str = "Price History",
+    y_title: Optional[str] = None,
+    show_legend: bool = True
+) -> go.Figure:
+    """
+    Create a line plot from arrays, one trace per series.
+
+    Unlike create_plot, which reads list-of-dict records, the x and y arrays
+    are handed to plotly as they are, so a long price history is never turned
+    into per-point Python objects.
+
+    Args:
+        series: (x, y) arrays by trace name, e.g. datetime64 dates and closes by symbol
+        title: Title of the plot
+        y_title: Y axis title
+        show_legend: Whether to show the legend
+
+    Returns:
+        Plotly figure object
+    """
+    logger.debug("create_series_plot called", extra={
+        "title": title,
+        "series": {name: len(x) for name, (x, _) in series.items()}
+    })
+    fig = go.Figure()
+    for name, (x, y) in series.items():
+        fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name=name))
+    layout = PlotHelper.create_figure_layout(
+        title=title,
+        width=None,
+        height=None,
+        show_legend=show_legend and len(series) > 1,
+        xaxis={'type': 'date'},
+        yaxis={'title': {'text': y_title}} if y_title else {}
+    )
+    fig.update_layout(**layout)
+    return fig
+
 def _create_histogram_plot(
     data: List[Dict[str, Any]],
     title: str,
     x_column: str,
+    y_column: Optional[str],
     color_column: Optional[str],
     size_column: Optional[str],
     text_column: Optional[str],
@@ -1101,33 +1207,73 @@ def _create_histogram_plot(
     
     return fig
 
+def _holdings_or_last_known_good(section: str, response: Dict[str, Any]) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """
+    Return a portfolio section's holdings and, when they are stale, when they were fetched.
+    
+    Successful responses refresh the last-known-good copy. Failed ones fall back to
+    it while it is younger than PORTFOLIO_STALE_MAX_AGE; holdings are None when
+    there is nothing to fall back to.
+    """
+    if not response.get('error'):
+        holdings = response.get('data', {}).get('holdings', [])
+        with _last_known_good_lock:
+            _last_known_good[section] = (time.time(), holdings)
+        return holdings, None
+    
+    with _last_known_good_lock:
+        cached = _last_known_good.get(section)
+    if cached is None or time.time() - cached[0] > PORTFOLIO_STALE_MAX_AGE:
+        return None, None
+    logger.warning("Serving last known good portfolio data", context={"section": section, "age_seconds": int(time.time() - cached[0])})
+    return cached[1], datetime.fromtimestamp(cached[0]).isoformat()
+
+
 def get_portfolio_data() -> Dict[str, Any]:
     """
     Get user's portfolio information for both stocks and crypto in JSON format.
     
+    When the gateway is down a section is served from the last data fetched
+    successfully, with "stale" set and "data_as_of" giving its age, instead of
+    being reported as an empty portfolio.
+    
     Returns:
         dict: A JSON-serializable dictionary containing portfolio data
     """
     try:
         # Get stocks and crypto data
-        stocks_data = portfolio_stocks()
-        crypto_data = portfolio_crypto()
+        stocks_info, stocks_as_of = _holdings_or_last_known_good("stocks", portfolio_stocks())
+        crypto_info, crypto_as_of = _holdings_or_last_known_good("crypto", portfolio_crypto())
         
-        # Extract holdings information
-        stocks_info = stocks_data.get('data', {}).get('holdings', [])
-        crypto_info = crypto_data.get('data', {}).get('holdings', [])
+        if stocks_info is None and crypto_info is None:
+            return {
+                "error": "Portfolio service unavailable",
+                "message": "Portfolio data is temporarily unavailable. Do not call this tool again for this question; tell the user to try again in a few minutes."
+            }
         
         # Prepare combined portfolio data
         portfolio_data = {
-            "stocks": stocks_info,
-            "crypto": crypto_info,
+            "stocks": stocks_info or [],
+            "crypto": crypto_info or [],
             "timestamp": datetime.now().isoformat(),
             "summary": {
-                "total_stocks": len(stocks_info),
-                "total_crypto": len(crypto_info)
+                "total_stocks": len(stocks_info or []),
+                "total_crypto": len(crypto_info or [])
             }
         }
         
+        unavailable = [name for name, info in (("stocks", stocks_info), ("crypto", crypto_info)) if info is None]
+        if unavailable:
+            portfolio_data["unavailable"] = unavailable
+        stale = {name: as_of for name, as_of in (("stocks", stocks_as_of), ("crypto", crypto_as_of)) if as_of}
+        if stale:
+            portfolio_data["stale"] = True
+            portfolio_data["data_as_of"] = stale
+        if unavailable or stale:
+            portfolio_data["notice"] = "Live portfolio data is partly unavailable; tell the user which figures are not current."
+        stocks_info = stocks_info or []
+        crypto_info = crypto_info or []
+        
         # Calculate totals
         total_stock_value = sum(float(stock.get('currentValue', 0)) for stock in stocks_info)
         total_crypto_value = sum(float(crypto.get('currentValue', 0)) for crypto in crypto_info)
@@ -1144,5 +1290,5 @@ def get_portfolio_data() -> Dict[str, Any]:
         return portfolio_data
         
     except Exception as e:
-        logger.error("Error getting portfolio data", extra=json.dumps({"error": str(e)}), context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
+        logger.error("Error getting portfolio data", extra={"error": str(e)}, context={"exception": {"trace": str(e), "message": str(e), "code": 500}})
         return {"error": str(e), "message": "Failed to retrieve portfolio data"}
\ No newline at end of file
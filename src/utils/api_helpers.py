@@ -1,10 +1,16 @@
 import os,json,datetime
+from functools import lru_cache
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer,HTTPAuthorizationCredentials
 from src.utils.logger_factory import LoggerFactory
 from langchain_openai import ChatOpenAI
 from src.tools import financial_api
 from src.statics import MODEL_NAME, STATICS
+from src.utils.call_policy import RequestDeadline, STAGE_CLASSIFIER, STAGE_CLEANER, invoke_with_policy
+from src.utils.llm_admission import LLMOverloadedError, PRIORITY_IN_PROGRESS, PRIORITY_INTERACTIVE
+from src.utils.model_router import MODEL_TIERS, VERDICT_NO, VERDICT_SIMPLE, VERDICT_YES
 
 
 logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
@@ -17,6 +23,36 @@ security = HTTPBearer(
 
 plot_cache = {}
 
+# Lightweight model for classification and cleaning
+HELPER_MODEL_NAME = "gpt-4o-mini"
+# Connections to the OpenAI API, shared by every model client of the worker
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+
+_llm_http_clients = None
+
+
+def _http_clients():
+    """One sync and one async connection pool for all ChatOpenAI instances, instead of a pair per model"""
+    global _llm_http_clients
+    if _llm_http_clients is None:
+        limits = httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS)
+        _llm_http_clients = (DefaultHttpxClient(limits=limits), DefaultAsyncHttpxClient(limits=limits))
+    return _llm_http_clients
+
+
+def _chat_openai(model_name: str) -> ChatOpenAI:
+    http_client, http_async_client = _http_clients()
+    # Rate limit retries are coordinated by llm_admission, not by each client
+    return ChatOpenAI(
+        model=model_name, temperature=0, max_retries=0,
+        http_client=http_client, http_async_client=http_async_client
+    )
+
+
+@lru_cache(maxsize=1)
+def _helper_model():
+    return _chat_openai(HELPER_MODEL_NAME)
+
 def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
     Verify the API key from the Authorization header.
@@ -50,15 +86,55 @@ def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(security
     return True
 
 
-async def is_trading_related_query(query: str) -> bool:
+async def is_trading_related_query(query: str, previous_query: str = None, deadline: RequestDeadline = None) -> bool:
+    """
+    Classify whether a query is in scope for the trading assistant.
+    
+    Args:
+        query: The user's query
+        previous_query: The user's previous question in the same session, so short
+            follow-ups like "and last month?" are judged in context
+        deadline: The request's deadline, bounds the classifier call
+    
+    Raises:
+        LLMOverloadedError: If the classifier call is shed, so the whole query is rejected early
+    """
+    return await classify_query(query, previous_query, deadline) != VERDICT_NO
+
 
+async def classify_query(query: str, previous_query: str = None, deadline: RequestDeadline = None) -> str:
+    """
+    Classify a query as out of scope, simple or a full trading question.
+    
+    Args:
+        query: The user's query
+        previous_query: The user's previous question in the same session
+        deadline: The request's deadline, bounds the classifier call
+    
+    Returns:
+        str: VERDICT_NO, VERDICT_SIMPLE or VERDICT_YES; VERDICT_YES when classification fails or times out
+    
+    Raises:
+        LLMOverloadedError: If the classifier call is shed, so the whole query is rejected early
+    """
     try:
-        # Create a lightweight LLM instance for classification
-        classifier_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        classifier_llm = _helper_model()
+        
+        previous_context = ""
+        if previous_query:
+            previous_context = f"""
+This is a follow-up in an ongoing conversation. Respond with "YES" if it continues the previous question.
+Previous user query: "{previous_query}"
+"""
         
         classification_prompt = f"""You are a query classifier for InvestmentMarket.ae, the premier investment and trading platform in the UAE. Your job is to determine if a user query should be handled by our trading assistant.
 
-Respond with ONLY "YES" if the query is about:
+Respond with ONLY "SIMPLE" if the query is in scope but needs no data or analysis:
+- Basic greetings like "Hi", "Hello", "How are you" (these should be welcomed)
+- General questions about what the assistant can do or help with
+- Requests for support contact details or to talk to a person, human agent or customer service
+
+Otherwise respond with ONLY "YES" if the query is about:
 - Trading, stocks, shares, investments, financial markets
 - Cryptocurrency, Bitcoin, Ethereum, digital assets
 - Portfolio management, financial planning, wealth management
@@ -67,10 +143,7 @@ Respond with ONLY "YES" if the query is about:
 - Banking, finance, money management, budgeting
 - Any financial instruments (bonds, ETFs, options, futures, etc.)
 - Support questions for InvestmentMarket.ae platform
-- Requests to talk to a person, human agent, customer service, or support team
 - Questions about account management, platform features, or services
-- Basic greetings like "Hi", "Hello", "How are you" (these should be welcomed)
-- General questions about what the assistant can do or help with
 - Questions about InvestmentMarket.ae company, services, or platform
 
 Respond with ONLY "NO" if the query is clearly about:
@@ -83,37 +156,50 @@ Respond with ONLY "NO" if the query is clearly about:
 - Any topic completely unrelated to finance, trading, or business
 
 IMPORTANT: When in doubt, respond with "YES" - it's better to be helpful than to reject a potentially relevant query.
-
+Between "SIMPLE" and "YES", when in doubt respond with "YES".
+{previous_context}
 User query: "{query}"
 
-Response (YES or NO):"""
+Response (YES, SIMPLE or NO):"""
 
-        response = classifier_llm.invoke([{"role": "user", "content": classification_prompt}])
+        response = await invoke_with_policy(
+            classifier_llm,
+            [{"role": "user", "content": classification_prompt}],
+            HELPER_MODEL_NAME,
+            STAGE_CLASSIFIER,
+            deadline=deadline,
+            priority=PRIORITY_INTERACTIVE,
+            hedge=True,
+            expected_output_tokens=5
+        )
         
-        # Extract the response and check if it's YES
-        result = response.content.strip().upper()
-        return result == "YES"
+        result = response.content.strip().strip('."').upper()
+        if result in (VERDICT_NO, VERDICT_SIMPLE):
+            return result
+        return VERDICT_YES
         
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         # If classification fails, default to allowing the query (fail-safe)
         logger.error(f"Error in query classification: {str(e)}", exception=e)
-        return True
+        return VERDICT_YES
 
 
 
-async def clean_external_references(text: str) -> str:
+async def clean_external_references(text: str, deadline: RequestDeadline = None) -> str:
     """
     Use GPT-4o-mini to clean external links, URLs, domains, and source references 
     from text while preserving the core message and support@investmentmarket.ae
+    
+    The call is bounded by the request's deadline; if it runs out, or the call
+    fails, the original text is returned.
     """
     if not text or not isinstance(text, str):
         return text
     
     try:
-        from langchain_openai import ChatOpenAI
-        
-        # Create a lightweight LLM instance for text cleaning
-        cleaner_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        cleaner_llm = _helper_model()
         
         cleaning_prompt = f"""You are a text cleaner for InvestmentMarket.ae. Your job is to remove ALL external website references, URLs, domains, and source attributions from the given text while preserving the core message and meaning.
 
@@ -145,7 +231,16 @@ Text to clean:
 
 Cleaned text:"""
 
-        response = cleaner_llm.invoke([{"role": "user", "content": cleaning_prompt}])
+        # The answer is already paid for, finishing it goes ahead of new queries
+        response = await invoke_with_policy(
+            cleaner_llm,
+            [{"role": "user", "content": cleaning_prompt}],
+            HELPER_MODEL_NAME,
+            STAGE_CLEANER,
+            deadline=deadline,
+            priority=PRIORITY_IN_PROGRESS,
+            hedge=True
+        )
         return response.content
         
     except Exception as e:
@@ -154,32 +249,126 @@ Cleaned text:"""
         return text
 
 
-async def initialize_chat_model():
-    llm = ChatOpenAI(model=MODEL_NAME, temperature=0)
+web_search_tool = {"type": "web_search_preview"}
+portfolio_tool = {
+        "type": "function",
+        "function": {
+            "name": "portfolio_get_data",
+            "description": "Get the user's portfolio data including stocks and cryptocurrency holdings",
+            "parameters": {
+                "type": "object",
+                "properties": {}
+            }
+        }
+    }
+create_plot_tool = {
+        "type": "function",
+        "function": {
+            "name": "create_plot",
+            "description": "Creates a single visualization (pie, bar, scatter, line, histogram) with customizable options."}}
+    
+create_subplots_tool = {
+        "type": "function",
+        "function": {
+            "name": "create_subplots",
+            "description": "Creates multiple visualizations in a single figure for comparison or multi-view analysis"}}
 
-    web_search_tool = {"type": "web_search_preview"}
-    portfolio_tool = {
-            "type": "function",
-            "function": {
-                "name": "portfolio_get_data",
-                "description": "Get the user's portfolio data including stocks and cryptocurrency holdings",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
+update_plot_tool = {
+        "type": "function",
+        "function": {
+            "name": "update_plot",
+            "description": "Changes a chart already shown in this conversation (type, colors, titles, axes, adding or "
+                           "removing a series) without drawing it again. Attributes use plotly names and dotted paths "
+                           "such as marker.color or xaxis.title.text. In restyle a list gives one value per selected "
+                           "trace, so data arrays must be wrapped: {\"y\": [[1, 2, 3]]}.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "plot_id": {"type": "string", "description": "Chart to change, defaults to the latest one"},
+                    "restyle": {"type": "object", "description": "Trace attributes to set, e.g. {\"type\": \"bar\"}"},
+                    "trace_indices": {"type": "array", "items": {"type": "integer"},
+                                      "description": "Traces restyle applies to, defaults to all"},
+                    "relayout": {"type": "object", "description": "Layout attributes to set, e.g. {\"title.text\": \"Q3\"}"},
+                    "add_traces": {"type": "array", "items": {"type": "object"}, "description": "Traces to add"},
+                    "delete_traces": {"type": "array", "items": {"type": "integer"}, "description": "Trace indices to remove"}
                 }
             }
         }
-    create_plot_tool = {
-            "type": "function",
-            "function": {
-                "name": "create_plot",
-                "description": "Creates a single visualization (pie, bar, scatter, line, histogram) with customizable options."}}
-        
-    create_subplots_tool = {
-            "type": "function",
-            "function": {
-                "name": "create_subplots",
-                "description": "Creates multiple visualizations in a single figure for comparison or multi-view analysis"}}
-
-    llm_with_tools = llm.bind_tools([web_search_tool, portfolio_tool, create_plot_tool, create_subplots_tool])
-    return llm_with_tools
+    }
+
+price_history_tool = {
+        "type": "function",
+        "function": {
+            "name": "get_price_history",
+            "description": "Historical daily or intraday prices of stocks and crypto from the local price store: "
+                           "range, first/last value, change, high/low and sampled points per symbol. Set plot to "
+                           "draw the full series as a line chart instead of passing prices to create_plot.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "symbols": {"type": "array", "items": {"type": "string"}, "description": "Tickers, e.g. [\"AAPL\", \"BTC-USD\"]"},
+                    "start": {"type": "string", "description": "First date, YYYY-MM-DD; defaults to a year before end"},
+                    "end": {"type": "string", "description": "Last date, YYYY-MM-DD; defaults to the latest price"},
+                    "field": {"type": "string", "enum": ["open", "high", "low", "close", "volume"]},
+                    "plot": {"type": "boolean", "description": "Draw the prices as a line chart"},
+                    "title": {"type": "string", "description": "Chart title"}
+                },
+                "required": ["symbols"]
+            }
+        }
+    }
+
+# Fixed order: the tool schemas are part of the cached prompt prefix together with the system prompt
+CHAT_TOOLS = [web_search_tool, portfolio_tool, create_plot_tool, create_subplots_tool, update_plot_tool, price_history_tool]
+# Without prices in the store get_price_history could only fail, so the model is not offered it
+CHAT_TOOLS_WITHOUT_PRICE_HISTORY = [tool for tool in CHAT_TOOLS if tool is not price_history_tool]
+
+
+@lru_cache(maxsize=None)
+def _chat_model_with_tools(model_name: str, price_history: bool = True):
+    return _chat_openai(model_name).bind_tools(CHAT_TOOLS if price_history else CHAT_TOOLS_WITHOUT_PRICE_HISTORY)
+
+
+def open_llm_clients():
+    """
+    Build the model clients and their connection pools at worker startup.
+
+    Building a client loads certificates and validates its settings, tens of
+    milliseconds that would otherwise block the event loop on the first request.
+    """
+    _helper_model()
+    for model_name in set(MODEL_TIERS.values()):
+        for price_history in (True, False):
+            _chat_model_with_tools(model_name, price_history)
+    logger.info("LLM clients ready", context={"models": sorted(set(MODEL_TIERS.values()) | {HELPER_MODEL_NAME})})
+
+
+async def close_llm_clients():
+    """Close the shared OpenAI connection pools on worker shutdown"""
+    global _llm_http_clients
+    if _llm_http_clients is None:
+        return
+    http_client, http_async_client = _llm_http_clients
+    _llm_http_clients = None
+    _helper_model.cache_clear()
+    _chat_model_with_tools.cache_clear()
+    http_client.close()
+    await http_async_client.aclose()
+
+
+async def initialize_chat_model(model_name: str = MODEL_NAME, price_history: bool = True):
+    """
+    Return the tool-bound chat model, built once per worker, model and tool set so every
+    request sends identical tool schemas. get_price_history is left out unless price_history.
+    """
+    return _chat_model_with_tools(model_name, price_history)
+
+
+def current_date_message() -> dict:
+    """
+    Today's date as a short message placed after the user query.
+
+    Computed per request so long-lived workers roll over at midnight, and kept
+    out of the system prompt so the cached prefix does not change every day.
+    """
+    return {"role": "system", "content": f"IMPORTANT: today's date is {datetime.datetime.now().strftime('%Y-%m-%d')}"}
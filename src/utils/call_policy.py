@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, List, Optional
+
+import openai
+from src.utils import llm_admission
+from src.utils.llm_admission import LLMOverloadedError, PRIORITY_INTERACTIVE
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# Whole /query budget, well inside gunicorn's worker timeout
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "4"))
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() == "true"
+# Hedge only once the stage has enough history for its p95 to mean something
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_PERCENTILE = 0.95
+
+STAGE_CLASSIFIER = "classifier"
+STAGE_MAIN = "main"
+STAGE_CLEANER = "cleaner"
+
+# Longest a stage may take, further capped by what is left of the request budget
+STAGE_TIMEOUTS = {
+    STAGE_CLASSIFIER: float(os.getenv("LLM_CLASSIFIER_TIMEOUT_SECONDS", "8")),
+    STAGE_MAIN: float(os.getenv("LLM_MAIN_TIMEOUT_SECONDS", "45")),
+    STAGE_CLEANER: float(os.getenv("LLM_CLEANER_TIMEOUT_SECONDS", "15")),
+}
+# Time kept back for the stages that still have to run after this one
+STAGE_RESERVES = {
+    STAGE_CLASSIFIER: 0.0,
+    STAGE_MAIN: float(os.getenv("LLM_CLEANER_RESERVE_SECONDS", "5")),
+    STAGE_CLEANER: 0.0,
+}
+
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class DeadlineExceededError(TimeoutError):
+    """Exception raised when a stage has no time left in the request budget."""
+    pass
+
+
+class RequestDeadline:
+    """The time budget of one request, shared by all of its LLM stages"""
+
+    def __init__(self, budget: float = REQUEST_DEADLINE_SECONDS):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def stage_timeout(self, stage: str) -> float:
+        """Seconds the stage may run: its own cap, minus what later stages need, within the request budget"""
+        return max(min(STAGE_TIMEOUTS.get(stage, self.budget), self.remaining() - STAGE_RESERVES.get(stage, 0.0)), 0.0)
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retries from concurrent requests spread out"""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _hedge_delay(stage: str, model: str) -> Optional[float]:
+    """The stage's p95 latency, or None when hedging would not help or would add to overload"""
+    if not LLM_HEDGING_ENABLED:
+        return None
+    if metrics.observations("llm_stage_seconds", stage=stage) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    if llm_admission.get_admission_controller(model).queue_depth > 0:
+        return None
+    return metrics.percentile("llm_stage_seconds", LLM_HEDGE_PERCENTILE, stage=stage)
+
+
+async def _hedged(stage: str, delay: float, call) -> Any:
+    """Start a second identical call if the first is slower than delay and return whichever finishes first"""
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        metrics.incr("llm_hedges", stage=stage)
+        tasks.append(asyncio.ensure_future(call()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        metrics.incr("llm_hedge_wins", stage=stage)
+                    return task.result()
+        # Both failed, surface the original call's error
+        return tasks[0].result()
+    finally:
+        # Also reached when the stage deadline cancels us, so no call outlives its request
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def invoke_with_policy(llm: Any, messages: List[Any], model: str, stage: str,
+                             deadline: Optional[RequestDeadline] = None,
+                             priority: int = PRIORITY_INTERACTIVE, hedge: bool = False,
+                             expected_output_tokens: int = llm_admission.LLM_EXPECTED_OUTPUT_TOKENS) -> Any:
+    """
+    Call a chat model within a stage deadline, retrying transient failures.
+
+    Each attempt goes through llm_admission. Connection errors, API timeouts and
+    5xx responses are retried with jittered backoff while the stage has time left;
+    anything else, including shed load, fails straight away. With hedge=True a
+    duplicate call is started once the first is slower than the stage's p95.
+
+    Args:
+        llm: A ChatOpenAI instance, optionally with tools bound
+        messages: The messages to send
+        model: Model name, selects the admission controller
+        stage: One of the STAGE_* constants
+        deadline: The request's deadline; a fresh full budget if not given
+        priority: One of the PRIORITY_* constants
+        hedge: Whether the call is cheap enough to duplicate when slow
+        expected_output_tokens: Completion tokens to reserve before the real usage is known
+
+    Returns:
+        The model response
+
+    Raises:
+        DeadlineExceededError: If the stage runs out of time
+        LLMOverloadedError: If the call is shed
+    """
+    deadline = deadline or RequestDeadline()
+    timeout = deadline.stage_timeout(stage)
+    stage_expires_at = time.monotonic() + timeout
+    started_at = time.monotonic()
+
+    def call():
+        return llm_admission.ainvoke(
+            llm, messages, model, priority=priority, expected_output_tokens=expected_output_tokens
+        )
+
+    attempt = 0
+    while True:
+        remaining = stage_expires_at - time.monotonic()
+        if remaining <= 0:
+            metrics.incr("llm_policy_outcomes", stage=stage, outcome="deadline")
+            raise DeadlineExceededError(f"{stage} stage exceeded its {timeout:.1f}s deadline")
+        try:
+            delay = _hedge_delay(stage, model) if hedge else None
+            attempt_call = (lambda: _hedged(stage, delay, call)) if delay is not None else call
+            response = await asyncio.wait_for(attempt_call(), timeout=remaining)
+        except asyncio.TimeoutError:
+            metrics.incr("llm_policy_outcomes", stage=stage, outcome="deadline")
+            raise DeadlineExceededError(f"{stage} stage exceeded its {timeout:.1f}s deadline")
+        except LLMOverloadedError:
+            metrics.incr("llm_policy_outcomes", stage=stage, outcome="shed")
+            raise
+        except TRANSIENT_ERRORS as e:
+            backoff = _backoff(attempt)
+            if attempt >= LLM_RETRIES or backoff >= stage_expires_at - time.monotonic():
+                metrics.incr("llm_policy_outcomes", stage=stage, outcome="error")
+                raise
+            attempt += 1
+            metrics.incr("llm_retries", stage=stage)
+            logger.warning(
+                "Transient LLM error, retrying",
+                context={"stage": stage, "attempt": attempt, "backoff": round(backoff, 3), "error": str(e)}
+            )
+            await asyncio.sleep(backoff)
+            continue
+        except Exception:
+            metrics.incr("llm_policy_outcomes", stage=stage, outcome="error")
+            raise
+
+        metrics.observe("llm_stage_seconds", time.monotonic() - started_at, stage=stage)
+        metrics.incr("llm_policy_outcomes", stage=stage, outcome="retried_ok" if attempt else "ok")
+        return response
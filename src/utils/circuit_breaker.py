@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitOpenError(ConnectionError):
+    """Exception raised when a call is refused because the circuit is open."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for a synchronous dependency.
+
+    Outcomes of calls within the last window_seconds are tracked; once at least
+    minimum_calls were made and the failure rate reaches failure_threshold the
+    circuit opens and calls fail immediately with CircuitOpenError. After
+    reset_timeout seconds a single trial call is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+
+    Thread-safe, since tools run in the threadpool.
+    """
+
+    def __init__(self, name: str, failure_threshold: float = 0.5, minimum_calls: int = 5,
+                 window_seconds: float = 30, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        metrics.set_gauge("circuit_state", STATE_VALUES[STATE_CLOSED], circuit=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit {self.name} is now {state}", context={"circuit": self.name, "from": self._state})
+        self._state = state
+        metrics.set_gauge("circuit_state", STATE_VALUES[state], circuit=self.name)
+        metrics.incr("circuit_transitions", circuit=self.name, state=state)
+
+    def _failure_rate(self, now: float) -> Tuple[int, float]:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+        calls = len(self._outcomes)
+        failures = sum(1 for _, failed in self._outcomes if failed)
+        return calls, failures / calls if calls else 0.0
+
+    def before_call(self):
+        """
+        Check that a call may go ahead.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with its trial call already running
+        """
+        with self._lock:
+            if self._state == STATE_OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    metrics.incr("circuit_rejected", circuit=self.name)
+                    raise CircuitOpenError(f"{self.name} is unavailable, retry in {remaining:.0f}s")
+                self._set_state(STATE_HALF_OPEN)
+            if self._state == STATE_HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics.incr("circuit_rejected", circuit=self.name)
+                    raise CircuitOpenError(f"{self.name} is recovering, retry shortly")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append((time.monotonic(), False))
+            if self._state == STATE_HALF_OPEN:
+                self._trial_in_flight = False
+                self._outcomes.clear()
+                self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._outcomes.append((now, True))
+            metrics.incr("circuit_failures", circuit=self.name)
+            if self._state == STATE_HALF_OPEN:
+                self._trial_in_flight = False
+                self._opened_at = now
+                self._set_state(STATE_OPEN)
+                return
+            calls, failure_rate = self._failure_rate(now)
+            if calls >= self.minimum_calls and failure_rate >= self.failure_threshold:
+                self._opened_at = now
+                self._set_state(STATE_OPEN)
+
+    def call(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run function through the breaker, recording whether it raised.
+
+        Raises:
+            CircuitOpenError: If the circuit refuses the call
+        """
+        self.before_call()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, failure_rate = self._failure_rate(time.monotonic())
+            return {"state": self._state, "recent_calls": calls, "failure_rate": round(failure_rate, 3)}
@@ -0,0 +1,188 @@
+import os
+import zlib
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from src.utils.metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+# Bodies smaller than this are sent as they are; below about 1KB the headers dominate anyway
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", "5"))
+# Bodies at least this large are compressed in the threadpool so the event loop keeps serving;
+# zlib and brotli release the GIL while they work
+COMPRESSION_THREADPOOL_MIN_SIZE = int(os.getenv("COMPRESSION_THREADPOOL_MIN_SIZE", "262144"))
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+
+# Server preference when the client weighs encodings equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the encoding for a response from the Accept-Encoding header, None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class _Encoder:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_LEVEL)
+        else:
+            # wbits 31: deflate with a gzip header and trailer
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        Compress a chunk. Unless it is the last one, the output is flushed so
+        the client can decode everything sent so far, which keeps streamed
+        responses incremental at the cost of a few bytes per chunk.
+        """
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _CompressionResponder:
+    """Wraps send for one response: holds the start message until the first body shows whether to compress"""
+
+    def __init__(self, send, encoding: str):
+        self.send = send
+        self.encoding = encoding
+        self.start = None
+        self.encoder: Optional[_Encoder] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _compressible(self, headers: Headers, status: int) -> bool:
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", ""):
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+    async def _compress(self, data: bytes, final: bool) -> bytes:
+        self.bytes_in += len(data)
+        if len(data) >= COMPRESSION_THREADPOOL_MIN_SIZE:
+            out = await run_in_threadpool(self.encoder.compress, data, final)
+        else:
+            out = self.encoder.compress(data, final)
+        self.bytes_out += len(out)
+        return out
+
+    def _record(self):
+        metrics.incr("responses_compressed", encoding=self.encoding)
+        metrics.incr("compression_bytes_in", self.bytes_in, encoding=self.encoding)
+        metrics.incr("compression_bytes_out", self.bytes_out, encoding=self.encoding)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            start["headers"] = headers.raw
+            if not self._compressible(headers, start["status"]):
+                await self.send(start)
+                await self.send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            declared = int(headers.get("content-length", -1))
+            if (not more_body and len(body) < COMPRESSION_MIN_SIZE) or 0 <= declared < COMPRESSION_MIN_SIZE:
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.encoder = _Encoder(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # The compressed bytes differ from the ones the tag names, so it can only be a weak match now
+                headers["ETag"] = "W/" + etag
+            if not more_body:
+                compressed = await self._compress(body, final=True)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                self._record()
+                return
+            del headers["Content-Length"]
+            await self.send(start)
+
+        if self.encoder is None:
+            await self.send(message)
+            return
+        if not body and more_body:
+            return
+        compressed = await self._compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        if not more_body:
+            self._record()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli or gzip, whichever the client prefers.
+
+    Only text-like content types at least COMPRESSION_MIN_SIZE bytes long are
+    compressed. A complete body is compressed in one call, in the threadpool
+    once it is large; a streamed body is compressed chunk by chunk and flushed
+    after each, so NDJSON lines still reach the client as they are produced.
+    Brotli is used when the optional brotli package is installed.
+    """
+
+    def __init__(self, app, enabled: bool = COMPRESSION_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressionResponder(send, encoding))
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from src.utils import json_codec
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# Requests one worker handles at once; 0 disables the limit
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "64"))
+# How long a request over the limit may wait for a slot before it is shed with a 503
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT_SECONDS", "2"))
+CONCURRENCY_RETRY_AFTER = int(os.getenv("CONCURRENCY_RETRY_AFTER_SECONDS", "2"))
+# Probes and diagnostics must answer even when the worker is saturated
+CONCURRENCY_EXEMPT_PATHS = ("/health", "/metrics", "/debug/")
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Caps the requests in flight on this worker.
+
+    Past the cap a request waits up to CONCURRENCY_QUEUE_TIMEOUT seconds for a
+    slot and is then answered 503 with Retry-After, so a burst is shed at the
+    door instead of every request in the worker slowing down and holding its
+    memory until the client gives up. Gunicorn's worker_connections does not
+    apply to uvicorn workers, so this is the only per-worker bound.
+    """
+
+    def __init__(self, app, limit: int = MAX_CONCURRENT_REQUESTS, queue_timeout: float = CONCURRENCY_QUEUE_TIMEOUT):
+        self.app = app
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self._in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if self._semaphore is None or scope["type"] != "http" or scope["path"].startswith(CONCURRENCY_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("requests_shed")
+            logger.warning("Worker at concurrency limit, request shed", context={
+                "path": scope["path"], "limit": self.limit
+            })
+            await self._reject(send)
+            return
+
+        self._in_flight += 1
+        metrics.set_gauge("requests_in_flight", self._in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._in_flight -= 1
+            metrics.set_gauge("requests_in_flight", self._in_flight)
+            self._semaphore.release()
+
+    async def _reject(self, send):
+        body = json_codec.dumps({"detail": "Server is busy, please retry shortly"})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(CONCURRENCY_RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
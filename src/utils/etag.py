@@ -0,0 +1,57 @@
+import hashlib
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def make_etag(body: bytes) -> str:
+    """Strong entity tag for a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header against an entity tag, as
+    RFC 9110 requires for GET. Tags weakened by the compression middleware
+    still match the strong tag the endpoint computes.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def conditional_response(request: Request, body: bytes, media_type: str, max_age: int = 0,
+                         headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serve a cacheable body with an ETag, answering 304 Not Modified when the
+    client already holds it.
+
+    Args:
+        request: The incoming request, for its If-None-Match header
+        body: The full response body
+        media_type: Content type of the body
+        max_age: Seconds clients may reuse the body without revalidating
+        headers: Additional response headers
+
+    Returns:
+        Response: 200 with the body, or 304 without it
+    """
+    etag = make_etag(body)
+    cache_headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}" if max_age else "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+    return Response(content=body, media_type=media_type, headers=cache_headers)
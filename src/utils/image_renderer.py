@@ -0,0 +1,240 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import plotly
+
+from src.utils import plot_renderer
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+# Written against kaleido 0.2.1, the version pinned in requirements.txt; 1.x has a different API
+try:
+    from kaleido.scopes.plotly import PlotlyScope
+except ImportError:
+    PlotlyScope = None
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+IMAGE_RENDER_ENABLED = os.getenv("IMAGE_RENDER_ENABLED", "true").lower() == "true"
+# Headless Chromium processes per worker; each renders one image at a time and takes ~100MB
+IMAGE_RENDERER_POOL_SIZE = int(os.getenv("IMAGE_RENDERER_POOL_SIZE", "1"))
+# Start the renderers when the worker starts instead of on the first image request
+IMAGE_RENDERER_WARM = os.getenv("IMAGE_RENDERER_WARM", "false").lower() == "true"
+# Seconds a request waits for a free renderer before going without an image
+IMAGE_RENDER_TIMEOUT = float(os.getenv("IMAGE_RENDER_TIMEOUT", "10"))
+# PNGs are rendered at this multiple of the figure size so they stay sharp on high-DPI screens and in PDFs
+IMAGE_PNG_SCALE = float(os.getenv("IMAGE_PNG_SCALE", "2"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+IMAGE_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+# The plotly.js that ships with plotly, so renderers start without fetching it from the CDN
+_PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+
+
+class ImageRenderError(Exception):
+    """Exception raised when a chart cannot be rendered as an image."""
+    pass
+
+
+class ImageCache:
+    """
+    Rendered images by content hash of the figure and format, least recently
+    used dropped first once IMAGE_CACHE_MAX_BYTES is reached.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(figure: str, image_format: str) -> str:
+        scale = IMAGE_PNG_SCALE if image_format == "png" else 1
+        digest = hashlib.blake2b(f"{image_format}:{scale}:".encode("utf-8"), digest_size=16)
+        digest.update(figure.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+        metrics.incr("image_cache_hits" if image is not None else "image_cache_misses")
+        return image
+
+    def put(self, key: str, image: bytes):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._images[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._images), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+def _shutdown(scope):
+    """Stop a renderer's Chromium process; kaleido restarts it on the scope's next image"""
+    # kaleido 0.2.x has no public way to stop the process, only this private method
+    shutdown = getattr(scope, "_shutdown_kaleido", None)
+    if shutdown is None:
+        logger.warning("Image renderer cannot be shut down by this kaleido version")
+        return
+    try:
+        shutdown()
+    except Exception as e:
+        logger.warning("Image renderer failed to shut down", context={"error": str(e)})
+
+
+class RendererPool:
+    """
+    Long-lived kaleido renderers, each a headless Chromium process that stays
+    up between images. Starting one takes about a second, rendering a chart
+    on a running one a few tens of milliseconds, so images never start their
+    own. Renderers are created on first use up to the pool size; a renderer
+    whose process dies is restarted by kaleido on its next image.
+    """
+
+    def __init__(self, size: int = IMAGE_RENDERER_POOL_SIZE):
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return PlotlyScope is not None and IMAGE_RENDER_ENABLED
+
+    def _acquire(self, timeout: float):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return PlotlyScope(plotlyjs=_PLOTLY_JS, mathjax=False)
+            except Exception as e:
+                # Give the slot back, or every failed start would shrink the pool for good
+                with self._lock:
+                    self._created -= 1
+                raise ImageRenderError(f"Image renderer failed to start: {str(e)}") from e
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ImageRenderError(f"No image renderer free within {timeout}s")
+
+    def render(self, figure: Dict, image_format: str, timeout: float = IMAGE_RENDER_TIMEOUT) -> bytes:
+        """
+        Render a figure dict on a pooled renderer. Blocks, call it from the threadpool.
+
+        Raises:
+            ImageRenderError: If kaleido is not installed, no renderer frees up in time or the render fails
+        """
+        if not self.available:
+            raise ImageRenderError("Image rendering needs the kaleido package")
+        scope = self._acquire(timeout)
+        started = time.perf_counter()
+        try:
+            image = scope.transform(
+                figure, format=image_format, scale=IMAGE_PNG_SCALE if image_format == "png" else 1
+            )
+        except Exception as e:
+            metrics.incr("image_render_errors", format=image_format)
+            # A renderer that failed mid-image may be wedged, the next image starts a fresh process
+            _shutdown(scope)
+            raise ImageRenderError(f"Rendering the chart as {image_format} failed: {str(e)}") from e
+        finally:
+            self._idle.put(scope)
+        metrics.observe("image_render_seconds", time.perf_counter() - started, format=image_format)
+        return image
+
+    def start(self):
+        """Start every renderer now, so the first images do not wait for Chromium"""
+        if not self.available:
+            return
+        warmup = {"data": [{"type": "bar", "y": [1]}], "layout": {}}
+        scopes = []
+        try:
+            for _ in range(self.size):
+                scopes.append(self._acquire(IMAGE_RENDER_TIMEOUT))
+            for scope in scopes:
+                scope.transform(warmup, format="svg")
+        except Exception as e:
+            logger.warning("Image renderer failed to start", context={"error": str(e)})
+        finally:
+            for scope in scopes:
+                self._idle.put(scope)
+
+    def close(self):
+        """
+        Shut down the idle renderers. Renderers still rendering stay counted and
+        return to the pool when done, so the pool never grows past its size.
+        """
+        closed = 0
+        while True:
+            try:
+                scope = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _shutdown(scope)
+            closed += 1
+        with self._lock:
+            self._created -= closed
+
+
+renderer_pool = RendererPool()
+image_cache = ImageCache()
+
+
+def render_image(figure: str, image_format: str) -> Tuple[bytes, str]:
+    """
+    Render figure JSON, as returned by plot_renderer.figure_json, as a PNG or
+    SVG image. The same figure in the same format is rendered once and served
+    from the cache afterwards. Blocks, call it from the threadpool.
+
+    Args:
+        figure: The figure JSON
+        image_format: 'png' or 'svg'
+
+    Returns:
+        tuple: The image and its content hash
+
+    Raises:
+        ImageRenderError: If the image cannot be rendered
+    """
+    if image_format not in IMAGE_MEDIA_TYPES:
+        raise ImageRenderError(f"Unsupported image format '{image_format}'")
+    key = ImageCache.key(figure, image_format)
+    image = image_cache.get(key)
+    if image is None:
+        image = renderer_pool.render(plot_renderer.full_figure(figure), image_format)
+        image_cache.put(key, image)
+    return image, key
+
+
+def start_image_renderers():
+    """Start the pool at worker startup when IMAGE_RENDERER_WARM is set, otherwise renderers start on first use"""
+    if IMAGE_RENDERER_WARM:
+        renderer_pool.start()
+
+
+def close_image_renderers():
+    renderer_pool.close()
@@ -0,0 +1,71 @@
+import json
+import os
+from typing import Any
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+
+# auto uses orjson when it is installed, orjson requires it, json forces the standard library
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+try:
+    import orjson
+except ImportError:
+    if JSON_BACKEND == "orjson":
+        raise
+    orjson = None
+
+if JSON_BACKEND == "json":
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value: Any) -> Any:
+    """Fallback for values without a JSON form: models as their fields, anything else as its str"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return str(value)
+
+
+if orjson is not None:
+    # Non-string keys (subplot indices, numeric ids) are encoded as strings, like the standard library does
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        """Encode a value as compact UTF-8 JSON"""
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps_str(value: Any) -> str:
+        """Encode a value as a compact JSON string"""
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS).decode("utf-8")
+
+    loads = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        """Encode a value as compact UTF-8 JSON"""
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+    def dumps_str(value: Any) -> str:
+        """Encode a value as a compact JSON string"""
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def loads(data: Any) -> Any:
+        """Decode JSON from bytes or str"""
+        return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded by the JSON backend.
+
+    Endpoints that return one with a pydantic model as content skip FastAPI's
+    response_model round trip (dump, validate again, serialize, then
+    json.dumps); the model is dumped once and encoded straight to bytes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.model_dump()
+        return dumps(content)
@@ -0,0 +1,105 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.utils import json_codec
+
+
+CONTENT_TYPE_HEADER = "content-type"
+ACCEPT_HEADER = "accept"
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+CODEC_ALIASES = {
+    "json": JSON_CONTENT_TYPE,
+    "orjson": JSON_CONTENT_TYPE,
+    "msgpack": MSGPACK_CONTENT_TYPE,
+}
+
+
+class KafkaCodec:
+    """Encodes and decodes Kafka message values for one content type"""
+
+    def __init__(self, content_type: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any]):
+        self.content_type = content_type
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self) -> str:
+        return f"KafkaCodec({self.content_type!r})"
+
+
+def _json_codec() -> KafkaCodec:
+    """JSON codec, encoded by the shared JSON backend (orjson when it is installed)"""
+    return KafkaCodec(JSON_CONTENT_TYPE, json_codec.dumps, json_codec.loads)
+
+
+def _msgpack_codec() -> Optional[KafkaCodec]:
+    """Binary msgpack codec, only available when msgpack is installed"""
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return KafkaCodec(
+        MSGPACK_CONTENT_TYPE,
+        lambda v: msgpack.packb(v, use_bin_type=True),
+        lambda v: msgpack.unpackb(v, raw=False)
+    )
+
+
+# Ordered by preference: binary codecs first, JSON always last as the common fallback
+CODECS: Dict[str, KafkaCodec] = {
+    codec.content_type: codec for codec in (_msgpack_codec(), _json_codec()) if codec is not None
+}
+
+
+def get_codec(name: str = "json") -> KafkaCodec:
+    """
+    Look up a codec by short name ('json', 'orjson', 'msgpack') or content type.
+
+    Raises:
+        ValueError: If the codec is unknown or its library is not installed
+    """
+    content_type = CODEC_ALIASES.get(name.lower(), name.lower())
+    if content_type not in CODECS:
+        raise ValueError(
+            f"Kafka codec '{name}' is not available, installed codecs: {', '.join(CODECS)}"
+        )
+    return CODECS[content_type]
+
+
+def header_value(headers: Optional[Iterable[Tuple[str, bytes]]], name: str) -> Optional[str]:
+    """Return the decoded value of a Kafka message header, or None if it is missing"""
+    for key, value in headers or ():
+        if key.lower() == name:
+            return value.decode('utf-8') if isinstance(value, bytes) else value
+    return None
+
+
+def codec_for_headers(headers: Optional[Iterable[Tuple[str, bytes]]]) -> KafkaCodec:
+    """
+    Pick the codec that decodes a message from its content-type header.
+
+    Messages without the header come from services that predate codec
+    negotiation and are always JSON.
+    """
+    content_type = header_value(headers, CONTENT_TYPE_HEADER)
+    if not content_type:
+        return CODECS[JSON_CONTENT_TYPE]
+    return get_codec(content_type.split(";")[0].strip())
+
+
+def negotiate_codec(accept: Optional[str]) -> KafkaCodec:
+    """Pick the reply codec for a request from its accept header, falling back to JSON"""
+    for content_type in (accept or "").split(","):
+        content_type = content_type.split(";")[0].strip().lower()
+        if content_type in CODECS:
+            return CODECS[content_type]
+    return CODECS[JSON_CONTENT_TYPE]
+
+
+def request_headers(codec: KafkaCodec) -> List[Tuple[str, bytes]]:
+    """Headers for a request: its own content type plus every codec we can decode a reply in"""
+    return [
+        (CONTENT_TYPE_HEADER, codec.content_type.encode('utf-8')),
+        (ACCEPT_HEADER, ", ".join(CODECS).encode('utf-8')),
+    ]
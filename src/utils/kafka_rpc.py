@@ -0,0 +1,580 @@
+import asyncio
+import concurrent.futures
+import datetime
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, TopicPartition
+from aiokafka.codec import has_gzip, has_lz4, has_snappy, has_zstd
+from src.utils.kafka_codecs import KafkaCodec, codec_for_headers, get_codec, request_headers
+from src.utils.logger_factory import LoggerFactory
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+DEFAULT_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+DEFAULT_REPLY_TOPICS = [
+    topic.strip() for topic in os.getenv("KAFKA_REPLY_TOPICS", "request-topic.replay").split(",") if topic.strip()
+]
+DEFAULT_TIMEOUT = float(os.getenv("KAFKA_RPC_TIMEOUT_SECONDS", "10"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("KAFKA_RPC_MAX_CONCURRENCY", "64"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("KAFKA_RPC_MAX_IN_FLIGHT", "256"))
+BLOCKING_CALL_MARGIN = 5
+DEFAULT_CODEC = os.getenv("KAFKA_RPC_CODEC", "json")
+DEFAULT_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "")
+
+COMPRESSION_CODECS = {
+    "gzip": has_gzip,
+    "lz4": has_lz4,
+    "zstd": has_zstd,
+    "snappy": has_snappy,
+}
+
+
+class KafkaRPCOverloadedError(ConnectionError):
+    """Exception raised when a call would exceed the client's in-flight request cap."""
+    pass
+
+
+def resolve_compression(name: Optional[str]) -> Optional[str]:
+    """
+    Validate a producer compression type ('gzip', 'lz4', 'zstd', 'snappy' or empty for none).
+
+    lz4, zstd and snappy need the optional cramjam package; without it the producer
+    falls back to gzip, which is always available, instead of failing to start.
+
+    Raises:
+        ValueError: If the compression type is unknown
+    """
+    if not name or name.lower() == "none":
+        return None
+    name = name.lower()
+    if name not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported Kafka compression type: {name}")
+    if not COMPRESSION_CODECS[name]():
+        logger.warning(
+            "Kafka compression codec library not installed, falling back to gzip",
+            context={"requested": name}
+        )
+        return "gzip"
+    return name
+
+
+class ReplyDispatcher:
+    """
+    Reads the reply topics once per worker and hands each reply to the caller waiting on its key.
+
+    Waiters are kept in a dict keyed by correlation id, so routing a reply is a single
+    lookup no matter how many calls are in flight or how busy the reply topic is.
+    The loop awaits one message at a time, so a reply is delivered as soon as the
+    consumer fetches it rather than on a poll interval.
+
+    Message values arrive as raw bytes and are only decoded, with the codec named
+    in their content-type header, once the key matches a waiting call.
+    """
+
+    def __init__(self, consumer: AIOKafkaConsumer):
+        self._consumer = consumer
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.unmatched = 0
+        self.errors = 0
+
+    def register(self, correlation_id: str) -> asyncio.Future:
+        """Create the Future that will receive the reply for this correlation id"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[correlation_id] = future
+        return future
+
+    def discard(self, correlation_id: str):
+        """Forget a waiter once its call has finished or timed out"""
+        self._waiters.pop(correlation_id, None)
+
+    @property
+    def pending(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "delivered": self.delivered,
+            "unmatched": self.unmatched,
+            "errors": self.errors
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, error: Exception = None):
+        """Stop reading replies and fail every call that is still waiting"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        error = error or ConnectionError("Kafka RPC client stopped")
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(error)
+        self._waiters.clear()
+
+    def dispatch(self, message) -> bool:
+        """
+        Route one reply message to its waiter.
+
+        Replies nobody is waiting for (late replies after a timeout, or replies for
+        another worker) are only counted.
+
+        Returns:
+            bool: True if the reply was delivered to a waiting caller
+        """
+        future = self._waiters.get(message.key)
+        if future is None or future.done():
+            self.unmatched += 1
+            return False
+        try:
+            value = codec_for_headers(message.headers).decode(message.value)
+        except Exception as e:
+            self.errors += 1
+            future.set_exception(ValueError(f"Could not decode Kafka reply: {str(e)}"))
+            return False
+        future.set_result(value)
+        self.delivered += 1
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                message = await self._consumer.getone()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error reading Kafka replies", exception=e)
+                await asyncio.sleep(1)
+                continue
+
+            self.dispatch(message)
+
+
+class KafkaRPCClient:
+    """
+    Long-lived Kafka request/reply client shared by every call made from one worker.
+
+    A single producer sends requests and a single consumer reads the reply topics.
+    Each call registers a Future under its correlation id with the ReplyDispatcher,
+    which resolves it when a message with the matching key arrives.
+
+    The reply consumer runs without a consumer group and is positioned at the end
+    of every reply partition before the first request is sent, so no replies are
+    missed and no per-request groups are left behind on the broker.
+    """
+
+    def __init__(self, bootstrap_servers: str = None, reply_topics: Optional[Iterable[str]] = None,
+                 producer_factory: Callable[..., AIOKafkaProducer] = AIOKafkaProducer,
+                 consumer_factory: Callable[..., AIOKafkaConsumer] = AIOKafkaConsumer,
+                 max_concurrency: int = None, max_in_flight: int = None,
+                 codec: str = None, compression_type: str = None):
+        """
+        Args:
+            bootstrap_servers: Kafka bootstrap servers (default: KAFKA_BOOTSTRAP_SERVERS)
+            reply_topics: Reply topics to listen on from startup (default: KAFKA_REPLY_TOPICS)
+            producer_factory: Builds the producer from aiokafka keyword arguments,
+                replaceable with a local stand-in for benchmarks
+            consumer_factory: Builds the reply consumer from aiokafka keyword arguments
+            max_concurrency: Calls allowed to be sent and awaiting a reply at once; further
+                calls queue (default: KAFKA_RPC_MAX_CONCURRENCY)
+            max_in_flight: Calls allowed to be running or queued at once; further calls fail
+                fast with KafkaRPCOverloadedError (default: KAFKA_RPC_MAX_IN_FLIGHT)
+            codec: Codec for request payloads, 'json', 'orjson' or 'msgpack'; replies are
+                decoded by their content-type header (default: KAFKA_RPC_CODEC)
+            compression_type: Producer compression, 'gzip', 'lz4', 'zstd', 'snappy' or
+                empty for none (default: KAFKA_COMPRESSION)
+        """
+        self.bootstrap_servers = bootstrap_servers or DEFAULT_BOOTSTRAP_SERVERS
+        self.reply_topics: List[str] = list(reply_topics or DEFAULT_REPLY_TOPICS)
+        self._producer_factory = producer_factory
+        self._consumer_factory = consumer_factory
+        self._producer = None
+        self._consumer = None
+        self._assigned_topics: Set[str] = set()
+        self._dispatcher: Optional[ReplyDispatcher] = None
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.max_in_flight = max(max_in_flight or DEFAULT_MAX_IN_FLIGHT, self.max_concurrency)
+        self._concurrency = asyncio.Semaphore(self.max_concurrency)
+        self.codec: KafkaCodec = get_codec(codec or DEFAULT_CODEC)
+        self.compression_type = resolve_compression(
+            DEFAULT_COMPRESSION if compression_type is None else compression_type
+        )
+        self._headers = request_headers(self.codec)
+        self._in_flight = 0
+        self.rejected = 0
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self):
+        """Start the producer, position the reply consumer and launch the reply loop"""
+        async with self._start_lock:
+            if self._started:
+                return
+
+            # Remember the owning loop even if the broker is down, so call_blocking()
+            # can still schedule a call that retries the start
+            self._loop = asyncio.get_running_loop()
+            # Values are encoded by self.codec and decoded lazily by the ReplyDispatcher
+            self._producer = self._producer_factory(
+                bootstrap_servers=self.bootstrap_servers,
+                compression_type=self.compression_type,
+                key_serializer=lambda k: k.encode('utf-8') if isinstance(k, str) else k
+            )
+            self._consumer = self._consumer_factory(
+                bootstrap_servers=self.bootstrap_servers,
+                group_id=None,  # No group: nothing to join, rebalance or leave orphaned
+                enable_auto_commit=False,
+                auto_offset_reset='latest',
+                key_deserializer=lambda k: k.decode('utf-8') if k else None
+            )
+
+            try:
+                await self._producer.start()
+                await self._consumer.start()
+                await self._assign_reply_topics(self.reply_topics)
+            except Exception:
+                await self._close_connections()
+                raise
+
+            self._dispatcher = ReplyDispatcher(self._consumer)
+            self._dispatcher.start()
+            self._started = True
+            logger.notice(
+                "Kafka RPC client started",
+                context={"bootstrap_servers": self.bootstrap_servers, "reply_topics": self.reply_topics}
+            )
+
+    async def stop(self):
+        """Stop the reply loop, fail pending calls and close the connections"""
+        async with self._start_lock:
+            if not self._started:
+                return
+            self._started = False
+
+            if self._dispatcher:
+                await self._dispatcher.stop()
+            self._assigned_topics.clear()
+
+            await self._close_connections()
+            logger.notice("Kafka RPC client stopped", context={"bootstrap_servers": self.bootstrap_servers})
+
+    async def _close_connections(self):
+        for client in (self._producer, self._consumer):
+            if client is None:
+                continue
+            try:
+                await client.stop()
+            except Exception as e:
+                logger.error("Error closing Kafka connection", exception=e)
+        # aiokafka clients cannot be restarted, fresh ones are built on the next start()
+        self._producer = None
+        self._consumer = None
+
+    async def _assign_reply_topics(self, topics: Iterable[str]):
+        """
+        Assign every partition of the given reply topics to the consumer and seek to the end.
+
+        Partitions that were already assigned keep their current position, so replies
+        that arrived while the assignment changes are still delivered.
+        """
+        await self._consumer.topics()  # Refresh cluster metadata
+
+        previous = self._consumer.assignment()
+        positions = {tp: await self._consumer.position(tp) for tp in previous}
+
+        partitions = set(previous)
+        new_partitions = []
+        for topic in topics:
+            partition_ids = self._consumer.partitions_for_topic(topic)
+            if not partition_ids:
+                logger.warning("Kafka reply topic has no partitions yet", context={"topic": topic})
+                continue
+            self._assigned_topics.add(topic)
+            for partition_id in partition_ids:
+                tp = TopicPartition(topic, partition_id)
+                if tp not in partitions:
+                    partitions.add(tp)
+                    new_partitions.append(tp)
+
+        if not new_partitions:
+            return
+
+        self._consumer.assign(list(partitions))
+        for tp, offset in positions.items():
+            self._consumer.seek(tp, offset)
+        await self._consumer.seek_to_end(*new_partitions)
+        # Resolve the end offsets now so a reply produced right after the request is not skipped
+        for tp in new_partitions:
+            await self._consumer.position(tp)
+
+    async def _ensure_reply_topic(self, topic: str):
+        if topic in self._assigned_topics:
+            return
+        async with self._start_lock:
+            if topic in self._assigned_topics:
+                return
+            await self._assign_reply_topics([topic])
+            if topic not in self.reply_topics:
+                self.reply_topics.append(topic)
+
+    def stats(self) -> Dict[str, Any]:
+        """Reply dispatch counters for this worker"""
+        stats = self._dispatcher.stats() if self._dispatcher else {}
+        return {
+            "started": self._started,
+            "reply_topics": list(self._assigned_topics),
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rejected": self.rejected,
+            "codec": self.codec.content_type,
+            "compression": self.compression_type,
+            **stats
+        }
+
+    @contextmanager
+    def _admit(self, count: int = 1):
+        """Reserve in-flight slots for the duration of a call or fail fast when the cap is reached"""
+        if self._in_flight + count > self.max_in_flight:
+            self.rejected += count
+            raise KafkaRPCOverloadedError(
+                f"Kafka RPC client is at its in-flight cap ({self.max_in_flight} requests)"
+            )
+        self._in_flight += count
+        try:
+            yield
+        finally:
+            self._in_flight -= count
+
+    async def call(self, request_topic: str, response_topic: str, request_data: Dict[str, Any],
+                   timeout: float = None) -> Dict[str, Any]:
+        """
+        Send a request and wait for the reply carrying the same correlation id.
+
+        Args:
+            request_topic: The Kafka topic to send the request to
+            response_topic: The Kafka topic the service replies on
+            request_data: The data to send in the request
+            timeout: Maximum time to wait for a response in seconds
+
+        Returns:
+            dict: The response data from the Kafka response topic
+
+        Raises:
+            TimeoutError: If no response is received within the timeout period
+            ConnectionError: If the client is stopped while the call is pending
+        """
+        timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        with self._admit():
+            async with self._concurrency:
+                await self._ensure_ready(response_topic)
+
+                correlation_id = str(uuid.uuid4())
+                dispatcher = self._dispatcher
+                future = dispatcher.register(correlation_id)
+
+                try:
+                    await self._producer.send_and_wait(
+                        topic=request_topic,
+                        key=correlation_id,
+                        value=self._encode_payload(request_data, correlation_id, response_topic),
+                        headers=self._headers
+                    )
+                    return await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"No response received within {timeout} seconds for correlation_id: {correlation_id}")
+                finally:
+                    dispatcher.discard(correlation_id)
+
+    def call_blocking(self, request_topic: str, response_topic: str, request_data: Dict[str, Any],
+                      timeout: float = None) -> Dict[str, Any]:
+        """
+        Blocking form of call() for synchronous code running in a worker thread.
+
+        The request is scheduled on the event loop that owns this client and the
+        calling thread waits for the result, so sync tool functions can reach backend
+        services over Kafka while the loop keeps serving other requests. Calling it
+        from the event loop thread itself would deadlock and raises instead.
+
+        Raises:
+            RuntimeError: If called from the event loop thread
+            ConnectionError: If the client was never started on an event loop
+            TimeoutError: If no response is received within the timeout period
+            KafkaRPCOverloadedError: If the in-flight cap is reached
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            raise ConnectionError("Kafka RPC client is not running on an event loop")
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            raise RuntimeError("call_blocking() would block the event loop, await call() instead")
+
+        timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        future = asyncio.run_coroutine_threadsafe(
+            self.call(request_topic, response_topic, request_data, timeout), loop
+        )
+        try:
+            # call() enforces the timeout itself; the margin covers queueing for a concurrency slot
+            return future.result(timeout + BLOCKING_CALL_MARGIN)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"No response received within {timeout} seconds")
+
+    async def call_many(self, request_topic: str, response_topic: str, requests: List[Dict[str, Any]],
+                        timeout: float = None) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Send a burst of requests and yield each reply as soon as it arrives.
+
+        Requests are handed to the producer without waiting for each other's delivery,
+        so the burst shares the producer's batching and flushes instead of paying one
+        broker round trip per request. Like call(), every request holds one of the
+        max_concurrency slots from send until its reply, so at most that many are
+        outstanding and the rest are sent as replies free slots. A request takes its
+        in-flight slot when it gets a concurrency slot, so a burst of any size is never
+        rejected as a whole; a request that finds the in-flight cap reached is yielded
+        with KafkaRPCOverloadedError. Each request has its own timeout, and a request
+        that fails or times out is yielded with its error without failing the others.
+
+        Args:
+            request_topic: The Kafka topic to send the requests to
+            response_topic: The Kafka topic the service replies on
+            requests: The data to send, one dict per request
+            timeout: Maximum time to wait for each response in seconds
+
+        Yields:
+            tuple: (index into requests, response data or None, exception or None)
+        """
+        timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+        async for reply in self._call_many(request_topic, response_topic, requests, timeout):
+            yield reply
+
+    async def _call_many(self, request_topic: str, response_topic: str, requests: List[Dict[str, Any]],
+                         timeout: float) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        await self._ensure_ready(response_topic)
+
+        dispatcher = self._dispatcher
+        correlation_ids = [str(uuid.uuid4()) for _ in requests]
+        futures = [dispatcher.register(correlation_id) for correlation_id in correlation_ids]
+        waiters: List[asyncio.Task] = []
+
+        async def request_reply(index: int):
+            # Each request holds a concurrency and an in-flight slot from send to reply, like call() does
+            async with self._concurrency:
+                try:
+                    with self._admit():
+                        delivery = await self._producer.send(
+                            topic=request_topic,
+                            key=correlation_ids[index],
+                            value=self._encode_payload(requests[index], correlation_ids[index], response_topic),
+                            headers=self._headers
+                        )
+                        await delivery
+                        return index, await asyncio.wait_for(futures[index], timeout), None
+                except asyncio.TimeoutError:
+                    return index, None, TimeoutError(
+                        f"No response received within {timeout} seconds for correlation_id: {correlation_ids[index]}"
+                    )
+                except Exception as e:
+                    return index, None, e
+
+        try:
+            waiters = [asyncio.ensure_future(request_reply(i)) for i in range(len(requests))]
+            for next_reply in asyncio.as_completed(waiters):
+                yield await next_reply
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+            for correlation_id in correlation_ids:
+                dispatcher.discard(correlation_id)
+
+    async def _ensure_ready(self, response_topic: str):
+        if not self._started:
+            await self.start()
+        await self._ensure_reply_topic(response_topic)
+
+    def _encode_payload(self, request_data: Dict[str, Any], correlation_id: str, response_topic: str) -> bytes:
+        return self.codec.encode({
+            **request_data,
+            'correlation_id': correlation_id,
+            'response_topic': response_topic,
+            'timestamp': datetime.datetime.now().isoformat()
+        })
+
+
+_client: Optional[KafkaRPCClient] = None
+
+
+def get_kafka_client(bootstrap_servers: str = None) -> KafkaRPCClient:
+    """
+    Return this worker's shared Kafka RPC client, creating it on first use.
+
+    Args:
+        bootstrap_servers: Only used when the client is created (default: KAFKA_BOOTSTRAP_SERVERS)
+    """
+    global _client
+    if _client is None:
+        _client = KafkaRPCClient(bootstrap_servers=bootstrap_servers)
+    return _client
+
+
+async def start_kafka_client():
+    """
+    Start the shared client from the application lifespan.
+
+    A broker that is unreachable at startup must not stop the API from serving
+    /query, so failures are logged and the client is started again on first use.
+    """
+    try:
+        await get_kafka_client().start()
+    except Exception as e:
+        logger.error("Kafka RPC client failed to start, will retry on first call", exception=e)
+
+
+async def stop_kafka_client():
+    """Stop the shared client from the application lifespan"""
+    global _client
+    if _client is not None:
+        await _client.stop()
+        _client = None
+
+
+def kafka_call(request_topic: str, response_topic: str, request_data: Dict[str, Any],
+               timeout: float = None) -> Dict[str, Any]:
+    """
+    Blocking Kafka request/reply call for synchronous tool functions.
+
+    Tool functions run in the threadpool, so this hands the request to the shared
+    client on the worker's event loop and waits for the reply in the calling thread.
+
+    Args:
+        request_topic: The Kafka topic to send the request to
+        response_topic: The Kafka topic the service replies on
+        request_data: The data to send in the request
+        timeout: Maximum time to wait for a response in seconds
+
+    Returns:
+        dict: The response data from the Kafka response topic
+    """
+    return get_kafka_client().call_blocking(request_topic, response_topic, request_data, timeout)
@@ -0,0 +1,304 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+from src.utils.model_router import call_cost
+from src.utils.tokens import count_message_tokens, usage_tokens
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# Organisation-wide limits as "model=requests_per_minute:tokens_per_minute,...", 0 or unset means unlimited
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# Every worker enforces its share of the organisation limits; gunicorn_config exports the worker count
+LLM_RATE_LIMIT_WORKERS = max(int(os.getenv("GUNICORN_WORKERS", "1")), 1)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "500"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "2"))
+DEFAULT_RETRY_AFTER = 1.0
+
+# Lower runs first: finishing a query that already spent LLM calls beats starting a new one
+PRIORITY_IN_PROGRESS = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+
+class LLMOverloadedError(Exception):
+    """Exception raised when an LLM call is shed instead of queued."""
+
+    def __init__(self, message: str, retry_after: float = DEFAULT_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse LLM_RATE_LIMITS into {model: (requests_per_minute, tokens_per_minute)}.
+
+    Raises:
+        ValueError: If an entry is not of the form model=requests:tokens
+    """
+    limits = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        try:
+            model, numbers = entry.split("=", 1)
+            requests, tokens = numbers.split(":", 1)
+            limits[model.strip()] = (float(requests), float(tokens))
+        except ValueError:
+            raise ValueError(f"Invalid LLM_RATE_LIMITS entry '{entry}', expected model=requests:tokens")
+    return limits
+
+
+class TokenBucket:
+    """Refills continuously at a per-minute rate up to one minute of burst; a rate of 0 never limits"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken, 0 if it can be taken now"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        # A single call larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Take amount from the bucket; negative amounts refund, and the balance may go into debt"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class LLMAdmissionController:
+    """
+    Admission control for one model in this worker.
+
+    Calls wait in a priority queue until the request and token buckets allow them
+    and fewer than max_concurrency calls are running. When the queue is full a new
+    call either replaces the lowest-priority waiter or is rejected straight away,
+    and a waiter that cannot start within queue_timeout is rejected too; both
+    raise LLMOverloadedError so the request fails fast instead of timing out.
+    A 429 from the provider pauses the whole queue for its retry-after time.
+    """
+
+    def __init__(self, model: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._queue: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _shed(self, reason: str) -> LLMOverloadedError:
+        metrics.incr("llm_shed", model=self.model, reason=reason)
+        retry_after = max(self._paused_until - time.monotonic(), DEFAULT_RETRY_AFTER)
+        return LLMOverloadedError(f"{self.model} is overloaded ({reason}), try again later", retry_after)
+
+    def _enqueue(self, tokens: float, priority: int) -> asyncio.Future:
+        if len(self._queue) >= self.max_queue:
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                raise self._shed("queue_full")
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[3].set_exception(self._shed("preempted"))
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), tokens, future))
+        return future
+
+    def _remove(self, future: asyncio.Future):
+        for entry in self._queue:
+            if entry[3] is future:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                break
+
+    def _dispatch(self):
+        """Start as many queued calls as concurrency, rate limits and any provider pause allow"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue and self._in_flight < self.max_concurrency:
+            _, _, tokens, future = self._queue[0]
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self._requests.wait_time(1),
+                self._tokens.wait_time(tokens)
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+            heapq.heappop(self._queue)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._in_flight += 1
+            future.set_result(None)
+        metrics.set_gauge("llm_queue_depth", len(self._queue), model=self.model)
+        metrics.set_gauge("llm_in_flight", self._in_flight, model=self.model)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tokens: float, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Wait for a slot to call the model.
+
+        Args:
+            tokens: Estimated prompt plus completion tokens of the call
+            priority: One of the PRIORITY_* constants, lower runs first
+
+        Raises:
+            LLMOverloadedError: If the call is shed instead of queued
+        """
+        queued_at = time.monotonic()
+        future = self._enqueue(tokens, priority)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove(future)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            raise self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            self._remove(future)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            raise
+        finally:
+            metrics.observe("llm_queue_wait_seconds", time.monotonic() - queued_at, model=self.model)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def settle(self, estimated: float, actual: float):
+        """Correct the token bucket once the real usage of a call is known"""
+        self._tokens.consume(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Hold every queued call for seconds after the provider rate limited us"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue),
+            "in_flight": self._in_flight,
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 3),
+        }
+
+
+_controllers: Dict[str, LLMAdmissionController] = {}
+_rate_limits = parse_rate_limits(LLM_RATE_LIMITS)
+
+
+def get_admission_controller(model: str) -> LLMAdmissionController:
+    """Return this worker's admission controller for a model, creating it on first use"""
+    controller = _controllers.get(model)
+    if controller is None:
+        requests_per_minute, tokens_per_minute = _rate_limits.get(model, (0, 0))
+        controller = _controllers[model] = LLMAdmissionController(
+            model,
+            requests_per_minute=requests_per_minute / LLM_RATE_LIMIT_WORKERS,
+            tokens_per_minute=tokens_per_minute / LLM_RATE_LIMIT_WORKERS
+        )
+    return controller
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    return {model: controller.stats() for model, controller in _controllers.items()}
+
+
+def _retry_after(error: openai.RateLimitError) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return DEFAULT_RETRY_AFTER
+
+
+async def ainvoke(llm: Any, messages: List[Any], model: str, priority: int = PRIORITY_INTERACTIVE,
+                  expected_output_tokens: int = LLM_EXPECTED_OUTPUT_TOKENS) -> Any:
+    """
+    Call a chat model through its admission controller.
+
+    The chat models are built with max_retries=0; rate limit retries happen here
+    instead, after the whole queue has been paused for the provider's retry-after,
+    so concurrent calls back off together rather than each retrying on its own.
+
+    Args:
+        llm: A ChatOpenAI instance, optionally with tools bound
+        messages: The messages to send
+        model: Model name, selects the admission controller
+        priority: One of the PRIORITY_* constants
+        expected_output_tokens: Completion tokens to reserve before the real usage is known
+
+    Returns:
+        The model response
+
+    Raises:
+        LLMOverloadedError: If the call is shed or the provider keeps rate limiting
+    """
+    controller = get_admission_controller(model)
+    estimated = count_message_tokens(messages) + expected_output_tokens
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        async with controller.admit(estimated, priority):
+            started_at = time.monotonic()
+            try:
+                response = await llm.ainvoke(messages)
+            except openai.RateLimitError as e:
+                retry_after = _retry_after(e)
+                controller.pause(retry_after)
+                metrics.incr("llm_rate_limited", model=model)
+                logger.warning(
+                    "LLM provider rate limit hit, pausing queue",
+                    context={"model": model, "retry_after": retry_after, "attempt": attempt}
+                )
+                continue
+        metrics.observe("llm_call_seconds", time.monotonic() - started_at, model=model)
+        usage = usage_tokens(response)
+        if usage["input_tokens"]:
+            controller.settle(estimated, usage["input_tokens"] + usage["output_tokens"])
+            metrics.incr("llm_cost_usd", call_cost(model, usage), model=model)
+        return response
+    raise LLMOverloadedError(f"{model} is rate limited by the provider", controller.stats()["paused_for"])
@@ -1,12 +1,53 @@
+import gzip
 import json
 import os
 import uuid
 from abc import ABC, abstractmethod
 from datetime import datetime
 import logging
+import threading
 from typing import Dict, Any, List, Optional
 from enum import Enum
 
+from src.utils import json_codec
+
+# Axiom clients by token: every logger of the worker, including the per-request
+# ones, shares one client and with it one pooled HTTP session
+_axiom_clients: Dict[str, Any] = {}
+_axiom_clients_lock = threading.Lock()
+
+
+def _axiom_client(token: str):
+    with _axiom_clients_lock:
+        client = _axiom_clients.get(token)
+        if client is None:
+            from axiom_py import Client
+            client = Client(token=token)
+            _axiom_clients[token] = client
+        return client
+
+
+def _encode_events(events: List[Dict[str, Any]]) -> bytes:
+    """Gzipped NDJSON of the events, each encoded once by the JSON backend"""
+    return gzip.compress(b"\n".join(json_codec.dumps(event) for event in events), compresslevel=1)
+
+
+def _ingest(client, dataset: str, events: List[Dict[str, Any]]):
+    """
+    Send events to Axiom pre-encoded. axiom-py's ingest_events would run its
+    own ndjson pass over them and gzip at level 9.
+    """
+    from axiom_py.client import ContentEncoding, ContentType
+    client.ingest(dataset, _encode_events(events), ContentType.NDJSON, ContentEncoding.GZIP)
+
+
+def close_log_sinks():
+    """Close the shared Axiom sessions on worker shutdown"""
+    with _axiom_clients_lock:
+        for client in _axiom_clients.values():
+            client.session.close()
+        _axiom_clients.clear()
+
 class LogLevel(str, Enum):
     """Log levels enum matching standard syslog severity levels"""
     DEBUG = "DEBUG"
@@ -75,8 +116,7 @@ class AxiomLogger(LoggerInterface):
             raise ValueError("Axiom token not provided or found in environment variables")
         
         try:
-            from axiom_py import Client
-            self.client = Client(token=self.token)
+            self.client = _axiom_client(self.token)
             logging.info(f"Axiom logger initialized for service '{service_name}' and dataset '{self.dataset}'")
         except ImportError:
             raise ImportError("Could not import axiom_py. Ensure 'axiom-py' is installed.")
@@ -108,7 +148,7 @@ class AxiomLogger(LoggerInterface):
         # Create the log entry
         log_data = {
             "message": message,
-            "context": json.dumps(context_data),
+            "context": json_codec.dumps_str(context_data),
             "level": level,
             "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00"),
             "service": self.service_name
@@ -119,11 +159,10 @@ class AxiomLogger(LoggerInterface):
     def _send_log(self, log_data: Dict[str, Any]):
         """Send log data to Axiom"""
         try:
-            
-            self.client.ingest_events(dataset=self.dataset, events=[log_data])
+            _ingest(self.client, self.dataset, [log_data])
         except Exception as e:
             # Fallback to console logging if Axiom fails
-            fallback_msg = f"Failed to send log to Axiom: {str(e)}\nLog data: {json.dumps(log_data, indent=2)}"
+            fallback_msg = f"Failed to send log to Axiom: {str(e)}\nLog data: {json.dumps(log_data, indent=2, default=str)}"
             print(fallback_msg)
     
     def debug(self, message: str, context: Dict[str, Any] = None):
@@ -191,13 +230,18 @@ class ConsoleLogger(LoggerInterface):
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
     
-    def _format_message(self, message: str, context: Dict[str, Any] = None, exception: Exception = None) -> str:
-        """Format message with context and exception details for console"""
+    def _format_message(self, message: str, context: Dict[str, Any] = None, exception: Exception = None,
+                        extra: Any = None) -> str:
+        """Format message with context, extra fields and exception details for console"""
         log_parts = [message]
         
         # Add context as JSON if available, but skip additional_fields
         if context:
-            log_parts.append(f"Context: {json.dumps(context)}")
+            log_parts.append(f"Context: {json_codec.dumps_str(context)}")
+        
+        # Same extra fields the protocol logger accepts
+        if extra:
+            log_parts.append(f"Extra: {extra if isinstance(extra, str) else json_codec.dumps_str(extra)}")
         
         # Add exception info if available
         if exception:
@@ -205,34 +249,35 @@ class ConsoleLogger(LoggerInterface):
         
         return " | ".join(log_parts)
     
-    def _log(self, level: LogLevel, message: str, context: Dict[str, Any] = None, exception: Exception = None):
+    def _log(self, level: LogLevel, message: str, context: Dict[str, Any] = None, exception: Exception = None,
+             extra: Any = None):
         """Generic logging method for all levels"""
-        formatted_message = self._format_message(message, context, exception)
+        formatted_message = self._format_message(message, context, exception, extra)
         self.logger.log(self._LEVEL_MAP[level], formatted_message)
     
-    def debug(self, message: str, context: Dict[str, Any] = None):
-        self._log(LogLevel.DEBUG, message, context)
+    def debug(self, message: str, context: Dict[str, Any] = None, extra: Any = None):
+        self._log(LogLevel.DEBUG, message, context, extra=extra)
     
-    def info(self, message: str, context: Dict[str, Any] = None):
-        self._log(LogLevel.INFO, message, context)
+    def info(self, message: str, context: Dict[str, Any] = None, extra: Any = None):
+        self._log(LogLevel.INFO, message, context, extra=extra)
     
-    def notice(self, message: str, context: Dict[str, Any] = None):
-        self._log(LogLevel.NOTICE, message, context)
+    def notice(self, message: str, context: Dict[str, Any] = None, extra: Any = None):
+        self._log(LogLevel.NOTICE, message, context, extra=extra)
     
-    def warning(self, message: str, context: Dict[str, Any] = None):
-        self._log(LogLevel.WARNING, message, context)
+    def warning(self, message: str, context: Dict[str, Any] = None, extra: Any = None):
+        self._log(LogLevel.WARNING, message, context, extra=extra)
     
-    def error(self, message: str, context: Dict[str, Any] = None, exception: Exception = None):
-        self._log(LogLevel.ERROR, message, context, exception)
+    def error(self, message: str, context: Dict[str, Any] = None, exception: Exception = None, extra: Any = None):
+        self._log(LogLevel.ERROR, message, context, exception, extra)
     
-    def critical(self, message: str, context: Dict[str, Any] = None, exception: Exception = None):
-        self._log(LogLevel.CRITICAL, message, context, exception)
+    def critical(self, message: str, context: Dict[str, Any] = None, exception: Exception = None, extra: Any = None):
+        self._log(LogLevel.CRITICAL, message, context, exception, extra)
     
-    def alert(self, message: str, context: Dict[str, Any] = None, exception: Exception = None):
-        self._log(LogLevel.ALERT, message, context, exception)
+    def alert(self, message: str, context: Dict[str, Any] = None, exception: Exception = None, extra: Any = None):
+        self._log(LogLevel.ALERT, message, context, exception, extra)
     
-    def emergency(self, message: str, context: Dict[str, Any] = None, exception: Exception = None):
-        self._log(LogLevel.EMERGENCY, message, context, exception)
+    def emergency(self, message: str, context: Dict[str, Any] = None, exception: Exception = None, extra: Any = None):
+        self._log(LogLevel.EMERGENCY, message, context, exception, extra)
 
 
 # NEW PROTOCOL-COMPLIANT AXIOM LOGGER (using existing interface)
@@ -261,8 +306,7 @@ class ProtocolAxiomLogger(LoggerInterface):
             raise ValueError("Axiom token not provided or found in environment variables")
         
         try:
-            from axiom_py import Client
-            self.client = Client(token=self.token)
+            self.client = _axiom_client(self.token)
             logging.info(f"Protocol Axiom logger initialized for service '{service_name}' and dataset '{self.dataset}'")
         except ImportError:
             raise ImportError("Could not import axiom_py. Ensure 'axiom-py' is installed.")
@@ -306,7 +350,8 @@ class ProtocolAxiomLogger(LoggerInterface):
             "message": message,
             "context": context_data,  # Keep as dict, not stringified
             "level": level,
-            "extra": json.dumps(extra) if extra else "",
+            # Encoded once here; a string is taken as already encoded
+            "extra": (extra if isinstance(extra, str) else json_codec.dumps_str(extra)) if extra else "",
             "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00"),
             "environment": self.environment,
             "service": self.service_name
@@ -321,10 +366,10 @@ class ProtocolAxiomLogger(LoggerInterface):
     def _send_protocol_log(self, log_data: Dict[str, Any]):
         """Send protocol log data to Axiom"""
         try:
-            self.client.ingest_events(dataset=self.dataset, events=[log_data])
+            _ingest(self.client, self.dataset, [log_data])
         except Exception as e:
             # Fallback to console logging if Axiom fails
-            fallback_msg = f"Failed to send protocol log to Axiom: {str(e)}\nLog data: {json.dumps(log_data, indent=2)}"
+            fallback_msg = f"Failed to send protocol log to Axiom: {str(e)}\nLog data: {json.dumps(log_data, indent=2, default=str)}"
             print(fallback_msg)
     
     def debug(self, message: str, context: Dict[str, Any] = None, extra: Dict[str, Any] = None):
@@ -0,0 +1,190 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# The lag probe is a sleeping task and costs next to nothing, so it is on by default
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+# Diagnostics mode: a watchdog thread captures the stack of whatever blocks the loop
+LOOP_MONITOR_CAPTURE_STACKS = os.getenv("LOOP_MONITOR_CAPTURE_STACKS", "false").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.05"))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.1"))
+LOOP_BLOCK_HISTORY = int(os.getenv("LOOP_BLOCK_HISTORY", "50"))
+STACK_DEPTH = 30
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _is_project_frame(filename: str) -> bool:
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+
+
+class EventLoopMonitor:
+    """
+    Measures event-loop lag and catches the code that blocks the loop.
+
+    A probe task sleeps for interval seconds and records how late it wakes up
+    as the event_loop_lag_seconds histogram; lag above threshold counts as a
+    block. With capture_stacks a watchdog thread also checks the probe's
+    heartbeat and, once the loop has been stuck for threshold seconds, records
+    the loop thread's stack while the blocking call is still running, so the
+    culprit is the frame that blocked rather than whatever ran next. Blocks that
+    happen during a garbage collection are tagged with its generation, since
+    their stack is just whatever allocation triggered it; collection pauses are
+    recorded as gc_pause_seconds.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD,
+                 capture_stacks: bool = LOOP_MONITOR_CAPTURE_STACKS, history: int = LOOP_BLOCK_HISTORY):
+        self.interval = interval
+        self.threshold = threshold
+        self.capture_stacks = capture_stacks
+        self.blocks: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._heartbeat = time.monotonic()
+        self._current_block: Optional[Dict[str, Any]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._gc_generation: Optional[int] = None
+        self._gc_started = 0.0
+        self._gc_pauses: Deque[Tuple[int, float]] = deque(maxlen=1024)
+
+    def start(self):
+        """Start monitoring the running loop; call from the lifespan"""
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        gc.callbacks.append(self._on_gc)
+        if self.capture_stacks:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logger.info("Event loop monitor started", context={
+            "interval": self.interval, "threshold": self.threshold, "capture_stacks": self.capture_stacks
+        })
+
+    async def stop(self):
+        self._stopped.set()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _probe(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - started - self.interval, 0.0)
+            metrics.observe("event_loop_lag_seconds", lag)
+            while self._gc_pauses:
+                generation, pause = self._gc_pauses.popleft()
+                metrics.observe("gc_pause_seconds", pause, generation=generation)
+            with self._lock:
+                self._heartbeat = now
+                block, self._current_block = self._current_block, None
+            if lag >= self.threshold:
+                self._record_block(lag, block)
+
+    def _on_gc(self, phase: str, info: Dict[str, Any]):
+        # Runs inside the collection, possibly while a thread holds the metrics lock, so only
+        # plain appends here; the probe moves the pauses into the metrics
+        if phase == "start":
+            self._gc_started = time.monotonic()
+            self._gc_generation = info["generation"]
+        elif self._gc_generation is not None:
+            self._gc_pauses.append((self._gc_generation, time.monotonic() - self._gc_started))
+            self._gc_generation = None
+
+    def _record_block(self, lag: float, block: Optional[Dict[str, Any]]):
+        metrics.incr("event_loop_blocks")
+        metrics.observe("event_loop_block_seconds", lag)
+        block = block or {"at": time.time() - lag, "stack": None, "culprit": None, "gc_generation": None}
+        block["blocked_seconds"] = round(lag, 4)
+        with self._lock:
+            self.blocks.append(block)
+        logger.warning("Event loop blocked", context={
+            "blocked_seconds": block["blocked_seconds"], "culprit": block["culprit"],
+            "gc_generation": block["gc_generation"]
+        })
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 4):
+            with self._lock:
+                stalled = time.monotonic() - self._heartbeat - self.interval
+                if stalled < self.threshold or self._current_block is not None:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            block = {"at": time.time() - stalled, "gc_generation": self._gc_generation, **self._describe(frame)}
+            with self._lock:
+                # The probe may have woken up while the stack was being taken
+                if time.monotonic() - self._heartbeat - self.interval >= self.threshold:
+                    self._current_block = block
+
+    @staticmethod
+    def _describe(frame) -> Dict[str, Any]:
+        summary = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        culprit = next((entry for entry in reversed(summary) if _is_project_frame(entry.filename)), None)
+        return {
+            "stack": [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in summary],
+            "culprit": f"{os.path.relpath(culprit.filename, PROJECT_ROOT)}:{culprit.lineno} in {culprit.name}" if culprit else None,
+        }
+
+    def lag_stats(self) -> Dict[str, Any]:
+        return {
+            "samples": metrics.observations("event_loop_lag_seconds"),
+            "p50_ms": round(metrics.percentile("event_loop_lag_seconds", 0.50) * 1000, 3),
+            "p99_ms": round(metrics.percentile("event_loop_lag_seconds", 0.99) * 1000, 3),
+            "max_ms": round(metrics.percentile("event_loop_lag_seconds", 1.0) * 1000, 3),
+        }
+
+    def stats(self, include_stacks: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            blocks = list(self.blocks)
+        if not include_stacks:
+            blocks = [{k: v for k, v in block.items() if k != "stack"} for block in blocks]
+        return {
+            "running": self._task is not None,
+            "capture_stacks": self.capture_stacks,
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "lag": self.lag_stats(),
+            "blocks": int(metrics.counter("event_loop_blocks")),
+            "recent_blocks": blocks,
+        }
+
+
+loop_monitor = EventLoopMonitor()
+
+
+def start_loop_monitor():
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+
+async def stop_loop_monitor():
+    await loop_monitor.stop()
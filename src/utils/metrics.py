@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+
+# Observations kept per histogram for percentile estimates
+HISTOGRAM_WINDOW = 1024
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_key(key: Tuple[str, Tuple[Tuple[str, str], ...]]) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MetricsRegistry:
+    """
+    Process-local counters, gauges and histograms.
+
+    Every gunicorn worker keeps its own registry; the /metrics endpoint reports the
+    worker that served it. Histograms keep a sliding window of recent observations
+    so percentiles follow current behaviour.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._gauges: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, Deque[float]] = {}
+        self._histogram_totals: Dict[tuple, Tuple[int, float]] = {}
+        self.started_at = time.time()
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            window = self._histograms.get(key)
+            if window is None:
+                window = self._histograms[key] = deque(maxlen=HISTOGRAM_WINDOW)
+            window.append(value)
+            count, total = self._histogram_totals.get(key, (0, 0.0))
+            self._histogram_totals[key] = (count + 1, total + value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def observations(self, name: str, **labels) -> int:
+        """Number of observations currently in a histogram's window"""
+        with self._lock:
+            return len(self._histograms.get(_key(name, labels), ()))
+
+    def percentile(self, name: str, fraction: float, **labels) -> float:
+        with self._lock:
+            ordered = sorted(self._histograms.get(_key(name, labels), ()))
+        return _percentile(ordered, fraction)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every metric as plain JSON-serializable values"""
+        with self._lock:
+            counters = {_format_key(k): v for k, v in self._counters.items()}
+            gauges = {_format_key(k): v for k, v in self._gauges.items()}
+            histograms = {}
+            for key, window in self._histograms.items():
+                ordered = sorted(window)
+                count, total = self._histogram_totals[key]
+                histograms[_format_key(key)] = {
+                    "count": count,
+                    "sum": round(total, 6),
+                    "p50": _percentile(ordered, 0.50),
+                    "p95": _percentile(ordered, 0.95),
+                    "p99": _percentile(ordered, 0.99),
+                    "max": ordered[-1] if ordered else 0.0,
+                }
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+
+metrics = MetricsRegistry()
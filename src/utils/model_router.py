@@ -0,0 +1,154 @@
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+from src.statics import MODEL_NAME
+from src.utils.metrics import metrics
+from src.utils.tokens import count_tokens, message_content_text
+
+
+ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+SMALL_MODEL_NAME = os.getenv("MODEL_ROUTER_SMALL_MODEL", "gpt-4o-mini")
+# Longer questions usually ask for analysis the small model does poorly
+ROUTER_MAX_SMALL_QUERY_TOKENS = int(os.getenv("MODEL_ROUTER_MAX_SMALL_QUERY_TOKENS", "40"))
+# Answers shorter than this from the small model are treated as a failure to answer
+ROUTER_MIN_ANSWER_CHARS = int(os.getenv("MODEL_ROUTER_MIN_ANSWER_CHARS", "20"))
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+MODEL_TIERS = {
+    TIER_SMALL: SMALL_MODEL_NAME,
+    TIER_LARGE: MODEL_NAME,
+}
+
+# USD per million tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+# Verdicts returned by the query classifier
+VERDICT_NO = "NO"
+VERDICT_SIMPLE = "SIMPLE"
+VERDICT_YES = "YES"
+
+PORTFOLIO_PATTERN = re.compile(
+    r"\b(my|mine|portfolio|holdings?|account|balance|positions?|invested|profit|loss|p&l)\b", re.IGNORECASE
+)
+CHART_PATTERN = re.compile(
+    r"\b(plot|chart|graph|visuali[sz]e|visuali[sz]ation|diagram|draw|pie|histogram|trend|show)\b", re.IGNORECASE
+)
+ANALYSIS_PATTERN = re.compile(
+    r"\b(analy[sz]e|analysis|compare|comparison|strategy|forecast|predict|prediction|should i|recommend|"
+    r"outlook|risk|diversif\w*|allocat\w*|rebalanc\w*|technical|fundamental|versus|vs)\b", re.IGNORECASE
+)
+# Phrases a model uses when it could not really answer
+LOW_CONFIDENCE_PATTERN = re.compile(
+    r"(i'm not sure|i am not sure|i don't know|i do not know|i don't have (access|enough)|"
+    r"i cannot provide|i can't provide|i'm unable to|i am unable to|unable to (find|retrieve|access))",
+    re.IGNORECASE
+)
+
+
+def call_cost(model: str, usage: Dict[str, int]) -> float:
+    """Price of one LLM call in USD from its reported token usage, 0 for unknown models"""
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    cached = usage.get("cached_tokens", 0)
+    uncached = usage.get("input_tokens", 0) - cached
+    return (uncached * input_price + cached * cached_price + usage.get("output_tokens", 0) * output_price) / 1_000_000
+
+
+class RouteDecision:
+    """The model tier chosen for one query, with what answering it cost"""
+
+    def __init__(self, tier: str, reason: str):
+        self.tier = tier
+        self.reason = reason
+        self.escalated_from: Optional[str] = None
+        self.cost_usd = 0.0
+        self.started_at = time.monotonic()
+
+    @property
+    def model(self) -> str:
+        return MODEL_TIERS[self.tier]
+
+    def escalate(self, reason: str):
+        """Move the query to the large model after the small one gave a weak answer"""
+        metrics.incr("model_router_escalations", reason=reason)
+        self.escalated_from = self.tier
+        self.tier = TIER_LARGE
+        self.reason = f"escalated: {reason}"
+
+    def record_usage(self, model: str, usage: Dict[str, int]):
+        self.cost_usd += call_cost(model, usage)
+
+    def report(self) -> Dict[str, Any]:
+        """Record per-tier latency and cost for the finished query"""
+        duration = time.monotonic() - self.started_at
+        tier = f"{self.escalated_from}->{self.tier}" if self.escalated_from else self.tier
+        metrics.observe("query_seconds", duration, tier=tier)
+        metrics.observe("query_cost_usd", self.cost_usd, tier=tier)
+        metrics.incr("query_cost_usd_total", self.cost_usd, tier=tier)
+        return {
+            "tier": tier,
+            "model": self.model,
+            "reason": self.reason,
+            "duration_seconds": round(duration, 3),
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+def route_query(query: str, verdict: str = VERDICT_YES, has_history: bool = False) -> RouteDecision:
+    """
+    Pick the model tier for a query.
+
+    The large model handles anything that needs portfolio data, charts or real
+    analysis, long questions and follow-ups in a conversation. Greetings,
+    capability and support questions, which the classifier reports as SIMPLE,
+    and short factual questions go to the small model.
+
+    Args:
+        query: The user's query
+        verdict: The classifier's verdict for the query
+        has_history: Whether the query continues an earlier conversation
+
+    Returns:
+        RouteDecision: The chosen tier and the reason for it
+    """
+    if not ROUTER_ENABLED:
+        decision = RouteDecision(TIER_LARGE, "router disabled")
+    elif PORTFOLIO_PATTERN.search(query):
+        decision = RouteDecision(TIER_LARGE, "portfolio tools")
+    elif CHART_PATTERN.search(query):
+        decision = RouteDecision(TIER_LARGE, "chart tools")
+    elif verdict == VERDICT_SIMPLE:
+        decision = RouteDecision(TIER_SMALL, "simple query")
+    elif has_history:
+        decision = RouteDecision(TIER_LARGE, "follow-up")
+    elif ANALYSIS_PATTERN.search(query):
+        decision = RouteDecision(TIER_LARGE, "analysis")
+    elif count_tokens(query) > ROUTER_MAX_SMALL_QUERY_TOKENS:
+        decision = RouteDecision(TIER_LARGE, "long query")
+    else:
+        decision = RouteDecision(TIER_SMALL, "short factual query")
+    metrics.incr("model_router_decisions", tier=decision.tier)
+    return decision
+
+
+def escalation_reason(response: Any) -> Optional[str]:
+    """
+    Return why a small-model response should be retried on the large model, or None to keep it.
+
+    Tool calls are a sign the query was misrouted, since only queries that need no
+    tools are sent to the small model; empty, very short or hedging answers are
+    treated as low confidence.
+    """
+    if getattr(response, "tool_calls", None):
+        return "tool call"
+    text = message_content_text(response).strip()
+    if len(text) < ROUTER_MIN_ANSWER_CHARS:
+        return "short answer"
+    if LOW_CONFIDENCE_PATTERN.search(text):
+        return "low confidence"
+    return None
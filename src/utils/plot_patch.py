@@ -0,0 +1,162 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils import json_codec, plot_renderer
+
+
+# Trace types drawn on x/y axes; pie traces use labels/values instead
+CARTESIAN_TYPES = {"bar", "scatter", "histogram"}
+# Plot types the model knows from create_plot that are not plotly trace types
+TYPE_ALIASES = {"line": {"type": "scatter", "mode": "lines+markers"}}
+
+
+class PlotPatchError(ValueError):
+    """Exception raised when an update does not apply to the stored figure."""
+    pass
+
+
+def summarize_figure(figure: Dict[str, Any]) -> str:
+    """One line describing a figure for the model: title and traces with their index, type, name and size"""
+    title = figure.get("layout", {}).get("title")
+    if isinstance(title, dict):
+        title = title.get("text")
+    traces = []
+    for index, trace in enumerate(figure.get("data", [])):
+        points = trace.get("values") if trace.get("type") == "pie" else trace.get("y", trace.get("x"))
+        traces.append(f"[{index}] {trace.get('type', 'scatter')} '{trace.get('name', '')}' ({len(points or [])} points)")
+    return f"'{title or 'untitled'}': " + ", ".join(traces)
+
+
+def _set_path(container: Dict[str, Any], path: str, value: Any):
+    """Set a dotted attribute path like 'marker.color'; None removes the attribute, as in plotly.js"""
+    keys = path.split(".")
+    for key in keys[:-1]:
+        child = container.get(key)
+        if not isinstance(child, dict):
+            child = container[key] = {}
+        container = child
+    if value is None:
+        container.pop(keys[-1], None)
+    else:
+        container[keys[-1]] = value
+
+
+def _trace_value(value: Any, position: int) -> Any:
+    """plotly.js restyle semantics: a list holds one value per selected trace, repeated cyclically"""
+    if isinstance(value, list) and value:
+        return value[position % len(value)]
+    return value
+
+
+def apply_operations(figure: Dict[str, Any], operations: List[Dict[str, Any]]):
+    """Apply patch operations to a figure dict in place, the way Plotly.restyle, relayout, addTraces and deleteTraces do"""
+    data = figure.setdefault("data", [])
+    layout = figure.setdefault("layout", {})
+    for operation in operations:
+        method = operation["method"]
+        if method == "restyle":
+            indices = operation.get("traces")
+            indices = range(len(data)) if indices is None else indices
+            for attribute, value in operation["update"].items():
+                for position, index in enumerate(indices):
+                    _set_path(data[index], attribute, _trace_value(value, position))
+        elif method == "relayout":
+            for attribute, value in operation["update"].items():
+                _set_path(layout, attribute, value)
+        elif method == "addTraces":
+            data.extend(operation["traces"])
+        elif method == "deleteTraces":
+            for index in sorted(operation["indices"], reverse=True):
+                del data[index]
+        else:
+            raise PlotPatchError(f"Unknown patch method '{method}'")
+
+
+def _check_indices(indices: List[int], count: int, what: str):
+    for index in indices:
+        if not isinstance(index, int) or not 0 <= index < count:
+            raise PlotPatchError(f"{what} index {index} is out of range, the chart has {count} traces")
+
+
+def _type_conversion(trace: Dict[str, Any], new_type: str) -> Optional[Dict[str, Any]]:
+    """Attribute moves needed when a trace changes between pie and an x/y type, which plotly does not do itself"""
+    old_type = trace.get("type", "scatter")
+    if old_type == "pie" and new_type in CARTESIAN_TYPES:
+        return {"x": [trace.get("labels")], "y": [trace.get("values")], "labels": None, "values": None,
+                "hole": None, "textinfo": None}
+    if old_type in CARTESIAN_TYPES and new_type == "pie":
+        return {"labels": [trace.get("x")], "values": [trace.get("y")], "x": None, "y": None, "mode": None}
+    return None
+
+
+def build_operations(figure: Dict[str, Any], restyle: Optional[Dict[str, Any]] = None,
+                     trace_indices: Optional[List[int]] = None, relayout: Optional[Dict[str, Any]] = None,
+                     add_traces: Optional[List[Dict[str, Any]]] = None,
+                     delete_traces: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Turn the arguments of the update_plot tool into patch operations.
+
+    Operations run in the order restyle, relayout, addTraces, deleteTraces.
+    Plot type aliases are expanded ('line' is a scatter drawn with lines) and
+    a change between pie and bar, scatter or histogram moves labels/values to
+    x/y or back, so the front end can apply the operations with plotly.js as
+    they are.
+
+    Raises:
+        PlotPatchError: If a trace index is out of range or nothing would change
+    """
+    data = figure.get("data", [])
+    operations = []
+
+    if restyle:
+        indices = list(trace_indices) if trace_indices else None
+        _check_indices(indices or [], len(data), "Trace")
+        update = dict(restyle)
+        new_type = update.get("type")
+        if isinstance(new_type, str) and new_type in TYPE_ALIASES:
+            update.update(TYPE_ALIASES[new_type])
+            new_type = update["type"]
+        operations.append({"method": "restyle", "update": update, "traces": indices})
+        if new_type is not None:
+            for position, index in enumerate(indices if indices is not None else range(len(data))):
+                conversion = _type_conversion(data[index], _trace_value(new_type, position))
+                if conversion:
+                    operations.append({"method": "restyle", "update": conversion, "traces": [index]})
+
+    if relayout:
+        operations.append({"method": "relayout", "update": dict(relayout)})
+
+    if add_traces:
+        traces = []
+        for trace in add_traces:
+            trace = dict(trace)
+            alias = TYPE_ALIASES.get(trace.get("type"))
+            if alias:
+                trace.update(alias)
+            traces.append(trace)
+        operations.append({"method": "addTraces", "traces": traces})
+
+    if delete_traces:
+        count = len(data) + sum(len(op["traces"]) for op in operations if op["method"] == "addTraces")
+        _check_indices(delete_traces, count, "Deleted trace")
+        operations.append({"method": "deleteTraces", "indices": sorted(set(delete_traces))})
+
+    if not operations:
+        raise PlotPatchError("No changes given, pass restyle, relayout, add_traces or delete_traces")
+    return operations
+
+
+def update_figure(figure_json: str, **changes) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Apply an update_plot call to a stored figure.
+
+    Args:
+        figure_json: The figure as stored, see plot_renderer.figure_json
+        **changes: The update_plot tool arguments, see build_operations
+
+    Returns:
+        tuple: The updated figure JSON and the operations that produce it from the old one
+    """
+    figure = json_codec.loads(figure_json)
+    operations = build_operations(figure, **changes)
+    apply_operations(figure, operations)
+    return plot_renderer.encode_figure(figure), operations
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import plotly.io as pio
+from plotly.io._utils import plotly_cdn_url
+
+from src.statics import PLOT_SHELL_CSS
+from src.utils import json_codec
+
+
+# Where clients load the shared shell from, e.g. https://api.example.com/plot. Empty inlines
+# the shell into every page, for clients that render the HTML without a base URL (srcdoc, WebViews)
+PLOT_SHELL_URL = os.getenv("PLOT_SHELL_URL", "").rstrip("/")
+# Shell assets are versioned by content hash, so clients may keep them for a year
+PLOT_SHELL_MAX_AGE = 365 * 24 * 3600
+
+PLOT_CONFIG = {"responsive": True, "scrollZoom": False}
+
+# Reads the figure from its JSON block, fills in the shared template and draws it
+_SHELL_JS = """(function () {
+    var config = %(config)s;
+    var template = %(template)s;
+    var target = document.getElementById('plot');
+    var figure = JSON.parse(document.getElementById('plot-figure').textContent);
+    if (figure.layout.template === undefined) {
+        figure.layout.template = template;
+    }
+    Plotly.newPlot(target, figure.data, figure.layout, config);
+    window.addEventListener('resize', function () {
+        Plotly.Plots.resize(target);
+    });
+    // A plot_patch from an update_plot response, posted by the page embedding this one
+    window.addEventListener('message', function (event) {
+        var patch = event.data && event.data.plot_patch;
+        if (event.source !== window.parent || !patch || !patch.operations) {
+            return;
+        }
+        patch.operations.reduce(function (done, op) {
+            return done.then(function () {
+                var traces = op.traces === null ? undefined : op.traces;
+                if (op.method === 'restyle') return Plotly.restyle(target, op.update, traces);
+                if (op.method === 'relayout') return Plotly.relayout(target, op.update);
+                if (op.method === 'addTraces') return Plotly.addTraces(target, op.traces);
+                if (op.method === 'deleteTraces') return Plotly.deleteTraces(target, op.indices);
+            });
+        }, Promise.resolve());
+    });
+})();
+"""
+
+
+@lru_cache(maxsize=1)
+def _default_template() -> Dict:
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+@lru_cache(maxsize=1)
+def shell_assets() -> Dict[str, Tuple[bytes, str]]:
+    """The shared stylesheet and script, as body and media type by file name"""
+    script = _SHELL_JS % {
+        "config": pio.json.to_json_plotly(PLOT_CONFIG),
+        "template": pio.json.to_json_plotly(_default_template()),
+    }
+    return {
+        "shell.css": (PLOT_SHELL_CSS.encode("utf-8"), "text/css; charset=utf-8"),
+        "shell.js": (script.encode("utf-8"), "application/javascript; charset=utf-8"),
+    }
+
+
+@lru_cache(maxsize=1)
+def _page_parts() -> Tuple[str, str]:
+    """
+    The page split around the figure JSON, built once. Rendering a chart is
+    then a single join of the two halves and the JSON.
+    """
+    assets = shell_assets()
+    css, script = assets["shell.css"][0].decode("utf-8"), assets["shell.js"][0].decode("utf-8")
+    if PLOT_SHELL_URL:
+        version = hashlib.blake2b(assets["shell.css"][0] + assets["shell.js"][0], digest_size=6).hexdigest()
+        stylesheet = f'<link rel="stylesheet" href="{PLOT_SHELL_URL}/shell.css?v={version}">'
+        loader = f'<script src="{PLOT_SHELL_URL}/shell.js?v={version}"></script>'
+    else:
+        stylesheet = f"<style>{css}</style>"
+        loader = f"<script>{script}</script>"
+    head = (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+        f'{stylesheet}\n<script charset="utf-8" src="{plotly_cdn_url()}"></script>\n'
+        '</head>\n<body>\n<div id="chart-container">'
+        '<div id="plot" class="plotly-graph-div" style="height:100%; width:100%;"></div></div>\n'
+        '<script type="application/json" id="plot-figure">'
+    )
+    tail = f"</script>\n{loader}\n</body>\n</html>\n"
+    return head, tail
+
+
+def encode_figure(figure: Dict) -> str:
+    """
+    JSON of a figure dict for a page. plotly escapes <, > and / so the JSON
+    cannot close its script block.
+    """
+    return pio.json.to_json_plotly(figure)
+
+
+def figure_json(fig) -> str:
+    """
+    JSON of a figure for the page. The default template, most of the JSON of
+    a small chart, is left out and filled in by the shell script instead.
+    """
+    # The figure's own dicts are serialized as they are; to_plotly_json() and
+    # to_html deep-copy them first, which costs more than the encoding itself
+    data, layout = fig._data, fig._layout
+    if layout.get("template") == _default_template():
+        layout = {key: value for key, value in layout.items() if key != "template"}
+    return encode_figure({"data": data, "layout": layout})
+
+
+def full_figure(figure: str) -> Dict:
+    """Figure dict from figure JSON with the default template put back, for renderers other than the shell"""
+    figure = json_codec.loads(figure)
+    layout = figure.setdefault("layout", {})
+    if "template" not in layout:
+        layout["template"] = _default_template()
+    return figure
+
+
+def render_page(figure: str) -> str:
+    """
+    Render figure JSON, as returned by figure_json, as a complete HTML page.
+
+    Only the figure div and its JSON are produced per chart; the stylesheet,
+    the drawing script and the template come from the shared shell, inlined
+    or, with PLOT_SHELL_URL set, loaded from /plot/shell.* and cached.
+    """
+    head, tail = _page_parts()
+    return "".join((head, figure, tail))
+
+
+def render_plot_page(fig) -> str:
+    """
+    Render a figure as a complete HTML page for the API response.
+
+    Args:
+        fig: A plotly Figure
+
+    Returns:
+        str: The HTML page
+    """
+    return render_page(figure_json(fig))
@@ -0,0 +1,69 @@
+import gc
+import time
+from typing import Any, Dict
+
+from src.utils.logger_factory import LoggerFactory
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+# One small figure per plot type, enough to make plotly build every trace class and validator we use
+_WARMUP_RECORDS = [
+    {"name": "Stocks", "value": 3053.75, "category": "Assets", "x": 1, "y": 2.5},
+    {"name": "Crypto", "value": 3896.62, "category": "Assets", "x": 2, "y": 3.5},
+]
+_WARMUP_PLOTS = {
+    "pie": {},
+    "bar": {"x_column": "name", "y_column": "value"},
+    "scatter": {"x_column": "x", "y_column": "y"},
+    "line": {"x_column": "x", "y_column": "y"},
+    "histogram": {"x_column": "value"},
+}
+
+
+def warm_shared_state(app) -> Dict[str, Any]:
+    """
+    Build the heavy, immutable state of the app once, in the gunicorn master.
+
+    Plotly creates its trace classes, validators and the default template lazily
+    on first use, the tokenizer loads its BPE ranks on the first count, and
+    FastAPI generates the OpenAPI schema on the first /docs hit. Done before the
+    workers fork, all of it sits in pages they share copy-on-write instead of
+    each worker building a private copy on its first requests, and again after
+    every max_requests recycle. Clients with sockets or event-loop state are not
+    touched here; the lifespan builds those in each worker.
+
+    Args:
+        app: The FastAPI application
+
+    Returns:
+        dict: What was warmed and how long it took
+    """
+    import plotly.io as pio
+    from src.tools import financial_api
+    from src.utils import plot_renderer
+    from src.utils.tokens import count_tokens
+
+    started = time.perf_counter()
+    pio.templates[pio.templates.default]
+    for plot_type, columns in _WARMUP_PLOTS.items():
+        fig = financial_api.create_plot(_WARMUP_RECORDS, plot_type=plot_type, **columns)
+        plot_renderer.render_plot_page(fig)
+    financial_api.create_subplots(
+        {1: {"Value": {"x": ["Stocks", "Crypto"], "y": [3053.75, 3896.62]}},
+         2: {"Allocation": {"labels": ["Stocks", "Crypto"], "values": [3053.75, 3896.62]}}},
+        ["bar", "pie"]
+    )
+    financial_api.PlotHelper.get_default_colors(24)
+    count_tokens("warmup")
+    app.openapi()
+
+    # Drop the warmup garbage now, so the frozen heap has no holes for the workers to fill
+    collected = gc.collect()
+    report = {
+        "seconds": round(time.perf_counter() - started, 3),
+        "plot_types": list(_WARMUP_PLOTS),
+        "collected": collected,
+    }
+    logger.info("Shared state warmed before fork", context=report)
+    return report
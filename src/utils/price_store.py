@@ -0,0 +1,291 @@
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.utils import json_codec
+
+
+# One directory per symbol holding a manifest and the current version's columns as .npy files
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", "data/prices")
+# Range get_price_history covers when the model gives no start date
+PRICE_HISTORY_DEFAULT_DAYS = int(os.getenv("PRICE_HISTORY_DEFAULT_DAYS", "365"))
+# Sampled points per symbol in the tool result; the chart gets the full series
+PRICE_HISTORY_SAMPLE_POINTS = int(os.getenv("PRICE_HISTORY_SAMPLE_POINTS", "24"))
+# Longer series are thinned to this many points per trace before plotting
+PRICE_PLOT_MAX_POINTS = int(os.getenv("PRICE_PLOT_MAX_POINTS", "5000"))
+
+COLUMNS = ("open", "high", "low", "close", "volume")
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9][A-Z0-9.\-^=_]{0,31}$")
+MANIFEST = "manifest.json"
+
+# A date or datetime string, numpy datetime64, or epoch seconds
+TimeLike = Union[str, int, float, np.datetime64, None]
+
+
+class PriceStoreError(ValueError):
+    """Exception raised when a symbol or time range cannot be read from or written to the price store."""
+    pass
+
+
+def normalize_symbol(symbol: str) -> str:
+    """Upper-case ticker such as AAPL or BTC-USD; anything that is not a ticker is rejected, it becomes a path"""
+    normalized = (symbol or "").strip().upper()
+    if not SYMBOL_PATTERN.match(normalized):
+        raise PriceStoreError(f"Invalid symbol '{symbol}'")
+    return normalized
+
+
+def to_epoch_seconds(value: TimeLike) -> Optional[int]:
+    """Epoch seconds of a date, datetime or timestamp; None stays None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    try:
+        return int(np.datetime64(value, "s").astype(np.int64))
+    except ValueError:
+        raise PriceStoreError(f"Invalid date '{value}', use YYYY-MM-DD")
+
+
+class PriceHistory:
+    """
+    OHLCV bars of one symbol over a time range. The arrays are slices of the
+    memory-mapped columns, read-only and shared with every other reader.
+    """
+
+    __slots__ = ("symbol", "timestamps", "open", "high", "low", "close", "volume")
+
+    def __init__(self, symbol: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.symbol = symbol
+        self.timestamps = timestamps
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def dates(self) -> np.ndarray:
+        """The timestamps as datetime64, a view of the same memory"""
+        return self.timestamps.view("datetime64[s]")
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in COLUMNS:
+            raise PriceStoreError(f"Unknown price field '{name}', use one of {', '.join(COLUMNS)}")
+        return getattr(self, name)
+
+    def downsample(self, max_points: int) -> "PriceHistory":
+        """Every n-th bar so at most max_points remain, keeping the last; strided views, nothing is copied"""
+        if max_points <= 0 or len(self) <= max_points:
+            return self
+        step = -(-len(self) // max_points)
+        # Count the stride back from the last bar so the latest price is always drawn
+        offset = (len(self) - 1) % step
+        return PriceHistory(
+            self.symbol, self.timestamps[offset::step],
+            {name: getattr(self, name)[offset::step] for name in COLUMNS}
+        )
+
+
+def _format_dates(timestamps: np.ndarray) -> List[str]:
+    """Dates, with the time of day only for intraday bars"""
+    unit = "D" if not (timestamps % 86400).any() else "m"
+    return np.datetime_as_string(timestamps.view("datetime64[s]"), unit=unit).tolist()
+
+
+def summarize_history(history: PriceHistory, field: str = "close",
+                      sample_points: int = PRICE_HISTORY_SAMPLE_POINTS) -> Dict:
+    """
+    What the model needs to talk about a price series: range, first and last
+    value, change, high and low, and a few evenly spaced points, instead of
+    every bar.
+    """
+    values = history.column(field)
+    # Bars without this field, e.g. close-only sources when asking for open, are left out
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return {"symbol": history.symbol, "field": field, "bars": 0}
+    sample = history.downsample(sample_points)
+    first, last = float(present[0]), float(present[-1])
+    return {
+        "symbol": history.symbol,
+        "field": field,
+        "from": _format_dates(history.timestamps[:1])[0],
+        "to": _format_dates(history.timestamps[-1:])[0],
+        "bars": len(history),
+        "first": round(first, 4),
+        "last": round(last, 4),
+        "change_pct": round((last - first) / first * 100, 2) if first else None,
+        "high": round(float(present.max()), 4),
+        "low": round(float(present.min()), 4),
+        "points": [
+            [date, round(float(value), 4)]
+            for date, value in zip(_format_dates(sample.timestamps), sample.column(field))
+            if not np.isnan(value)
+        ],
+    }
+
+
+class PriceStore:
+    """
+    Columnar OHLCV store on local disk.
+
+    Each symbol is a set of .npy columns, int64 epoch-second timestamps in
+    ascending order plus float64 open, high, low, close and volume, opened
+    with mmap so bars are paged in by the OS on demand and shared between
+    workers. A range query is two binary searches on the timestamp column,
+    O(log n), and returns slices of the mapped arrays.
+
+    Writers never touch the files readers have open: a write builds a new
+    version directory and then replaces the manifest that names it, so a
+    reader sees either the old or the new version, never a mix.
+    """
+
+    def __init__(self, root: str = PRICE_STORE_DIR):
+        self.root = root
+        # Mapped columns by symbol, for the version the manifest named when they were opened
+        self._open: Dict[str, Tuple[str, np.ndarray, Dict[str, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+    def _symbol_dir(self, symbol: str) -> str:
+        return os.path.join(self.root, symbol)
+
+    def _manifest(self, symbol: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._symbol_dir(symbol), MANIFEST), "rb") as f:
+                return json_codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def symbols(self) -> List[str]:
+        """Symbols that have price history"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, MANIFEST))
+        )
+
+    def has_symbols(self) -> bool:
+        """Whether any symbol has price history, stopping at the first one found"""
+        if not os.path.isdir(self.root):
+            return False
+        with os.scandir(self.root) as entries:
+            return any(os.path.exists(os.path.join(entry.path, MANIFEST)) for entry in entries)
+
+    def info(self, symbol: str) -> Optional[Dict]:
+        """Rows and first/last timestamp of a symbol, None if it has no history"""
+        return self._manifest(normalize_symbol(symbol))
+
+    def _columns(self, symbol: str) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        manifest = self._manifest(symbol)
+        if manifest is None:
+            return None
+        version = manifest["version"]
+        cached = self._open.get(symbol)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        with self._lock:
+            cached = self._open.get(symbol)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
+            directory = os.path.join(self._symbol_dir(symbol), version)
+            timestamps = np.load(os.path.join(directory, "timestamp.npy"), mmap_mode="r")
+            columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+            self._open[symbol] = (version, timestamps, columns)
+            return timestamps, columns
+
+    def history(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> PriceHistory:
+        """
+        Bars of a symbol from start to end, both inclusive.
+
+        Args:
+            symbol: Ticker, e.g. AAPL
+            start: First time to include, from the first bar if None
+            end: Last time to include, to the last bar if None
+
+        Returns:
+            PriceHistory: The bars, empty if none fall in the range
+
+        Raises:
+            PriceStoreError: If the symbol has no history or the arguments are invalid
+        """
+        symbol = normalize_symbol(symbol)
+        opened = self._columns(symbol)
+        if opened is None:
+            raise PriceStoreError(f"No price history for {symbol}")
+        timestamps, columns = opened
+        start_s, end_s = to_epoch_seconds(start), to_epoch_seconds(end)
+        lo = 0 if start_s is None else int(np.searchsorted(timestamps, start_s, side="left"))
+        hi = len(timestamps) if end_s is None else int(np.searchsorted(timestamps, end_s, side="right"))
+        hi = max(lo, hi)
+        return PriceHistory(symbol, timestamps[lo:hi], {name: column[lo:hi] for name, column in columns.items()})
+
+    def write(self, symbol: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray]) -> int:
+        """
+        Merge bars into a symbol's history. A bar at a timestamp the store
+        already has replaces it. Used by the ingestion job, not by requests.
+
+        Args:
+            symbol: Ticker, e.g. AAPL
+            timestamps: Epoch seconds of the bars, in any order
+            columns: Array per OHLCV column, aligned with timestamps; missing columns are NaN
+
+        Returns:
+            int: Rows the symbol has after the merge
+        """
+        symbol = normalize_symbol(symbol)
+        new_timestamps = np.asarray(timestamps, dtype=np.int64)
+        new_columns = {
+            name: np.asarray(columns[name], dtype=np.float64) if name in columns
+            else np.full(len(new_timestamps), np.nan)
+            for name in COLUMNS
+        }
+        for name, column in new_columns.items():
+            if len(column) != len(new_timestamps):
+                raise PriceStoreError(f"Column {name} has {len(column)} rows, timestamps have {len(new_timestamps)}")
+
+        existing = self._columns(symbol)
+        if existing is not None:
+            new_timestamps = np.concatenate((existing[0], new_timestamps))
+            new_columns = {name: np.concatenate((existing[1][name], new_columns[name])) for name in COLUMNS}
+        # Sorted unique timestamps, the last occurrence of each winning so newer bars replace older ones
+        _, reversed_index = np.unique(new_timestamps[::-1], return_index=True)
+        keep = len(new_timestamps) - 1 - reversed_index
+        merged_timestamps = new_timestamps[keep]
+
+        symbol_dir = self._symbol_dir(symbol)
+        manifest = self._manifest(symbol)
+        version = f"{time.time_ns():x}"
+        directory = os.path.join(symbol_dir, version)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, "timestamp.npy"), merged_timestamps)
+        for name in COLUMNS:
+            np.save(os.path.join(directory, f"{name}.npy"), new_columns[name][keep])
+
+        manifest_tmp = os.path.join(symbol_dir, f".{MANIFEST}.{version}")
+        with open(manifest_tmp, "wb") as f:
+            f.write(json_codec.dumps({
+                "version": version,
+                "rows": len(merged_timestamps),
+                "first": int(merged_timestamps[0]) if len(merged_timestamps) else None,
+                "last": int(merged_timestamps[-1]) if len(merged_timestamps) else None,
+                "updated_at": time.time(),
+            }))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest_tmp, os.path.join(symbol_dir, MANIFEST))
+
+        # Keep the version readers may still have just opened, drop anything older
+        previous = manifest["version"] if manifest else None
+        for name in os.listdir(symbol_dir):
+            if name not in (version, previous, MANIFEST) and os.path.isdir(os.path.join(symbol_dir, name)):
+                shutil.rmtree(os.path.join(symbol_dir, name), ignore_errors=True)
+        return len(merged_timestamps)
+
+
+price_store = PriceStore()
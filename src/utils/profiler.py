@@ -0,0 +1,277 @@
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.logger_factory import LoggerFactory
+from src.utils.metrics import metrics
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+# Requests carrying PROFILER_REQUEST_HEADER are profiled with this probability
+PROFILER_REQUEST_HEADER = os.getenv("PROFILER_REQUEST_HEADER", "X-Profile").lower()
+PROFILER_REQUEST_SAMPLE_RATE = float(os.getenv("PROFILER_REQUEST_SAMPLE_RATE", "0.1"))
+PROFILER_REQUEST_PATHS = tuple(os.getenv("PROFILER_REQUEST_PATHS", "/query").split(","))
+PROFILER_MAX_REQUEST_PROFILES = int(os.getenv("PROFILER_MAX_REQUEST_PROFILES", "4"))
+PROFILER_REQUEST_HISTORY = int(os.getenv("PROFILER_REQUEST_HISTORY", "20"))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ProfilerBusyError(RuntimeError):
+    """Exception raised when a worker profile is requested while one is already running."""
+    pass
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(PROJECT_ROOT):
+        return os.path.relpath(filename, PROJECT_ROOT)
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        return filename[marker + len("site-packages") + 1:]
+    return os.path.basename(filename)
+
+
+class Profile:
+    """
+    Collapsed stacks collected by the sampler, one line per distinct stack:
+    "frame;frame;frame count", the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def accept(self, thread_name: str, frames: List[Any]) -> Optional[List[Any]]:
+        """The part of a thread's stack (outermost first) to record, or None to skip it"""
+        return frames
+
+    def add(self, thread_name: str, labels: List[str]):
+        with self._lock:
+            self.stacks[";".join([thread_name] + labels)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished or time.monotonic()
+        return {"samples": self.samples, "stacks": len(self.stacks), "seconds": round(end - self.started, 3)}
+
+
+class RequestProfile(Profile):
+    """
+    Samples of a single request: only stacks passing through one of its anchor
+    frames are kept, cut at the anchor. The anchor on the event loop thread is
+    the middleware's coroutine frame, which every await of the request runs
+    under; threadpool calls wrapped with profiled() add their own.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.anchors: set = set()
+
+    def accept(self, thread_name: str, frames: List[Any]) -> Optional[List[Any]]:
+        for index, frame in enumerate(frames):
+            if frame in self.anchors:
+                return frames[index:]
+        return None
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler for this worker.
+
+    A daemon thread wakes every interval seconds, takes the stack of every other
+    thread from sys._current_frames() and hands it to the active profiles. It
+    only runs while a profile is active; the cost is one stack walk per thread
+    per tick while holding the GIL, about 1-2% of a core at the default 5ms.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self.interval = interval
+        self._profiles: List[Profile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    def attach(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, profile: Profile):
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+            profile.finished = time.monotonic()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            self._sample(profiles)
+
+    def _sample(self, profiles: List[Profile]):
+        # Frames are only referenced within this call, so none outlive the sample
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            thread_name = names.get(thread_id, str(thread_id))
+            for profile in profiles:
+                selected = profile.accept(thread_name, frames)
+                if selected:
+                    profile.add(thread_name, [self._label(f.f_code) for f in selected])
+
+
+sampler = StackSampler()
+_worker_profile: Optional[Profile] = None
+_request_profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+_active_requests = 0
+_current_request_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "current_request_profile", default=None
+)
+
+
+async def profile_worker(seconds: float) -> Profile:
+    """
+    Sample every thread of this worker for the given number of seconds.
+
+    Raises:
+        ProfilerBusyError: If a worker profile is already running
+        ValueError: If seconds is not within (0, PROFILER_MAX_SECONDS]
+    """
+    global _worker_profile
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {PROFILER_MAX_SECONDS:.0f}")
+    if _worker_profile is not None:
+        raise ProfilerBusyError("A profile is already running on this worker")
+    _worker_profile = profile = Profile()
+    sampler.attach(profile)
+    logger.info("Worker profile started", context={"seconds": seconds, "interval": sampler.interval})
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.detach(profile)
+        _worker_profile = None
+    metrics.incr("profiles", kind="worker")
+    logger.info("Worker profile finished", context=profile.stats())
+    return profile
+
+
+def get_request_profile(profile_id: str) -> Optional[RequestProfile]:
+    return _request_profiles.get(profile_id)
+
+
+def request_profiles() -> List[Dict[str, Any]]:
+    return [{"id": profile.id, "path": profile.path, **profile.stats()} for profile in reversed(_request_profiles.values())]
+
+
+def profiled(function: Callable) -> Callable:
+    """
+    Make a function run in the threadpool count towards the current request's
+    profile. The returned wrapper looks the profile up when called, so wrap the
+    function right where it is handed to run_in_threadpool, which copies the
+    request's context into the worker thread.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = _current_request_profile.get()
+        if profile is None:
+            return function(*args, **kwargs)
+        anchor = sys._getframe()
+        profile.anchors.add(anchor)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.anchors.discard(anchor)
+    return wrapper
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles a sampled subset of requests that carry PROFILER_REQUEST_HEADER.
+
+    A profiled response gets an X-Profile-Id header; its collapsed stacks are
+    kept for the last PROFILER_REQUEST_HISTORY profiles and served by the
+    authenticated profile endpoint. A plain ASGI middleware, so its coroutine
+    frame stays under every await of the request and can anchor the samples.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        if scope["type"] != "http" or not scope["path"].startswith(PROFILER_REQUEST_PATHS):
+            return False
+        header = PROFILER_REQUEST_HEADER.encode("latin-1")
+        if not any(name == header for name, _ in scope["headers"]):
+            return False
+        return _active_requests < PROFILER_MAX_REQUEST_PROFILES and random.random() < PROFILER_REQUEST_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        global _active_requests
+        if not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["path"])
+        profile.anchors.add(sys._getframe())
+        token = _current_request_profile.set(profile)
+        _active_requests += 1
+        sampler.attach(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.detach(profile)
+            profile.anchors.clear()
+            _active_requests -= 1
+            _current_request_profile.reset(token)
+            _request_profiles[profile.id] = profile
+            while len(_request_profiles) > PROFILER_REQUEST_HISTORY:
+                _request_profiles.popitem(last=False)
+            metrics.incr("profiles", kind="request")
+            logger.info("Request profile recorded", context={"profile_id": profile.id, "path": profile.path, **profile.stats()})
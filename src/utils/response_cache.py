@@ -0,0 +1,172 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from src.utils.metrics import metrics
+
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+# Prices and news go stale within minutes, explanations of concepts do not
+RESPONSE_CACHE_MARKET_TTL = int(os.getenv("RESPONSE_CACHE_MARKET_TTL", "60"))
+RESPONSE_CACHE_GENERAL_TTL = int(os.getenv("RESPONSE_CACHE_GENERAL_TTL", "3600"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+
+EMBEDDING_DIMENSIONS = 512
+
+# Questions about the user's own holdings depend on who is asking and are never shared
+PERSONAL_PATTERN = re.compile(
+    r"\b(my|mine|i|i'm|im|i've|ive|our|portfolio|holdings?|account|balance|positions?)\b", re.IGNORECASE
+)
+MARKET_SENSITIVE_PATTERN = re.compile(
+    r"\b(price|prices|priced|worth|trading|today|now|current|currently|latest|live|news|doing|"
+    r"performance|performing|up|down|rate|rates|market|markets|index|chart|trend)\b", re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercase, strip punctuation and collapse whitespace. Word order and repeated
+    words are kept: "convert 1 BTC to ETH" and "convert 1 ETH to BTC" differ.
+    """
+    words = (word.strip(".") for word in re.findall(r"[a-z0-9.$%&]+", query.lower()))
+    return " ".join(word for word in words if word)
+
+
+def is_cacheable_query(query: str) -> bool:
+    """Only general questions are shared between users; anything personal goes to the model"""
+    return not PERSONAL_PATTERN.search(query)
+
+
+def ttl_for_query(query: str) -> int:
+    return RESPONSE_CACHE_MARKET_TTL if MARKET_SENSITIVE_PATTERN.search(query) else RESPONSE_CACHE_GENERAL_TTL
+
+
+def same_word_order(a: str, b: str) -> bool:
+    """Whether the words two normalized queries share appear in the same order, "BTC to ETH" vs "ETH to BTC" """
+    words_a, words_b = a.split(), b.split()
+    shared = set(words_a) & set(words_b)
+    return [word for word in words_a if word in shared] == [word for word in words_b if word in shared]
+
+
+def embed_query(normalized: str) -> np.ndarray:
+    """
+    Local hashed embedding of word and character-trigram features.
+
+    Cheap enough to run per request without a model, and close enough that
+    rewordings and small typos of the same question land near each other.
+    """
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    features = normalized.split()
+    padded = f" {normalized} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign * (2.0 if " " not in feature else 1.0)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class CachedResponse:
+    """A cleaned final answer together with what it cost to produce"""
+
+    def __init__(self, query: str, normalized: str, body: List[Dict[str, Any]], llm_calls: int, ttl: int):
+        self.query = query
+        self.normalized = normalized
+        self.numbers = set(NUMBER_PATTERN.findall(normalized))
+        self.body = body
+        self.llm_calls = llm_calls
+        self.expires_at = time.time() + ttl
+        self.embedding: Optional[np.ndarray] = embed_query(normalized) if RESPONSE_CACHE_SEMANTIC else None
+
+    @property
+    def expired(self) -> bool:
+        return time.time() > self.expires_at
+
+
+class ResponseCache:
+    """
+    Per-worker cache of final answers to general market questions.
+
+    Lookups first try the normalized query text. With RESPONSE_CACHE_SEMANTIC
+    enabled, a miss falls back to the most similar cached query by local embedding,
+    accepted only above RESPONSE_CACHE_SIMILARITY, when any numbers (years,
+    amounts, percentages) are identical and the shared words are in the same order.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+
+    def get(self, query: str) -> Optional[CachedResponse]:
+        if not RESPONSE_CACHE_ENABLED or not is_cacheable_query(query):
+            metrics.incr("response_cache_requests", result="bypass")
+            return None
+
+        normalized = normalize_query(query)
+        entry = self._entries.get(normalized)
+        match_type = "exact"
+        if entry is None and RESPONSE_CACHE_SEMANTIC:
+            entry = self._nearest(normalized)
+            match_type = "semantic"
+
+        if entry is None or entry.expired:
+            if entry is not None:
+                self._entries.pop(entry.normalized, None)
+            metrics.incr("response_cache_requests", result="miss")
+            return None
+
+        self._entries.move_to_end(entry.normalized)
+        metrics.incr("response_cache_requests", result="hit", match=match_type)
+        metrics.incr("response_cache_saved_llm_calls", entry.llm_calls)
+        return entry
+
+    def put(self, query: str, body: List[Dict[str, Any]], llm_calls: int):
+        if not RESPONSE_CACHE_ENABLED or not is_cacheable_query(query):
+            return
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        self._entries[normalized] = CachedResponse(query, normalized, body, llm_calls, ttl_for_query(query))
+        self._entries.move_to_end(normalized)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        metrics.set_gauge("response_cache_entries", len(self._entries))
+
+    def _nearest(self, normalized: str) -> Optional[CachedResponse]:
+        candidates = [entry for entry in self._entries.values() if entry.embedding is not None and not entry.expired]
+        if not candidates:
+            return None
+        numbers = set(NUMBER_PATTERN.findall(normalized))
+        similarities = np.stack([entry.embedding for entry in candidates]) @ embed_query(normalized)
+        best = int(np.argmax(similarities))
+        if similarities[best] < RESPONSE_CACHE_SIMILARITY or candidates[best].numbers != numbers:
+            return None
+        # The embedding does not see word order, swapped operands ask a different question
+        if not same_word_order(candidates[best].normalized, normalized):
+            return None
+        return candidates[best]
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(
+            metrics.counter("response_cache_requests", result="hit", match=match) for match in ("exact", "semantic")
+        )
+        misses = metrics.counter("response_cache_requests", result="miss")
+        return {
+            "entries": len(self._entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "saved_llm_calls": metrics.counter("response_cache_saved_llm_calls"),
+        }
+
+
+response_cache = ResponseCache()
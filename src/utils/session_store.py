@@ -0,0 +1,328 @@
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+from src.utils.logger_factory import LoggerFactory
+from src.utils.tokens import count_message_tokens, count_tokens
+from src.utils.tool_compaction import fit_tool_result
+
+
+logger = LoggerFactory.create_protocol_logger(service_name="invest-gpt", is_console_command=True)
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "40"))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "3000"))
+SESSION_TOOL_CACHE_TTL = int(os.getenv("SESSION_TOOL_CACHE_TTL", "300"))
+SESSION_TOOL_CONTEXT_TOKEN_BUDGET = int(os.getenv("SESSION_TOOL_CONTEXT_TOKEN_BUDGET", "2000"))
+# Charts kept per session for update_plot; larger figures are not kept and have to be drawn again
+SESSION_MAX_PLOTS = int(os.getenv("SESSION_MAX_PLOTS", "3"))
+SESSION_MAX_PLOT_BYTES = int(os.getenv("SESSION_MAX_PLOT_BYTES", "262144"))
+
+# Tools whose results depend only on the user and can be reused within a session
+CACHEABLE_TOOLS = {"portfolio_get_data"}
+
+
+class Session(BaseModel):
+    """Conversation state kept between /query calls that share a session_id"""
+    session_id: str
+    messages: List[Dict[str, str]] = []
+    summary: str = ""
+    tool_results: Dict[str, Dict[str, Any]] = {}
+    # Figure JSON and a one-line summary by plot_id, oldest first
+    plots: Dict[str, Dict[str, Any]] = {}
+    updated_at: float = Field(default_factory=time.time)
+
+    @staticmethod
+    def tool_key(name: str, args: Optional[Dict[str, Any]] = None) -> str:
+        return f"{name}:{json.dumps(args or {}, sort_keys=True)}"
+
+    def get_tool_result(self, name: str, args: Optional[Dict[str, Any]] = None,
+                        max_age: int = SESSION_TOOL_CACHE_TTL) -> Optional[Any]:
+        """Return a cached tool result if it is younger than max_age seconds"""
+        cached = self.tool_results.get(self.tool_key(name, args))
+        if not cached or time.time() - cached["created_at"] > max_age:
+            return None
+        return cached["result"]
+
+    def set_tool_result(self, name: str, args: Optional[Dict[str, Any]], result: Any):
+        self.tool_results[self.tool_key(name, args)] = {
+            "name": name,
+            "result": result,
+            "created_at": time.time()
+        }
+
+    def fresh_tool_results(self, max_age: int = SESSION_TOOL_CACHE_TTL) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [cached for cached in self.tool_results.values() if now - cached["created_at"] <= max_age]
+
+    def tool_context_message(self, token_budget: int = SESSION_TOOL_CONTEXT_TOKEN_BUDGET) -> Optional[Dict[str, str]]:
+        """
+        Build a system note carrying the fresh tool results of this session.
+
+        Sending data the model already fetched lets follow-up questions be answered
+        without another tool round trip. Results are compacted the same way as fresh
+        tool output; those that still do not fit the budget are left out and the
+        model can still call the tool, which is then served from the cache.
+        """
+        parts = []
+        used = 0
+        for cached in sorted(self.fresh_tool_results(), key=lambda c: c["created_at"], reverse=True):
+            retrieved_at = time.strftime("%H:%M:%S UTC", time.gmtime(cached["created_at"]))
+            remaining = token_budget - used
+            if remaining <= 0:
+                break
+            part = f"{cached['name']} (retrieved {retrieved_at}): {fit_tool_result(cached['name'], cached['result'], remaining)}"
+            part_tokens = count_tokens(part)
+            if used + part_tokens > token_budget:
+                continue
+            parts.append(part)
+            used += part_tokens
+        if not parts:
+            return None
+        return {
+            "role": "system",
+            "content": "Tool results already retrieved in this conversation, reuse them instead of calling the tool again:\n"
+                       + "\n".join(parts)
+        }
+
+    def save_plot(self, plot_id: str, figure: str, summary: str) -> bool:
+        """Keep a chart's figure JSON for update_plot; returns False if it is too large to keep"""
+        self.plots.pop(plot_id, None)
+        if len(figure) > SESSION_MAX_PLOT_BYTES:
+            return False
+        self.plots[plot_id] = {"figure": figure, "summary": summary, "updated_at": time.time()}
+        while len(self.plots) > SESSION_MAX_PLOTS:
+            self.plots.pop(next(iter(self.plots)))
+        return True
+
+    def get_plot(self, plot_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """A kept chart by id, or the latest one"""
+        if plot_id is None:
+            plot_id = next(reversed(self.plots), None)
+        return self.plots.get(plot_id) if plot_id else None
+
+    def plot_context_message(self) -> Optional[Dict[str, str]]:
+        """System note listing the charts the user has seen, so follow-ups can change them with update_plot"""
+        if not self.plots:
+            return None
+        lines = [f"plot_id {plot_id}: {plot['summary']}" for plot_id, plot in self.plots.items()]
+        return {
+            "role": "system",
+            "content": "Charts already shown in this conversation, latest last. To change one, call update_plot "
+                       "with its plot_id instead of creating it again:\n" + "\n".join(lines)
+        }
+
+    def context_messages(self) -> List[Dict[str, str]]:
+        """Messages to place between the system prompt and the new user query"""
+        messages = self.history_messages()
+        tool_context = self.tool_context_message()
+        if tool_context:
+            messages.append(tool_context)
+        plot_context = self.plot_context_message()
+        if plot_context:
+            messages.append(plot_context)
+        return messages
+
+    @property
+    def last_user_query(self) -> Optional[str]:
+        for message in reversed(self.messages):
+            if message["role"] == "user":
+                return message["content"]
+        return None
+
+    def add_turn(self, query: str, answer: str):
+        """Record a question and its final answer, keeping at most SESSION_MAX_MESSAGES messages"""
+        self.messages.append({"role": "user", "content": query})
+        self.messages.append({"role": "assistant", "content": answer})
+        overflow = len(self.messages) - SESSION_MAX_MESSAGES
+        overflow += overflow % 2  # Drop whole question/answer turns
+        if overflow > 0:
+            self.summary = _summarize_dropped(self.summary, self.messages[:overflow])
+            self.messages = self.messages[overflow:]
+        self.updated_at = time.time()
+
+    def history_messages(self, token_budget: int = SESSION_HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+        """
+        Return the conversation history to send to the model within a token budget.
+
+        The most recent turns are kept whole. Older turns that do not fit are
+        collapsed, together with any earlier summary, into one short system note
+        listing what the user asked, so the model keeps the thread without the
+        full text of every past answer.
+        """
+        kept: List[Dict[str, str]] = []
+        used = 0
+        for start in range(len(self.messages) - 2, -1, -2):
+            turn = self.messages[start:start + 2]
+            turn_tokens = count_message_tokens(turn)
+            if used + turn_tokens > token_budget:
+                break
+            kept = turn + kept
+            used += turn_tokens
+
+        dropped = self.messages[:len(self.messages) - len(kept)]
+        summary = _summarize_dropped(self.summary, dropped)
+        if summary and used + count_tokens(summary) <= token_budget:
+            return [{"role": "system", "content": summary}] + kept
+        return kept
+
+
+def _summarize_dropped(summary: str, dropped: List[Dict[str, str]]) -> str:
+    """Fold dropped messages into an extractive summary of the user's earlier questions"""
+    questions = [message["content"][:200] for message in dropped if message["role"] == "user"]
+    if not questions:
+        return summary
+    previous = summary or "Earlier in this conversation the user asked:"
+    return previous + "".join(f"\n- {question}" for question in questions)
+
+
+class SessionStore(ABC):
+    """Abstract base class for all session store implementations"""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Session]:
+        """Load a session, or None if it does not exist or has expired"""
+        pass
+
+    @abstractmethod
+    async def save(self, session: Session):
+        """Store a session and refresh its expiry"""
+        pass
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """Remove a session"""
+        pass
+
+    async def close(self):
+        """Release any connections held by the store"""
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-worker LRU session store with a TTL, the default when no shared backend is configured"""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl: int = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.updated_at > self.ttl:
+            self._sessions.pop(session_id, None)
+            return None
+        self._sessions.move_to_end(session_id)
+        # Hand out a copy so an aborted request cannot leave half-applied changes behind
+        return session.model_copy(deep=True)
+
+    async def save(self, session: Session):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Redis-backed session store shared by every worker and pod"""
+
+    def __init__(self, url: str = None, ttl: int = SESSION_TTL_SECONDS, prefix: str = "invest-gpt:session:"):
+        self.url = url or os.getenv("REDIS_URL")
+        self.ttl = ttl
+        self.prefix = prefix
+
+        if not self.url:
+            raise ValueError("Redis URL not provided or found in environment variables")
+
+        try:
+            from redis import asyncio as redis_asyncio
+            self.client = redis_asyncio.from_url(self.url)
+        except ImportError:
+            raise ImportError("Could not import redis. Ensure 'redis' is installed.")
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        data = await self.client.get(self.prefix + session_id)
+        if data is None:
+            return None
+        return Session.model_validate_json(data)
+
+    async def save(self, session: Session):
+        await self.client.set(self.prefix + session.session_id, session.model_dump_json(), ex=self.ttl)
+
+    async def delete(self, session_id: str):
+        await self.client.delete(self.prefix + session_id)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SessionStoreFactory:
+    """Factory for creating session store instances"""
+
+    @staticmethod
+    def create_store(store_type: str = "auto") -> SessionStore:
+        """
+        Create and return a session store based on the specified type
+
+        Args:
+            store_type: Type of store to create ('redis', 'memory', or 'auto')
+
+        Returns:
+            SessionStore: A concrete session store implementation
+        """
+        if store_type == "auto":
+            store_type = "redis" if os.getenv("REDIS_URL") else "memory"
+
+        try:
+            if store_type == "redis":
+                return RedisSessionStore()
+            return InMemorySessionStore()
+        except Exception as e:
+            logger.error(f"Error creating {store_type} session store, falling back to memory", exception=e)
+            return InMemorySessionStore()
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Return this worker's session store, creating it on first use"""
+    global _store
+    if _store is None:
+        _store = SessionStoreFactory.create_store()
+    return _store
+
+
+async def close_session_store():
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
+
+
+async def load_session(session_id: str) -> Session:
+    """Load a session, starting an empty one if it is unknown, expired or the store is unreachable"""
+    try:
+        session = await get_session_store().get(session_id)
+    except Exception as e:
+        logger.error("Error loading session", context={"session_id": session_id}, exception=e)
+        session = None
+    return session or Session(session_id=session_id)
+
+
+async def save_session(session: Session):
+    """Save a session; a store failure loses history but must not fail the request"""
+    try:
+        await get_session_store().save(session)
+    except Exception as e:
+        logger.error("Error saving session", context={"session_id": session.session_id}, exception=e)
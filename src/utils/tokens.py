@@ -0,0 +1,72 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from src.utils import json_codec
+
+
+# Fixed per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the tokenizer once; tiktoken ships with langchain-openai but is treated as optional"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Uses the gpt-4o tokenizer when tiktoken is available and falls back to the
+    usual estimate of four characters per token otherwise.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_content_text(message: Any) -> str:
+    """Return the text of a chat message given as a dict or a langchain message"""
+    content = message.get("content") if isinstance(message, dict) else getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return json_codec.dumps_str(content) if content is not None else ""
+
+
+def count_message_tokens(messages: List[Any]) -> int:
+    """Estimate the prompt tokens of a list of chat messages"""
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(message_content_text(message))
+        tool_calls = message.get("tool_calls") if isinstance(message, dict) else getattr(message, "tool_calls", None)
+        if tool_calls:
+            total += count_tokens(json_codec.dumps_str(tool_calls))
+    return total
+
+
+def usage_tokens(response: Any) -> Dict[str, int]:
+    """
+    Return the token usage an LLM response reports, zero when the API did not send it.
+
+    cached_tokens is the part of input_tokens the provider served from its prompt
+    cache, billed at a discount and skipped by prefill.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cached_tokens": details.get("cache_read", 0) or 0,
+    }
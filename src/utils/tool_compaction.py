@@ -0,0 +1,323 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils import json_codec
+from src.utils.metrics import metrics
+from src.utils.tokens import count_message_tokens, count_tokens
+
+
+# Upper bound for a single tool result sent to the model
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "1500"))
+# Upper bound for the prompt of every LLM call made while answering one query
+REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "16000"))
+# Significant digits kept for numbers; enough for prices and totals, not for float noise
+TOOL_RESULT_SIGNIFICANT_DIGITS = int(os.getenv("TOOL_RESULT_SIGNIFICANT_DIGITS", "6"))
+
+# Holding fields the model uses to answer portfolio questions, overridable without a deploy
+DEFAULT_HOLDING_FIELDS = (
+    "symbol,name,type,assetType,quantity,averagePrice,avgPrice,currentPrice,price,"
+    "investedAmount,currentValue,profitLoss,profitLossPercentage,pnl,pnlPercentage,currency"
+)
+HOLDING_FIELDS = [
+    field.strip() for field in os.getenv("TOOL_RESULT_HOLDING_FIELDS", DEFAULT_HOLDING_FIELDS).split(",")
+    if field.strip()
+]
+
+# Record fields kept per tool; tools not listed keep every field of their records
+TOOL_RECORD_FIELDS = {"portfolio_get_data": HOLDING_FIELDS}
+
+# Fields that never help an answer: identifiers, media and bookkeeping timestamps. camelCase ids
+# (userId) are matched case-sensitively so words ending in "id" (bid, mid, paid, valid) are kept
+DROPPED_FIELD_PATTERN = re.compile(
+    r"(?<=[a-z])Id$|(?i:^id$|_id$|uuid|logo|icon|image|url|link|createdAt|updatedAt|created_at|updated_at)"
+)
+NUMERIC_STRING_PATTERN = re.compile(r"^-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+# Fields the gateway sends as numeric strings; other strings, e.g. account numbers, stay strings
+NUMERIC_FIELDS = {
+    "quantity", "averagePrice", "avgPrice", "currentPrice", "price", "investedAmount", "currentValue",
+    "profitLoss", "profitLossPercentage", "pnl", "pnlPercentage", "value",
+}
+
+# Column used to decide which rows survive when a table has to be trimmed
+RANK_FIELDS = ("currentValue", "investedAmount", "value")
+# Strings are not cut below this many characters when a result has to be truncated
+TRUNCATED_STRING_MIN_CHARS = 64
+
+
+def round_number(value: float, digits: int = TOOL_RESULT_SIGNIFICANT_DIGITS) -> Any:
+    """
+    Round to significant digits so small crypto prices keep their precision,
+    but never below cents so large totals stay exact to the cent.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if abs(value) >= 1:
+        rounded = round(float(value), max(2, digits - int(math.log10(abs(value))) - 1))
+    else:
+        rounded = float(f"{value:.{digits}g}")
+    return int(rounded) if rounded.is_integer() else rounded
+
+
+def _compact_value(value: Any, field: Optional[str] = None) -> Any:
+    if isinstance(value, str) and field in NUMERIC_FIELDS and NUMERIC_STRING_PATTERN.match(value):
+        return round_number(float(value))
+    if isinstance(value, (int, float)):
+        return round_number(value)
+    if isinstance(value, dict):
+        return {k: _compact_value(v, k) for k, v in value.items()
+                if v not in (None, "", [], {}) and not DROPPED_FIELD_PATTERN.search(k)}
+    if isinstance(value, list):
+        return [_compact_value(v, field) for v in value]
+    return value
+
+
+def project_record(record: Dict[str, Any], fields: Optional[List[str]] = HOLDING_FIELDS) -> Dict[str, Any]:
+    """
+    Keep only the fields the model needs from one record; None keeps them all.
+
+    Records that share none of the known fields (the gateway changed shape) keep
+    all their scalar fields instead, so the model never receives an empty row.
+    """
+    if fields is None:
+        return record
+    projected = {field: record[field] for field in fields if record.get(field) not in (None, "")}
+    if projected:
+        return projected
+    return {k: v for k, v in record.items() if not isinstance(v, (dict, list))}
+
+
+def to_table(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Encode a list of records as column names plus rows, so keys are sent once instead of per row"""
+    columns: List[str] = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return {"columns": columns, "rows": [[record.get(column) for column in columns] for record in records]}
+
+
+def _is_record_list(value: Any) -> bool:
+    return isinstance(value, list) and len(value) > 1 and all(isinstance(item, dict) for item in value)
+
+
+def _encode(value: Any) -> str:
+    return json_codec.dumps_str(value)
+
+
+def compact_tool_result(name: str, result: Any) -> Any:
+    """
+    Shrink a tool result before it is sent to the model.
+
+    Lists of records are projected to the tool's fields in TOOL_RECORD_FIELDS,
+    if it has any, and encoded as tables, numbers are rounded to significant digits and empty or bookkeeping fields
+    are dropped. Strings and error results pass through unchanged.
+    """
+    if not isinstance(result, dict) or result.get("error"):
+        return result
+
+    fields = TOOL_RECORD_FIELDS.get(name)
+    compacted = {}
+    for key, value in result.items():
+        if _is_record_list(value):
+            compacted[key] = to_table([_compact_value(project_record(record, fields)) for record in value])
+        elif isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+            compacted[key] = [_compact_value(project_record(value[0], fields))]
+        else:
+            compacted[key] = _compact_value(value)
+    return compacted
+
+
+def _rank_column(table: Dict[str, Any]) -> Optional[int]:
+    for field in RANK_FIELDS:
+        if field in table["columns"]:
+            return table["columns"].index(field)
+    return None
+
+
+def _trim_table(table: Dict[str, Any], keep: int) -> Dict[str, Any]:
+    """Keep the largest rows of a table and summarize the rest in an 'omitted' entry"""
+    rows = table["rows"]
+    rank = _rank_column(table)
+    if rank is not None:
+        rows = sorted(rows, key=lambda row: row[rank] if isinstance(row[rank], (int, float)) else 0, reverse=True)
+    kept, dropped = rows[:keep], rows[keep:]
+    trimmed = {"columns": table["columns"], "rows": kept}
+    if dropped:
+        # Tables can be trimmed more than once, add to what earlier passes left out
+        omitted = dict(table.get("omitted", {}))
+        omitted["rows"] = omitted.get("rows", 0) + len(dropped)
+        if rank is not None:
+            total_key = f"{table['columns'][rank]}_total"
+            omitted[total_key] = round_number(
+                omitted.get(total_key, 0) + sum(row[rank] for row in dropped if isinstance(row[rank], (int, float)))
+            )
+        trimmed["omitted"] = omitted
+    return trimmed
+
+
+def _is_table(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("columns"), list) and isinstance(value.get("rows"), list)
+
+
+def _largest_part(value: Any) -> Optional[Tuple[str, Any]]:
+    """
+    The part of a result to shorten next: the list with the most items, then the
+    longest string, then the dict with the most fields. None if nothing can shrink.
+
+    A list inside a list is a row or a pair, like a table row or a [date, price]
+    point, and a table's columns line up with its rows, so neither is shortened.
+    """
+    lists, strings, dicts = [], [], []
+
+    def walk(node: Any, parent: Any, key: Any):
+        if isinstance(node, list):
+            if len(node) > 1 and not isinstance(parent, list) and not (_is_table(parent) and key == "columns"):
+                lists.append((len(node), node))
+            for index, item in enumerate(node):
+                walk(item, node, index)
+        elif isinstance(node, dict):
+            if len(node) > 1 and not _is_table(node):
+                dicts.append((len(node), node))
+            for child_key, item in node.items():
+                walk(item, node, child_key)
+        elif isinstance(node, str) and len(node) > 2 * TRUNCATED_STRING_MIN_CHARS:
+            strings.append((len(node), (parent, key)))
+
+    walk(value, None, None)
+    for kind, candidates in (("list", lists), ("string", strings), ("dict", dicts)):
+        if candidates:
+            return kind, max(candidates, key=lambda candidate: candidate[0])[1]
+    return None
+
+
+def _truncate(result: Any, token_budget: int) -> str:
+    """
+    Last resort when trimming tables is not enough: drop the second half of the
+    largest list, then shorten the longest string, then drop fields, until the
+    result fits. Whole items are removed, so the result stays valid JSON, and it
+    is marked with truncated and the number of rows and fields left out.
+    """
+    marker = {"truncated": True, "rows_omitted": 0, "fields_omitted": 0}
+    # A copy, the parts are cut in place
+    body = json_codec.loads(_encode(result))
+    if isinstance(body, dict):
+        truncated = {**marker, **body}
+    else:
+        truncated = {**marker, "result": body}
+    content = _encode(truncated)
+    while count_tokens(content) > token_budget:
+        part = _largest_part(truncated)
+        if part is None:
+            break
+        kind, target = part
+        if kind == "list":
+            keep = len(target) // 2
+            truncated["rows_omitted"] += len(target) - keep
+            del target[keep:]
+        elif kind == "string":
+            parent, key = target
+            parent[key] = parent[key][:len(parent[key]) // 2] + "..."
+        else:
+            # The marker is never dropped, it says the result is partial
+            droppable = [key for key in target if not (target is truncated and key in marker)]
+            if target is truncated and len(droppable) <= 1:
+                break
+            drop = droppable[(len(droppable) + 1) // 2:] or droppable[-1:]
+            for key in drop:
+                del target[key]
+            truncated["fields_omitted"] += len(drop)
+        content = _encode(truncated)
+    return content
+
+
+def fit_tool_result(name: str, result: Any, token_budget: int = TOOL_RESULT_TOKEN_BUDGET) -> str:
+    """
+    Compact a tool result and serialize it within a token budget.
+
+    When the compacted result is still too large the biggest tables lose their
+    smallest rows first; what was left out is reported next to the table so the
+    model can say the list is partial. Totals computed by the tool are kept. If
+    that is not enough, whole list items, then text, then fields are dropped and
+    the result is marked truncated; it is always valid JSON.
+
+    Args:
+        name: Name of the tool that produced the result
+        result: The raw tool result
+        token_budget: Maximum tokens for the serialized result
+
+    Returns:
+        str: The serialized result to use as the tool message content
+    """
+    raw = _encode(result)
+    compacted = compact_tool_result(name, result)
+    content = _encode(compacted)
+    tokens = count_tokens(content)
+
+    if tokens > token_budget and isinstance(compacted, dict):
+        tables = [key for key, value in compacted.items() if isinstance(value, dict) and "rows" in value]
+        while tokens > token_budget and tables:
+            largest = max(tables, key=lambda key: len(compacted[key]["rows"]))
+            rows = len(compacted[largest]["rows"])
+            if rows <= 1:
+                break
+            compacted[largest] = _trim_table(compacted[largest], rows // 2)
+            content = _encode(compacted)
+            tokens = count_tokens(content)
+    if tokens > token_budget:
+        content = _truncate(compacted, token_budget)
+        tokens = count_tokens(content)
+
+    metrics.observe("tool_result_tokens", tokens, tool=name)
+    metrics.incr("tool_result_tokens_saved", max(count_tokens(raw) - tokens, 0), tool=name)
+    return content
+
+
+class TokenBudget:
+    """
+    Prompt token accounting for one query.
+
+    Every LLM call is charged the size of its prompt; tool results added to the
+    conversation get a share of what is left so that later iterations of the
+    tool loop do not push the prompt past REQUEST_TOKEN_BUDGET.
+    """
+
+    def __init__(self, limit: int = REQUEST_TOKEN_BUDGET):
+        self.limit = limit
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.calls = 0
+
+    def charge(self, messages: List[Any], usage: Optional[Dict[str, int]] = None):
+        """Record one LLM call, preferring the usage the API reported over the local estimate"""
+        self.calls += 1
+        if usage and usage.get("input_tokens"):
+            self.prompt_tokens += usage["input_tokens"]
+            self.completion_tokens += usage.get("output_tokens", 0)
+            self.cached_tokens += usage.get("cached_tokens", 0)
+        else:
+            self.prompt_tokens += count_message_tokens(messages)
+
+    def tool_result_budget(self, messages: List[Any], tool_calls: int) -> int:
+        """Tokens each of the next tool results may use given the conversation so far"""
+        remaining = self.limit - count_message_tokens(messages)
+        share = remaining // max(tool_calls, 1)
+        return max(min(TOOL_RESULT_TOKEN_BUDGET, share), 200)
+
+    def report(self) -> Dict[str, int]:
+        metrics.observe("request_prompt_tokens", self.prompt_tokens)
+        metrics.observe("request_completion_tokens", self.completion_tokens)
+        metrics.observe("request_cached_tokens", self.cached_tokens)
+        metrics.incr("llm_prompt_tokens", self.prompt_tokens)
+        metrics.incr("llm_cached_prompt_tokens", self.cached_tokens)
+        return {
+            "llm_calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "completion_tokens": self.completion_tokens,
+        }
@@ -0,0 +1,51 @@
+import pytest
+
+from src.utils import image_renderer
+from src.utils.image_renderer import ImageRenderError, RendererPool
+
+
+class FakeScope:
+    started = 0
+    fail = False
+
+    def __init__(self, **kwargs):
+        if FakeScope.fail:
+            raise RuntimeError("chromium not found")
+        FakeScope.started += 1
+
+    def transform(self, figure, format, scale=1):
+        return b"image"
+
+    def _shutdown_kaleido(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_kaleido(monkeypatch):
+    monkeypatch.setattr(image_renderer, "PlotlyScope", FakeScope)
+    monkeypatch.setattr(image_renderer, "IMAGE_RENDER_ENABLED", True)
+    FakeScope.started, FakeScope.fail = 0, False
+
+
+def test_failed_start_gives_its_slot_back():
+    pool = RendererPool(size=1)
+    FakeScope.fail = True
+    for _ in range(3):
+        with pytest.raises(ImageRenderError):
+            pool.render({"data": []}, "png", timeout=0.01)
+    FakeScope.fail = False
+    assert pool.render({"data": []}, "png", timeout=0.01) == b"image"
+
+
+def test_close_keeps_checked_out_renderers_counted():
+    pool = RendererPool(size=2)
+    busy = pool._acquire(0.01)
+    pool._idle.put(pool._acquire(0.01))
+    pool.close()
+    # The busy renderer comes back after close, the pool may only start one more
+    pool._idle.put(busy)
+    assert pool._acquire(0.01) is busy
+    pool._acquire(0.01)
+    assert FakeScope.started == 3
+    with pytest.raises(ImageRenderError):
+        pool._acquire(0.01)
@@ -0,0 +1,82 @@
+import asyncio
+
+from benchmarks.fakes.kafka import LocalBroker, PortfolioResponder
+from src.utils.kafka_rpc import KafkaRPCClient
+
+REQUEST_TOPIC = "portfolio-requests"
+RESPONSE_TOPIC = "portfolio-replies"
+
+
+class CountingResponder(PortfolioResponder):
+    """Records the most requests the service was working on at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outstanding = 0
+        self.peak = 0
+
+    async def _reply(self, message):
+        self.outstanding += 1
+        self.peak = max(self.peak, self.outstanding)
+        try:
+            await super()._reply(message)
+        finally:
+            self.outstanding -= 1
+
+
+def run_burst(accounts: int, max_concurrency: int, drop_accounts=None, timeout: float = 5, max_in_flight: int = None):
+    async def burst():
+        broker = LocalBroker(network_delay=0)
+        broker.create_topic(RESPONSE_TOPIC)
+        responder = CountingResponder(broker, REQUEST_TOPIC, latency=0.005, jitter=0.002, holdings=1,
+                                      drop_accounts=drop_accounts)
+        responder.start()
+        client = KafkaRPCClient(
+            reply_topics=[RESPONSE_TOPIC],
+            producer_factory=broker.producer_factory,
+            consumer_factory=broker.consumer_factory,
+            max_concurrency=max_concurrency,
+            max_in_flight=max_in_flight or accounts
+        )
+        await client.start()
+        try:
+            replies = [
+                reply async for reply in client.call_many(
+                    REQUEST_TOPIC, RESPONSE_TOPIC, [{"accountId": f"acct-{i}"} for i in range(accounts)],
+                    timeout=timeout
+                )
+            ]
+            return replies, responder.peak, client.stats()
+        finally:
+            await client.stop()
+            await responder.stop()
+
+    return asyncio.run(burst())
+
+
+def test_call_many_holds_concurrency_slots():
+    replies, peak, stats = run_burst(accounts=40, max_concurrency=8)
+    assert sorted(index for index, _, _ in replies) == list(range(40))
+    assert all(error is None for _, _, error in replies)
+    assert [response["accountId"] for index, response, _ in sorted(replies, key=lambda reply: reply[0])] == [
+        f"acct-{i}" for i in range(40)
+    ]
+    assert peak == 8
+    assert stats["in_flight"] == 0
+
+
+def test_call_many_timeout_frees_its_slot():
+    replies, _, _ = run_burst(accounts=6, max_concurrency=2, drop_accounts={"acct-0", "acct-1"}, timeout=0.1)
+    errors = {index: error for index, _, error in replies if error is not None}
+    assert set(errors) == {0, 1}
+    assert all(isinstance(error, TimeoutError) for error in errors.values())
+    assert len(replies) == 6
+
+
+def test_call_many_larger_than_in_flight_cap():
+    replies, peak, stats = run_burst(accounts=50, max_concurrency=8, max_in_flight=10)
+    assert len(replies) == 50
+    assert all(error is None for _, _, error in replies)
+    assert peak == 8
+    assert stats["rejected"] == 0
+    assert stats["in_flight"] == 0
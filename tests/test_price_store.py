@@ -0,0 +1,15 @@
+import numpy as np
+
+from src.utils.price_store import PriceStore
+
+
+def test_has_symbols(tmp_path):
+    assert not PriceStore(str(tmp_path / "missing")).has_symbols()
+    store = PriceStore(str(tmp_path))
+    assert not store.has_symbols()
+    # A directory without a manifest is a write in progress, not a symbol
+    (tmp_path / "AAPL").mkdir()
+    assert not store.has_symbols()
+    store.write("AAPL", np.array([86400, 172800]), {"close": np.array([1.0, 2.0])})
+    assert store.has_symbols()
+    assert store.symbols() == ["AAPL"]
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from src.utils import response_cache as response_cache_module
+from src.utils.response_cache import ResponseCache, embed_query, normalize_query
+
+BODY = [{"type": "text", "text": "1 BTC is about 18 ETH"}]
+
+
+def test_normalize_keeps_word_order_and_repeats():
+    assert normalize_query("  Convert 1 BTC to ETH? ") == "convert 1 btc to eth"
+    assert normalize_query("convert 1 ETH to BTC") != normalize_query("convert 1 BTC to ETH")
+    assert normalize_query("is it a buy, buy or sell") == "is it a buy buy or sell"
+
+
+@pytest.mark.parametrize("semantic", (False, True))
+def test_swapped_operands_miss(monkeypatch, semantic):
+    monkeypatch.setattr(response_cache_module, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache_module, "RESPONSE_CACHE_SEMANTIC", semantic)
+    cache = ResponseCache()
+    cache.put("convert 1 BTC to ETH", BODY, llm_calls=2)
+    assert cache.get("Convert 1 BTC to ETH!") is not None
+    assert cache.get("convert 1 ETH to BTC") is None
+    if semantic:
+        # Close enough for the embedding, only the word order tells them apart
+        similarity = float(embed_query(normalize_query("convert 1 BTC to ETH")) @ embed_query(normalize_query("convert 1 ETH to BTC")))
+        assert similarity >= response_cache_module.RESPONSE_CACHE_SIMILARITY
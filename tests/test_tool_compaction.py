@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.utils import json_codec
+from src.utils.price_store import PriceStore, summarize_history
+from src.utils.tokens import count_tokens
+from src.utils.tool_compaction import compact_tool_result, fit_tool_result
+
+
+@pytest.fixture
+def price_summaries(tmp_path):
+    store = PriceStore(str(tmp_path))
+    timestamps = 1_704_067_200 + np.arange(30, dtype=np.int64) * 86400
+    for symbol, base in (("BTC", 42_000.0), ("ETH", 2_300.0)):
+        store.write(symbol, timestamps, {"close": base + np.arange(30.0)})
+    return [summarize_history(store.history(symbol)) for symbol in ("BTC", "ETH")]
+
+
+def test_single_price_summary_is_not_projected(price_summaries):
+    result = {"prices": price_summaries[:1]}
+    assert compact_tool_result("get_price_history", result) == result
+    assert json_codec.loads(fit_tool_result("get_price_history", result)) == result
+
+
+def test_price_summaries_keep_every_field(price_summaries):
+    table = compact_tool_result("get_price_history", {"prices": price_summaries})["prices"]
+    rows = [dict(zip(table["columns"], row)) for row in table["rows"]]
+    assert rows == price_summaries
+
+
+def test_portfolio_records_are_projected_to_holding_fields():
+    result = {"stocks": [{"symbol": "AAPL", "quantity": "3", "holdingId": "h1", "exchangeCode": "X"}]}
+    assert compact_tool_result("portfolio_get_data", result) == {"stocks": [{"symbol": "AAPL", "quantity": 3}]}
+
+
+def test_only_identifiers_are_dropped_and_strings_stay_strings():
+    record = {"bid": 1.5, "paid": 3, "mid": 2, "valid": True, "accountNumber": "000123", "userId": "x", "price": "12.50"}
+    assert compact_tool_result("web_lookup", {"quote": record}) == {
+        "quote": {"bid": 1.5, "paid": 3, "mid": 2, "valid": True, "accountNumber": "000123", "price": 12.5}
+    }
+
+
+@pytest.mark.parametrize("name, result", (
+    ("web_lookup", {"symbols": [f"SYMBOL{i}" for i in range(2_000)], "source": "exchange list"}),
+    ("get_price_history", {"prices": [{"symbol": "BTC", "points": [[f"2024-{d // 28 + 1:02d}-{d % 28 + 1:02d}", 100.0 + d] for d in range(300)]}]}),
+    ("portfolio_get_data", {"stocks": [{"symbol": "AAPL", "name": "Apple " * 2_000, "currentValue": 1234.5678}]}),
+    ("web_lookup", "Apple reported revenue of 123.456789 billion. " * 1_000),
+))
+def test_over_budget_result_is_valid_json(name, result):
+    content = fit_tool_result(name, result, token_budget=200)
+    truncated = json.loads(content)
+    assert truncated["truncated"] is True
+    assert count_tokens(content) <= 200
+
+
+def test_truncation_drops_whole_items():
+    result = {"symbols": [f"SYMBOL{i}" for i in range(2_000)]}
+    truncated = json.loads(fit_tool_result("web_lookup", result, token_budget=200))
+    kept = truncated["symbols"]
+    assert kept == result["symbols"][:len(kept)]
+    assert truncated["rows_omitted"] == 2_000 - len(kept)